@@ -5,17 +5,28 @@ Provides REST API and WebSocket endpoints for Bluetooth management
 
 import argparse
 import asyncio
+import hashlib
+import json
 import logging
-from typing import Dict, List, Set
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
 from datetime import datetime
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response
 from pydantic import BaseModel
-import uvicorn
 
 from bluetooth_manager import BluetoothManager
+from metrics import REGISTRY, MetricsMiddleware, gauge, watch_event_loop_lag
+from profiling import TimingMiddleware, record, sample_stacks
+from reconnect import ReconnectSupervisor
+from state_sync import DeviceStateSync
+from static_assets import StaticAssets
+from timeseries import METRICS
+from warm_start import WarmStart
+from websocket_hub import WebSocketHub
 
 
 # Configure logging
@@ -35,14 +46,270 @@ class DeviceAction(BaseModel):
     mac: str
 
 
+class BulkAction(BaseModel):
+    action: str
+    macs: List[str]
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Application startup and shutdown"""
+    global state_sync, history, warm_start
+    
+    lag_watcher = asyncio.create_task(watch_event_loop_lag())
+    
+    # Serve the state saved before the restart until BlueZ has been re-read
+    restored = 0
+    if state_file:
+        warm_start = WarmStart(bt_manager, state_file)
+        restored = await asyncio.get_running_loop().run_in_executor(None, warm_start.load)
+    
+    state_sync = DeviceStateSync(bt_manager, hub)
+    if history_db:
+        # sqlite3 is only loaded when device history is enabled
+        from history import HistoryStore
+        try:
+            history = HistoryStore(history_db, bt_manager.devices)
+            await asyncio.get_running_loop().run_in_executor(None, history.start)
+            bt_manager.add_event_listener(history.on_event)
+        except Exception as e:
+            logger.warning(f"Device history disabled, could not open {history_db}: {e}")
+            history = None
+    
+    # Everything that waits on BlueZ happens after the port is open; until
+    # then requests read BlueZ (or the restored state) themselves
+    startup = asyncio.create_task(warm_up_backend(restored))
+    yield
+    # Background work still needs the executor: a running scan switches
+    # discovery off on its way out, so it has to end before the manager closes
+    if scan_job is not None and not scan_job.done():
+        bt_manager.stop_scan()
+        try:
+            await asyncio.wait_for(scan_job, timeout=10)
+        except Exception as e:
+            logger.warning(f"Scan did not stop cleanly: {e}")
+    startup.cancel()
+    lag_watcher.cancel()
+    await asyncio.gather(startup, lag_watcher, return_exceptions=True)
+    if reconnect_supervisor:
+        await reconnect_supervisor.stop()
+    state_sync.stop()
+    if warm_start:
+        await warm_start.stop()
+    if history:
+        bt_manager.remove_event_listener(history.on_event)
+        # Writes what is still buffered
+        await asyncio.get_running_loop().run_in_executor(None, history.close)
+    hub.close()
+    # Close the persistent bluetoothctl sessions / D-Bus connection
+    bt_manager.close()
+
+
 # Initialize FastAPI app
-app = FastAPI(title="Bluetooth Manager", version="1.0.0")
+app = FastAPI(title="Bluetooth Manager", version="1.0.0", lifespan=lifespan)
+app.add_middleware(MetricsMiddleware, routes=lambda: app.routes)
+app.add_middleware(TimingMiddleware, server_timing=lambda: diagnostics,
+                   slow_request_ms=lambda: slow_request_ms)
+
+
+def create_bluetooth_manager(backend: str = "bluetoothctl", cache_max_age: float = 30.0,
+                             max_parallel: int = 4) -> BluetoothManager:
+    """Create the Bluetooth manager for the configured backend"""
+    if backend == "dbus":
+        from bluez_dbus import DBusBluetoothManager
+        return DBusBluetoothManager(cache_max_age=cache_max_age, max_parallel=max_parallel)
+    return BluetoothManager(cache_max_age=cache_max_age, max_parallel=max_parallel)
+
 
 # Initialize Bluetooth Manager
 bt_manager = BluetoothManager()
 
-# Store active WebSocket connections
-active_connections: Set[WebSocket] = set()
+# Connected WebSocket clients and the broadcast fan-out
+hub = WebSocketHub()
+
+# Device list snapshot/delta publisher, created at startup
+state_sync: Optional[DeviceStateSync] = None
+
+# The running scan, started by POST /api/scan/start
+scan_job: Optional[asyncio.Task] = None
+
+# Reconnects trusted devices that drop; created at startup if enabled
+auto_reconnect = False
+reconnect_supervisor: Optional[ReconnectSupervisor] = None
+
+# Server-Timing headers and the profiler endpoint (diagnostics option, or
+# log_level debug), and the slow-request log threshold (0: off)
+diagnostics = False
+slow_request_ms = 0.0
+profile_lock = asyncio.Lock()
+
+# Device sightings and connection history; opened at startup if a database
+# path is configured
+history_db = ""
+history: Optional["HistoryStore"] = None
+
+# Device and adapter state saved across restarts; used if a file is configured
+state_file = ""
+warm_start: Optional[WarmStart] = None
+
+# Set once warm_up_backend has loaded the devices and started the services
+backend_ready = False
+
+
+def collect_state_metrics() -> List[str]:
+    """Scrape-time gauges from the components' own counters"""
+    lines = []
+    ws = hub.stats()
+    lines += gauge('websocket_clients', 'Connected WebSocket clients', ws['clients'])
+    lines += gauge('websocket_queued_messages', 'Messages waiting in WebSocket client queues', ws['queued'])
+    lines += gauge('websocket_messages_total', 'WebSocket messages by outcome',
+                   {(outcome,): ws[outcome] for outcome in ('sent', 'dropped', 'coalesced')},
+                   ('outcome',), 'counter')
+    lines += gauge('websocket_broadcasts_total', 'Messages broadcast to all clients', ws['broadcasts'], kind='counter')
+    
+    lines += gauge('bluetooth_cache_lookups_total', 'State cache lookups by result',
+                   {('hit',): bt_manager.cache_stats['hits'], ('miss',): bt_manager.cache_stats['misses']},
+                   ('result',), 'counter')
+    lines += gauge('bluetooth_cache_invalidations_total', 'State cache invalidations',
+                   bt_manager.cache_stats['invalidations'], kind='counter')
+    lines += gauge('bluetooth_devices_known', 'Devices in the device registry', len(bt_manager.devices))
+    lines += gauge('bluetooth_device_evictions_total', 'Devices evicted from the full device registry',
+                   bt_manager.devices.evictions, kind='counter')
+    
+    if bt_manager.pool is not None:
+        pool = bt_manager.pool.stats()
+        lines += gauge('bluetoothctl_sessions', 'bluetoothctl sessions by state',
+                       {('configured',): pool['size'], ('alive',): pool['alive']}, ('state',))
+        lines += gauge('bluetoothctl_processes_spawned_total', 'bluetoothctl processes started',
+                       pool['spawned'], kind='counter')
+    
+    operations = bt_manager.scheduler.stats()
+    lines += gauge('bluetooth_operations', 'Device operations by state',
+                   {('running',): operations['running'], ('queued',): operations['queued']}, ('state',))
+    lines += gauge('bluetooth_operations_total', 'Finished device operations by result',
+                   {('completed',): operations['completed'], ('failed',): operations['failed'],
+                    ('coalesced',): operations['coalesced']}, ('result',), 'counter')
+    lines += gauge('bluetooth_operation_wait_max_seconds', 'Longest an operation waited for its turn',
+                   operations['wait_max_ms'] / 1000)
+    
+    if reconnect_supervisor:
+        reconnect = reconnect_supervisor.stats()
+        lines += gauge('bluetooth_reconnect_watching', 'Trusted devices waiting to be reconnected',
+                       reconnect['watching'])
+        lines += gauge('bluetooth_reconnect_attempts_total', 'Automatic reconnect attempts by result',
+                       {('success',): reconnect['attempts'] - reconnect['failures'],
+                        ('failure',): reconnect['failures']}, ('result',), 'counter')
+        lines += gauge('bluetooth_reconnect_seconds_avg', 'Average time from a drop to the reconnect',
+                       reconnect['time_to_reconnect_avg_s'])
+        lines += gauge('bluetooth_reconnect_seconds_max', 'Longest time from a drop to the reconnect',
+                       reconnect['time_to_reconnect_max_s'])
+    
+    series = bt_manager.series.stats()
+    lines += gauge('device_series_samples', 'RSSI and battery samples held in memory', series['samples'])
+    lines += gauge('device_series_bytes', 'Memory used by RSSI and battery samples', series['bytes'])
+    
+    if history:
+        writes = history.stats()
+        lines += gauge('device_history_pending_rows', 'Device history rows waiting for the next batch',
+                       writes['pending'])
+        lines += gauge('device_history_rows_written_total', 'Device history rows written',
+                       writes['written'], kind='counter')
+        lines += gauge('device_history_flush_seconds', 'Time the last device history batch took to commit',
+                       writes['last_flush_ms'] / 1000)
+    return lines
+
+
+REGISTRY.add_collector(collect_state_metrics)
+
+
+def pause_reconnect(macs: List[str]) -> None:
+    """Keep the supervisor from undoing a disconnect/remove the user asked for"""
+    if reconnect_supervisor:
+        for mac in macs:
+            reconnect_supervisor.pause(mac)
+
+
+def resume_reconnect(macs: List[str]) -> None:
+    """The user's disconnect/remove failed, so supervise the devices again"""
+    if reconnect_supervisor:
+        for mac in macs:
+            reconnect_supervisor.resume(mac)
+
+
+# Per-process prefix for version ETags, so versions from before a restart
+# never match
+ETAG_EPOCH = os.urandom(4).hex()
+
+# Encoded device list of the last version served: (etag, body)
+device_list_body: Optional[tuple] = None
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Check whether the client's If-None-Match covers an ETag"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def version_tag(version: int) -> str:
+    """A device registry version qualified with ETAG_EPOCH, as clients see it"""
+    return f"{ETAG_EPOCH}.{version}"
+
+
+def parse_version_tag(tag: str) -> Optional[int]:
+    """
+    The registry version in a version_tag (or the ETag quoting one)
+    
+    Returns:
+        The version, or None if the tag is malformed or from another process
+    """
+    epoch, _, number = tag.strip().removeprefix("W/").strip('"').partition(".")
+    if epoch != ETAG_EPOCH or not number.isdigit():
+        return None
+    return int(number)
+
+
+def encode_json(payload) -> bytes:
+    """Compact JSON encoding, timed as the request's serialize phase"""
+    started = time.perf_counter()
+    body = json.dumps(payload, separators=(",", ":")).encode()
+    record("serialize", time.perf_counter() - started)
+    return body
+
+
+def conditional_response(request: Request, etag: str, body: Optional[bytes] = None,
+                         payload: Optional[Dict] = None) -> Response:
+    """
+    Answer a GET with 304 Not Modified if the client already has this
+    version, else with the JSON body
+    
+    Args:
+        request: The incoming request
+        etag: Quoted ETag of the current representation
+        body: Encoded JSON body
+        payload: Object to encode when no body is given
+    
+    Returns:
+        The response, carrying the ETag either way
+    """
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    if body is None:
+        body = encode_json(payload)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def content_response(request: Request, payload: Dict) -> Response:
+    """JSON response with an ETag derived from its content"""
+    body = encode_json(payload)
+    etag = f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+    return conditional_response(request, etag, body)
 
 
 # API Endpoints
@@ -50,37 +317,111 @@ active_connections: Set[WebSocket] = set()
 @app.get("/api/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "ok", "timestamp": datetime.now().isoformat()}
+    return {"status": "ok", "ready": backend_ready, "timestamp": datetime.now().isoformat()}
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Metrics in the Prometheus text format"""
+    return Response(content=REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/admin/profile")
+async def profile(seconds: float = 10.0, interval_ms: float = 10.0):
+    """
+    Sample the stacks of every thread for a while
+    
+    Returns collapsed stacks, one 'thread;outer;...;inner count' line per
+    distinct stack, ready for flamegraph.pl or speedscope. Only available
+    with diagnostics enabled, and one profile at a time.
+    """
+    if not diagnostics:
+        raise HTTPException(status_code=404, detail="Enable the diagnostics option to use the profiler")
+    if profile_lock.locked():
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    seconds = min(max(seconds, 0.1), 60.0)
+    interval = min(max(interval_ms, 1.0), 1000.0) / 1000
+    async with profile_lock:
+        # On the default executor, so it does not hold a Bluetooth worker
+        stacks = await asyncio.get_running_loop().run_in_executor(None, sample_stacks, seconds, interval)
+    return PlainTextResponse(stacks)
+
+
+@app.get("/api/operations")
+async def get_operation_stats():
+    """Device operation queue depth, running operations and wait times"""
+    return bt_manager.scheduler.stats()
+
+
+@app.get("/api/reconnect")
+async def get_reconnect_stats():
+    """Auto-reconnect attempts, time-to-reconnect and watched devices"""
+    if not reconnect_supervisor:
+        return {"enabled": False}
+    return {"enabled": True, **reconnect_supervisor.stats()}
+
+
+def history_times(row: Dict) -> Dict:
+    """Unix timestamps in a history row as ISO 8601 strings"""
+    for key in ("first_seen", "last_seen", "last_connected", "at"):
+        if row.get(key):
+            row[key] = datetime.fromtimestamp(row[key]).isoformat()
+    if row.get("paired") is not None:
+        row["paired"] = bool(row["paired"])
+    return row
+
+
+@app.get("/api/history/devices")
+async def get_device_history(seconds: int = 3600, limit: int = 500):
+    """Devices seen in the last `seconds`, most recently seen first"""
+    if not history:
+        raise HTTPException(status_code=404, detail="Device history is disabled")
+    devices = await history.seen_since_async(time.time() - seconds, min(max(limit, 1), 5000))
+    return {"devices": [history_times(device) for device in devices], "count": len(devices)}
+
+
+@app.get("/api/history/devices/{mac}")
+async def get_device_connection_history(mac: str, limit: int = 100):
+    """When a device was first and last seen, and its connects and disconnects"""
+    if not history:
+        raise HTTPException(status_code=404, detail="Device history is disabled")
+    mac = mac.upper().replace('-', ':')
+    device = await history.device_history_async(mac, min(max(limit, 1), 5000))
+    if device is None:
+        raise HTTPException(status_code=404, detail=f"No history for {mac}")
+    device["connections"] = [history_times(change) for change in device["connections"]]
+    return history_times(device)
 
 
 @app.get("/api/adapters")
-async def list_adapters():
+async def list_adapters(request: Request):
     """Get list of Bluetooth adapters"""
     try:
-        adapters = bt_manager.list_adapters()
-        return {"adapters": adapters}
+        adapters = await bt_manager.list_adapters_async()
+        return content_response(request, {"adapters": adapters})
     except Exception as e:
         logger.error(f"Error listing adapters: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/api/adapters/{adapter_id}/info")
-async def get_adapter_info(adapter_id: str):
-    """Get detailed information about an adapter"""
+# Registered before /api/adapters/{adapter_id}/info, which would match "default"
+@app.get("/api/adapters/default/info")
+async def get_default_adapter_info(request: Request):
+    """Get information about the default adapter"""
     try:
-        info = bt_manager.get_adapter_info(adapter_id)
-        return info
+        info = await bt_manager.get_adapter_info_async()
+        return content_response(request, info)
     except Exception as e:
         logger.error(f"Error getting adapter info: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/api/adapters/default/info")
-async def get_default_adapter_info():
-    """Get information about the default adapter"""
+@app.get("/api/adapters/{adapter_id}/info")
+async def get_adapter_info(adapter_id: str, request: Request):
+    """Get detailed information about an adapter"""
     try:
-        info = bt_manager.get_adapter_info()
-        return info
+        info = await bt_manager.get_adapter_info_async(adapter_id)
+        return content_response(request, info)
     except Exception as e:
         logger.error(f"Error getting adapter info: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -90,7 +431,8 @@ async def get_default_adapter_info():
 async def set_adapter_power(request: PowerRequest):
     """Power on/off the Bluetooth adapter"""
     try:
-        success, message = bt_manager.set_adapter_power(request.power_on)
+        success, message = await bt_manager.set_adapter_power_async(request.power_on)
+        await publish_device_state()
         if success:
             return {"success": True, "message": message}
         else:
@@ -103,11 +445,12 @@ async def set_adapter_power(request: PowerRequest):
 @app.post("/api/scan/start")
 async def start_scan():
     """Start Bluetooth scanning"""
+    global scan_job
     if bt_manager.scanning:
         return {"success": True, "message": "Scan already running"}
     
     # Start scan in background
-    asyncio.create_task(scan_task())
+    scan_job = asyncio.create_task(scan_task())
     return {"success": True, "message": "Scan started"}
 
 
@@ -129,19 +472,51 @@ async def get_scan_status():
 
 
 @app.get("/api/devices")
-async def list_devices():
-    """Get list of all known devices"""
+async def list_devices(request: Request, since: Optional[str] = None):
+    """
+    Get list of all known devices
+    
+    The ETag carries the device registry version; with ?since=<version> only
+    the devices that changed after that version are returned. Versions are
+    qualified with ETAG_EPOCH, so one from before a restart gets the full list.
+    """
+    global device_list_body
     try:
-        devices = bt_manager.get_devices()
+        registry = bt_manager.devices
+        # BlueZ events keep the registry current, so a client holding its
+        # version is answered without reading a snapshot
+        etag = f'"{version_tag(registry.version)}"'
+        if etag_matches(request, etag):
+            return conditional_response(request, etag)
         
-        # Enrich with current status
-        for device in devices:
-            info = bt_manager.get_device_info(device['mac'])
-            device['connected'] = info.get('connected', False)
-            device['paired'] = info.get('paired', False)
-            device['rssi'] = info.get('rssi')
+        # One batched snapshot instead of an info lookup per device; served
+        # from the registry without Bluetooth I/O while the cache is fresh
+        records = await bt_manager.get_device_records_async()
+        version = registry.version
+        etag = f'"{version_tag(version)}"'
+        
+        since_version = parse_version_tag(since) if since is not None else None
+        if since_version is not None and registry.horizon <= since_version <= version:
+            return conditional_response(request, etag, payload={
+                "version": version_tag(version),
+                "full": False,
+                "devices": [record.to_summary() for record in records
+                            if registry.changed_at(record.mac) > since_version],
+                "removed": registry.removed_since(since_version)
+            })
+        
+        if since is not None:
+            # Unknown, too old or pre-restart version: the client gets everything
+            return conditional_response(request, etag, payload={
+                "version": version_tag(version),
+                "full": True,
+                "devices": [record.to_summary() for record in records]
+            })
         
-        return {"devices": devices}
+        if device_list_body is None or device_list_body[0] != etag:
+            payload = {"version": version_tag(version), "devices": [record.to_summary() for record in records]}
+            device_list_body = (etag, encode_json(payload))
+        return conditional_response(request, etag, device_list_body[1])
     except Exception as e:
         logger.error(f"Error listing devices: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -153,7 +528,7 @@ async def get_device_info(mac: str):
     try:
         # Normalize MAC address format
         mac = mac.upper().replace('-', ':')
-        info = bt_manager.get_device_info(mac)
+        info = await bt_manager.get_device_info_async(mac)
         
         if 'error' in info:
             raise HTTPException(status_code=404, detail=info['error'])
@@ -166,12 +541,45 @@ async def get_device_info(mac: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/devices/{mac}/series")
+async def get_device_series(mac: str, metric: str = "rssi", seconds: int = 3600, window: int = 60):
+    """
+    RSSI or battery history of a device, as min/max/avg per window
+    
+    Windows without samples are left out; the series only covers what the
+    add-on saw since it started (at most the last 1024 RSSI and 256 battery
+    samples per device).
+    """
+    mac = mac.upper().replace('-', ':')
+    if metric not in METRICS:
+        raise HTTPException(status_code=400, detail=f"Unknown metric: {metric} (use {', '.join(METRICS)})")
+    seconds = min(max(seconds, 1), 7 * 86400)
+    window = min(max(window, 1), seconds)
+    until = time.time()
+    # Aligned to the window so repeated queries put samples in the same windows
+    since = (until - seconds) // window * window
+    windows = bt_manager.series.downsample(mac, metric, since, until, window)
+    if windows is None:
+        raise HTTPException(status_code=404, detail=f"No {metric} samples for {mac}")
+    return {
+        "mac": mac,
+        "metric": metric,
+        "window": window,
+        "points": [
+            {"at": datetime.fromtimestamp(start).isoformat(), "min": low, "max": high,
+             "avg": round(average, 1), "count": count}
+            for start, low, high, average, count in windows
+        ]
+    }
+
+
 @app.post("/api/devices/{mac}/pair")
 async def pair_device(mac: str):
     """Pair with a device"""
     try:
         mac = mac.upper().replace('-', ':')
-        success, message = bt_manager.pair_device(mac)
+        success, message = await bt_manager.pair_device_async(mac)
+        await publish_device_state(mac)
         
         if success:
             # Notify all WebSocket clients
@@ -190,12 +598,119 @@ async def pair_device(mac: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/devices/bulk")
+async def bulk_device_action(request: BulkAction):
+    """
+    Run one action (connect, disconnect, remove, ...) on many devices
+    
+    Devices are processed in parallel up to the scheduler's limit. Each
+    device's result is broadcast as a bulk_result message when it finishes,
+    and the response summarizes them all.
+    """
+    if request.action not in bt_manager.BULK_ACTIONS:
+        raise HTTPException(status_code=400,
+                            detail=f"Unknown action '{request.action}', expected one of: {', '.join(bt_manager.BULK_ACTIONS)}")
+    
+    # Normalize and drop duplicates, keeping the given order
+    macs = list(dict.fromkeys(mac.upper().replace('-', ':') for mac in request.macs))
+    if not macs:
+        raise HTTPException(status_code=400, detail="No devices given")
+    
+    bulk_id = os.urandom(4).hex()
+    started = time.monotonic()
+    finished = 0
+    
+    def on_result(result: Dict) -> None:
+        nonlocal finished
+        finished += 1
+        hub.broadcast({
+            "type": "bulk_result",
+            "id": bulk_id,
+            "action": request.action,
+            "done": finished,
+            "total": len(macs),
+            **result
+        })
+    
+    user_disconnect = request.action in ("disconnect", "remove")
+    if user_disconnect:
+        pause_reconnect(macs)
+    try:
+        results = await bt_manager.bulk_device_action_async(request.action, macs, on_result)
+    except Exception as e:
+        logger.error(f"Error running bulk {request.action}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    if user_disconnect:
+        resume_reconnect([result['mac'] for result in results if not result['success']])
+    
+    # One device list comparison for the whole batch rather than a
+    # re-read per device
+    await publish_device_state()
+    
+    succeeded = sum(1 for result in results if result['success'])
+    return {
+        "id": bulk_id,
+        "action": request.action,
+        "total": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "duration_ms": round((time.monotonic() - started) * 1000),
+        "results": results
+    }
+
+
+@app.post("/api/devices/{mac}/setup")
+async def setup_device(mac: str):
+    """
+    Pair, trust and connect a device in one request
+    
+    Each step is reported to the WebSocket clients as a setup_progress
+    message, and the response carries the device's final state.
+    """
+    try:
+        mac = mac.upper().replace('-', ':')
+        loop = asyncio.get_running_loop()
+        
+        def on_progress(step: str, status: str, message: str) -> None:
+            # Called from the worker thread running the steps
+            loop.call_soon_threadsafe(hub.broadcast, {
+                "type": "setup_progress",
+                "mac": mac,
+                "step": step,
+                "status": status,
+                "message": message
+            })
+        
+        success, steps = await bt_manager.setup_device_async(mac, on_progress)
+        await publish_device_state(mac)
+        
+        if not success:
+            failed = steps[-1]
+            raise HTTPException(status_code=400, detail=f"{failed['step'].capitalize()} failed: {failed['message']}")
+        
+        # publish_device_state just re-read the device, so this is cached
+        info = await bt_manager.get_device_info_async(mac)
+        await broadcast_message({
+            "type": "device_connected",
+            "mac": mac,
+            "name": info.get('name', mac),
+            "message": steps[-1]['message']
+        })
+        return {"success": True, "message": "Device paired and connected", "steps": steps, "device": info}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error setting up device: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.post("/api/devices/{mac}/trust")
 async def trust_device(mac: str):
     """Trust a device"""
     try:
         mac = mac.upper().replace('-', ':')
-        success, message = bt_manager.trust_device(mac)
+        success, message = await bt_manager.trust_device_async(mac)
+        await publish_device_state(mac)
         
         if success:
             return {"success": True, "message": message}
@@ -213,7 +728,8 @@ async def untrust_device(mac: str):
     """Untrust a device"""
     try:
         mac = mac.upper().replace('-', ':')
-        success, message = bt_manager.untrust_device(mac)
+        success, message = await bt_manager.untrust_device_async(mac)
+        await publish_device_state(mac)
         
         if success:
             return {"success": True, "message": message}
@@ -231,11 +747,12 @@ async def connect_device(mac: str):
     """Connect to a device"""
     try:
         mac = mac.upper().replace('-', ':')
-        success, message = bt_manager.connect_device(mac)
+        success, message = await bt_manager.connect_device_async(mac)
+        await publish_device_state(mac)
         
         if success:
             # Get device name
-            info = bt_manager.get_device_info(mac)
+            info = await bt_manager.get_device_info_async(mac)
             device_name = info.get('name', mac)
             
             # Notify all WebSocket clients
@@ -260,7 +777,9 @@ async def disconnect_device(mac: str):
     """Disconnect from a device"""
     try:
         mac = mac.upper().replace('-', ':')
-        success, message = bt_manager.disconnect_device(mac)
+        pause_reconnect([mac])
+        success, message = await bt_manager.disconnect_device_async(mac)
+        await publish_device_state(mac)
         
         if success:
             # Notify all WebSocket clients
@@ -271,6 +790,7 @@ async def disconnect_device(mac: str):
             })
             return {"success": True, "message": message}
         else:
+            resume_reconnect([mac])
             raise HTTPException(status_code=400, detail=message)
     except HTTPException:
         raise
@@ -284,7 +804,9 @@ async def remove_device(mac: str):
     """Remove a device"""
     try:
         mac = mac.upper().replace('-', ':')
-        success, message = bt_manager.remove_device(mac)
+        pause_reconnect([mac])
+        success, message = await bt_manager.remove_device_async(mac)
+        await publish_device_state(mac)
         
         if success:
             # Notify all WebSocket clients
@@ -295,6 +817,7 @@ async def remove_device(mac: str):
             })
             return {"success": True, "message": message}
         else:
+            resume_reconnect([mac])
             raise HTTPException(status_code=400, detail=message)
     except HTTPException:
         raise
@@ -308,7 +831,9 @@ async def remove_device(mac: str):
 async def websocket_scan(websocket: WebSocket):
     """WebSocket endpoint for real-time scan updates"""
     await websocket.accept()
-    active_connections.add(websocket)
+    client = hub.connect(websocket)
+    if state_sync:
+        state_sync.send_snapshot(client)
     
     logger.info("WebSocket client connected")
     
@@ -319,14 +844,17 @@ async def websocket_scan(websocket: WebSocket):
             
             # Handle client messages if needed
             if data == "ping":
-                await websocket.send_json({"type": "pong"})
+                hub.send(client, {"type": "pong"})
+            elif data == "sync" and state_sync:
+                # The client missed a delta and needs the full state again
+                state_sync.send_snapshot(client)
     
     except WebSocketDisconnect:
         logger.info("WebSocket client disconnected")
-        active_connections.discard(websocket)
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
-        active_connections.discard(websocket)
+    finally:
+        hub.disconnect(client)
 
 
 # Background tasks
@@ -339,30 +867,100 @@ async def scan_task():
     await bt_manager.start_scan_async(scan_callback)
 
 
-async def broadcast_message(message: Dict):
-    """Broadcast message to all connected WebSocket clients"""
-    disconnected = set()
+async def publish_device_state(mac: Optional[str] = None):
+    """
+    Push the state an operation left a device (or, for adapter operations,
+    every device) in to the WebSocket clients
+    """
+    if not state_sync:
+        return
+    try:
+        if mac:
+            await state_sync.refresh_device(mac)
+        else:
+            await state_sync.reconcile()
+    except Exception as e:
+        logger.warning(f"Could not publish device state: {e}")
+
+
+async def warm_up_backend(restored: int):
+    """
+    Subscribe to BlueZ events, load the device list and start the background
+    services, once the server is listening
+    """
+    global reconnect_supervisor, backend_ready
+    started = time.perf_counter()
+    loop = asyncio.get_running_loop()
     
-    for connection in active_connections:
-        try:
-            await connection.send_json(message)
-        except Exception as e:
-            logger.error(f"Error broadcasting to client: {e}")
-            disconnected.add(connection)
+    # Subscribe to BlueZ change events up front so device operations can
+    # finish as soon as the new state is reported
+    try:
+        await loop.run_in_executor(bt_manager.executor, bt_manager.start_events)
+    except Exception as e:
+        logger.warning(f"Could not subscribe to Bluetooth events: {e}")
     
-    # Remove disconnected clients
-    for connection in disconnected:
-        active_connections.discard(connection)
+    await state_sync.start()
+    if warm_start:
+        warm_start.start()
+    if auto_reconnect:
+        reconnect_supervisor = ReconnectSupervisor(bt_manager)
+        reconnect_supervisor.start()
+    
+    try:
+        await loop.run_in_executor(bt_manager.executor, bt_manager.warm_up)
+    except Exception as e:
+        logger.warning(f"Could not open Bluetooth sessions ahead of time: {e}")
+    if restored:
+        await reconcile_restored_state()
+    
+    backend_ready = True
+    logger.info(f"Backend ready {time.perf_counter() - started:.1f}s after the server started listening")
 
 
-# Serve static files (frontend)
-app.mount("/static", StaticFiles(directory="/app/web"), name="static")
+async def reconcile_restored_state():
+    """
+    Replace the state restored at startup with a fresh read from BlueZ, and
+    push whatever changed while the add-on was down to the WebSocket clients
+    """
+    started = time.perf_counter()
+    try:
+        await bt_manager.list_adapters_async(refresh=True)
+        await bt_manager.get_adapter_info_async(refresh=True)
+        await bt_manager.get_device_records_async(refresh=True)
+    except Exception as e:
+        logger.warning(f"Could not reconcile the restored state with BlueZ: {e}")
+        return
+    await publish_device_state()
+    logger.info(f"Reconciled the restored state with BlueZ in {time.perf_counter() - started:.1f}s")
+
+
+async def broadcast_message(message: Dict):
+    """
+    Broadcast message to all connected WebSocket clients
+    
+    Only queues the message; each client's sender task delivers it, so a
+    slow client cannot hold up the caller or the other clients.
+    """
+    hub.broadcast(message)
+
+
+# Serve static files (frontend); installed to /app/web in the image
+WEB_DIR = os.environ.get("WEB_DIR", "/app/web")
+static_assets = StaticAssets(WEB_DIR)
+
+
+@app.api_route("/static/{path:path}", methods=["GET", "HEAD"])
+async def serve_static(path: str, request: Request):
+    """Serve a frontend asset, preferably under its content-hashed name"""
+    return static_assets.asset_response(request, path)
 
 
 @app.get("/")
-async def serve_frontend():
-    """Serve the frontend HTML"""
-    return FileResponse("/app/web/index.html")
+async def serve_frontend(request: Request):
+    """Serve the frontend HTML, revalidated with an ETag"""
+    if etag_matches(request, static_assets.index_etag):
+        return Response(status_code=304, headers={"ETag": static_assets.index_etag, "Cache-Control": "no-cache"})
+    return static_assets.index_response(request)
 
 
 # Main entry point
@@ -372,6 +970,23 @@ if __name__ == "__main__":
     parser.add_argument("--log-level", type=str, default="info", 
                        choices=["debug", "info", "warning", "error"],
                        help="Logging level")
+    parser.add_argument("--backend", type=str, default="bluetoothctl",
+                       choices=["bluetoothctl", "dbus"],
+                       help="How to talk to BlueZ")
+    parser.add_argument("--cache-max-age", type=float, default=30.0,
+                       help="Seconds cached Bluetooth state may be served before re-reading it (0 disables)")
+    parser.add_argument("--max-parallel", type=int, default=4,
+                       help="Devices that can be operated on at the same time")
+    parser.add_argument("--auto-reconnect", type=str, default="false", choices=["true", "false"],
+                       help="Reconnect trusted devices that drop")
+    parser.add_argument("--diagnostics", type=str, default="false", choices=["true", "false"],
+                       help="Add Server-Timing headers and enable the profiler endpoint")
+    parser.add_argument("--slow-request-ms", type=float, default=0,
+                       help="Log requests slower than this with a per-phase breakdown (0 disables)")
+    parser.add_argument("--history-db", type=str, default="",
+                       help="SQLite database for device history (empty disables)")
+    parser.add_argument("--state-file", type=str, default="",
+                       help="File the device state is saved to and restored from on restart (empty disables)")
     
     args = parser.parse_args()
     
@@ -379,8 +994,16 @@ if __name__ == "__main__":
     log_level = getattr(logging, args.log_level.upper())
     logging.getLogger().setLevel(log_level)
     
-    logger.info(f"Starting Bluetooth Manager on port {args.port}")
+    bt_manager = create_bluetooth_manager(args.backend, args.cache_max_age, args.max_parallel)
+    auto_reconnect = args.auto_reconnect == "true"
+    diagnostics = args.diagnostics == "true" or args.log_level == "debug"
+    slow_request_ms = args.slow_request_ms
+    history_db = args.history_db
+    state_file = args.state_file
+    
+    logger.info(f"Starting Bluetooth Manager on port {args.port} ({args.backend} backend)")
     
+    import uvicorn
     uvicorn.run(
         app,
         host="0.0.0.0",
@@ -3,45 +3,189 @@ Bluetooth Manager Module
 Handles all Bluetooth operations via bluetoothctl commands
 """
 
-import subprocess
-import re
 import asyncio
+import contextvars
+import threading
 import time
-from typing import Dict, List, Optional, Tuple, Callable
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple, Callable
 from datetime import datetime
 
+from bluetoothctl_session import BluetoothctlPool
+from metrics import OPERATION_ERRORS, SCAN_DISCOVERED, SNAPSHOT_DEVICES, SNAPSHOT_SECONDS
+from models import AdapterRecord, DeviceRecord, DeviceRegistry
+from parsers import (
+    parse_adapter_info, parse_controllers, parse_device_info,
+    parse_device_info_blocks, parse_devices, parse_event
+)
+from profiling import record
+from scheduler import BACKGROUND, INTERACTIVE, DeviceScheduler
+from timeseries import DeviceSeries
 
-class BluetoothManager:
+
+# Message for a device BlueZ does not know; the only error that means the
+# device is gone rather than that reading it failed
+DEVICE_NOT_AVAILABLE = "Device not available. Make sure it's powered on."
+
+# Substrings identifying a bluetoothctl/BlueZ error, the category it is
+# counted under, and the message shown to users
+ERROR_CATEGORIES = (
+    (("page timeout", "page-timeout"), 'page_timeout',
+     "Device not found or not responding. Make sure the device is in pairing mode and nearby."),
+    (("already exists", "already paired"), 'already_paired', "Device is already paired."),
+    (("not ready",), 'not_ready', "Bluetooth adapter not ready. Try powering it off and on again."),
+    (("not available", "error.doesnotexist"), 'not_available', DEVICE_NOT_AVAILABLE),
+    (("connection refused",), 'connection_refused', "Connection refused by device."),
+    (("authentication failed",), 'authentication_failed',
+     "Authentication failed. Try removing and re-pairing the device."),
+)
+
+
+class BluetoothBackend(ABC):
+    """
+    Primitive Bluetooth operations a backend must provide
+    
+    Everything above these primitives (scanning, the REST API) is shared, so
+    a backend only has to know how to talk to BlueZ.
+    """
+    
+    @abstractmethod
+    def list_adapters(self) -> List[Dict]:
+        """List adapters as dicts with 'id', 'name', 'mac', 'default' keys"""
+    
+    @abstractmethod
+    def get_adapter_info(self, adapter_id: Optional[str] = None) -> Dict:
+        """Get adapter details ('name', 'alias', 'powered', ...)"""
+    
+    @abstractmethod
+    def set_adapter_power(self, power_on: bool) -> Tuple[bool, str]:
+        """Power the default adapter on or off"""
+    
+    @abstractmethod
+    def start_discovery(self) -> Tuple[bool, str]:
+        """Start device discovery on the default adapter"""
+    
+    @abstractmethod
+    def stop_discovery(self) -> Tuple[bool, str]:
+        """Stop device discovery on the default adapter"""
+    
+    @abstractmethod
+    def get_devices(self) -> List[Dict]:
+        """List known devices as dicts with 'mac' and 'name' keys"""
+    
+    @abstractmethod
+    def get_device_info(self, mac_address: str) -> Dict:
+        """Get device details, or a dict with an 'error' key"""
+    
+    @abstractmethod
+    def get_device_snapshot(self) -> List[Dict]:
+        """Get get_device_info dicts for all known devices in one round trip"""
+    
+    @abstractmethod
+    def pair_device(self, mac_address: str) -> Tuple[bool, str]:
+        """Pair with a device"""
+    
+    @abstractmethod
+    def trust_device(self, mac_address: str) -> Tuple[bool, str]:
+        """Trust a device"""
+    
+    @abstractmethod
+    def untrust_device(self, mac_address: str) -> Tuple[bool, str]:
+        """Untrust a device"""
+    
+    @abstractmethod
+    def connect_device(self, mac_address: str) -> Tuple[bool, str]:
+        """Connect to a device"""
+    
+    @abstractmethod
+    def disconnect_device(self, mac_address: str) -> Tuple[bool, str]:
+        """Disconnect from a device"""
+    
+    @abstractmethod
+    def remove_device(self, mac_address: str) -> Tuple[bool, str]:
+        """Remove (unpair) a device"""
+    
+    @abstractmethod
+    def start_events(self) -> None:
+        """Start delivering BlueZ change events to the event listeners"""
+    
+    def warm_up(self) -> None:
+        """Open connections to BlueZ ahead of the first requests (optional)"""
+    
+    @abstractmethod
+    def close(self) -> None:
+        """Release backend resources"""
+
+
+class BluetoothManager(BluetoothBackend):
     """Manages Bluetooth operations using bluetoothctl"""
     
-    # Regex patterns for parsing bluetoothctl output
-    DEVICE_NEW_PATTERN = re.compile(r'\[NEW\] Device ([0-9A-F:]{17}) (.+)')
-    DEVICE_CHG_PATTERN = re.compile(r'\[CHG\] Device ([0-9A-F:]{17})')
-    RSSI_PATTERN = re.compile(r'RSSI: (0x[0-9a-f]+) \((-?\d+)\)')
-    
-    # Device info patterns
-    INFO_PATTERNS = {
-        'name': re.compile(r'Name: (.+)'),
-        'alias': re.compile(r'Alias: (.+)'),
-        'paired': re.compile(r'Paired: (yes|no)'),
-        'bonded': re.compile(r'Bonded: (yes|no)'),
-        'trusted': re.compile(r'Trusted: (yes|no)'),
-        'blocked': re.compile(r'Blocked: (yes|no)'),
-        'connected': re.compile(r'Connected: (yes|no)'),
-        'battery': re.compile(r'Battery Percentage: 0x[0-9a-f]+ \((\d+)\)'),
-        'rssi': re.compile(r'RSSI: 0x[0-9a-f]+ \((-?\d+)\)'),
-        'class': re.compile(r'Class: (0x[0-9a-f]+)'),
-        'icon': re.compile(r'Icon: (.+)'),
-    }
-    
-    def __init__(self):
+    # Ceiling for waiting on BlueZ to report the state an operation produced
+    STATE_WAIT_TIMEOUT = 5.0
+    
+    # Operations bulk_device_action_async can run, by their *_device_async name
+    BULK_ACTIONS = ('pair', 'trust', 'untrust', 'connect', 'disconnect', 'remove', 'setup')
+    
+    def __init__(self, sessions: Optional[int] = None, binary: str = 'bluetoothctl', workers: int = 8,
+                 max_devices: int = 1024, cache_max_age: float = 30.0, max_parallel: int = 4):
+        """
+        Args:
+            sessions: Number of persistent bluetoothctl sessions to keep open
+                (default: one per parallel operation plus one for reads)
+            binary: bluetoothctl executable
+            workers: Threads available to the *_async methods
+            max_devices: Most devices to keep records for before evicting the
+                least recently seen
+            cache_max_age: Longest time in seconds the *_async reads serve
+                state from memory before asking BlueZ again (0 disables)
+            max_parallel: Most devices operated on (paired, connected, ...)
+                at the same time
+        """
         self.scanning = False
         self.scan_process = None
+        self.scan_events = None
+        self.event_listeners: List[Callable[[Dict], None]] = []
+        self.devices = DeviceRegistry(max_size=max_devices)
+        # RSSI and battery history of the devices that report them
+        self.series = DeviceSeries()
+        self.adapters: Dict[str, AdapterRecord] = {}
+        self.cache_max_age = cache_max_age
+        self.cache_stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+        self._cache_generation = 0
+        self._device_read_at: Dict[str, float] = {}
+        self._snapshot_macs: Optional[List[str]] = None
+        self._snapshot_at = 0.0
+        self._adapter_list: Optional[Tuple[float, List[Dict]]] = None
+        self._adapter_info: Dict[Optional[str], Tuple[float, Dict]] = {}
+        self.scheduler = DeviceScheduler(max_parallel=max_parallel)
+        if sessions is None:
+            sessions = max_parallel + 1
+        self.pool = self.create_pool(sessions, binary)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bluetooth')
+        # Session a worker thread has checked out with command_session()
+        self._thread_state = threading.local()
+        
+    def create_pool(self, sessions: int, binary: str) -> Optional[BluetoothctlPool]:
+        """
+        Create the bluetoothctl session pool; backends that do not run
+        bluetoothctl return None
         
+        Args:
+            sessions: Number of persistent sessions
+            binary: bluetoothctl executable
+        """
+        return BluetoothctlPool(size=sessions, binary=binary, on_event=self._on_bluetoothctl_event,
+                                on_restart=self._on_primary_session_restart)
+    
     def execute_command(self, command: str, timeout: int = 30) -> Tuple[int, str, str]:
         """
         Execute a bluetoothctl command and return exit code, stdout, stderr
         
+        Commands run on a pooled interactive bluetoothctl session rather than
+        a fresh process, so only the BlueZ round trip is paid per call.
+        
         Args:
             command: The command to execute (without 'bluetoothctl')
             timeout: Command timeout in seconds
@@ -55,36 +199,431 @@ class BluetoothManager:
         try:
             logger.info(f"Executing bluetoothctl command: {command}")
             
-            # Use echo piping for non-interactive commands
-            process = subprocess.Popen(
-                ['bluetoothctl'],
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                env=subprocess.os.environ.copy()
-            )
-            
-            # Send command and exit
-            stdout, stderr = process.communicate(
-                input=f"{command}\nexit\n",
-                timeout=timeout
-            )
+            session = getattr(self._thread_state, 'session', None)
+            if session is not None:
+                returncode, stdout, stderr = session.run(command, timeout)
+            else:
+                # Discovery belongs to the D-Bus client that started it, so
+                # scan commands always go to the same session
+                pinned = command.startswith('scan ')
+                returncode, stdout, stderr = self.pool.run(command, timeout=timeout, pinned=pinned)
             
-            logger.info(f"Command '{command}' - Return code: {process.returncode}")
+            logger.info(f"Command '{command}' - Return code: {returncode}")
             logger.debug(f"Command '{command}' - Stdout: {stdout[:200]}")
             if stderr:
                 logger.warning(f"Command '{command}' - Stderr: {stderr[:200]}")
             
-            return process.returncode, stdout, stderr
-        except subprocess.TimeoutExpired:
-            logger.error(f"Command '{command}' timed out after {timeout}s")
-            process.kill()
-            return -1, "", "Command timed out"
+            return returncode, stdout, stderr
         except Exception as e:
             logger.error(f"Command '{command}' failed with exception: {e}")
             return -1, "", str(e)
     
+    @contextmanager
+    def command_session(self) -> Iterator[None]:
+        """
+        Run every command this thread executes on one bluetoothctl session
+        until the block exits, e.g. for a multi-step operation
+        """
+        if getattr(self._thread_state, 'session', None) is not None:
+            yield
+            return
+        with self.pool.session(long_running=True) as session:
+            self._thread_state.session = session
+            try:
+                yield
+            finally:
+                self._thread_state.session = None
+    
+    def close(self) -> None:
+        """Shut down the bluetoothctl sessions"""
+        self.executor.shutdown(wait=False)
+        if self.pool is not None:
+            self.pool.close()
+    
+    async def _run_blocking(self, func: Callable, *args):
+        """Run a blocking backend call on the bounded executor"""
+        loop = asyncio.get_running_loop()
+        # Carry the caller's context over, so request timings see the call
+        context = contextvars.copy_context()
+        submitted = time.perf_counter()
+        
+        def run():
+            record('queue', time.perf_counter() - submitted)
+            return func(*args)
+        
+        return await loop.run_in_executor(self.executor, context.run, run)
+    
+    # State cache: the *_async reads answer from memory while the state is
+    # younger than cache_max_age. BlueZ change events keep the cached records
+    # current, and our own mutations drop what they may have changed.
+    
+    def _cache_fresh(self, read_at: Optional[float]) -> bool:
+        fresh = (read_at is not None and self.cache_max_age > 0 and
+                 time.monotonic() - read_at < self.cache_max_age)
+        self.cache_stats['hits' if fresh else 'misses'] += 1
+        return fresh
+    
+    def invalidate_cache(self, mac_address: Optional[str] = None) -> None:
+        """
+        Drop cached state so the next read goes to BlueZ
+        
+        Args:
+            mac_address: Device whose state changed, or None for everything
+        """
+        self._cache_generation += 1
+        self.cache_stats['invalidations'] += 1
+        self._snapshot_macs = None
+        if mac_address is None:
+            self._device_read_at = {}
+            self._adapter_list = None
+            self._adapter_info = {}
+        else:
+            self._device_read_at.pop(mac_address, None)
+    
+    def export_state(self) -> Dict:
+        """
+        The device registry and the state cache, in the form restore_state
+        takes them, e.g. to save them before a restart
+        
+        Adapter info read for the default adapter is exported under its MAC
+        ('' while no adapter list is cached), since the web UI asks for
+        adapters by MAC. Where both are cached for one adapter, the newer
+        read wins.
+        
+        Returns:
+            Dictionary with 'records', 'snapshot', 'adapters' and
+            'adapter_info' keys, so restore_state(**state) restores it
+        """
+        records = self.devices.records()
+        snapshot = self._snapshot_macs
+        if snapshot is None:
+            snapshot = [record.mac for record in records if record.paired is not None]
+        adapter_list = self._adapter_list
+        default = next((adapter['mac'] for adapter in adapter_list[1] if adapter.get('default')),
+                       '') if adapter_list else ''
+        adapter_info, read_at = {}, {}
+        for adapter_id, (at, info) in self._adapter_info.items():
+            mac = default if adapter_id is None else adapter_id
+            if mac not in read_at or at > read_at[mac]:
+                adapter_info[mac], read_at[mac] = info, at
+        return {
+            'records': records,
+            'snapshot': list(snapshot),
+            'adapters': adapter_list[1] if adapter_list else None,
+            'adapter_info': adapter_info,
+        }
+    
+    def restore_state(self, records: List[DeviceRecord], snapshot: List[str],
+                      adapters: Optional[List[Dict]] = None,
+                      adapter_info: Optional[Dict[str, Dict]] = None) -> None:
+        """
+        Seed the device registry and the state cache, e.g. from the state
+        saved before a restart
+        
+        The restored state counts as just read, so reads are answered from
+        it for up to cache_max_age. Callers should reconcile with BlueZ
+        right away by reading with refresh=True.
+        
+        Args:
+            records: Device records to put in the registry
+            snapshot: MAC addresses making up the device list
+            adapters: list_adapters result
+            adapter_info: get_adapter_info results by adapter MAC ('' for the
+                default adapter when the MAC was not known)
+        """
+        now = time.monotonic()
+        for record in records:
+            self.devices.put(record)
+        self._device_read_at.update((mac, now) for mac in snapshot)
+        self._snapshot_macs = list(snapshot)
+        self._snapshot_at = now
+        if adapters is not None:
+            self.adapters = {adapter['mac']: AdapterRecord.from_dict(adapter) for adapter in adapters}
+            self._adapter_list = (now, adapters)
+        if adapter_info is not None:
+            self._adapter_info = {
+                mac or None: (now, {**info, 'id': mac or None}) for mac, info in adapter_info.items()
+            }
+            # The web UI reads the default adapter by MAC, the API also without one
+            default = next((adapter['mac'] for adapter in self._adapter_list[1] if adapter.get('default')),
+                           None) if self._adapter_list else None
+            if default in adapter_info:
+                self._adapter_info[None] = (now, {**adapter_info[default], 'id': None})
+    
+    # Async API: the same operations, safe to await from the event loop
+    
+    async def list_adapters_async(self, refresh: bool = False) -> List[Dict]:
+        """Async version of list_adapters; refresh bypasses the cache"""
+        cached = self._adapter_list
+        if not refresh and self._cache_fresh(cached[0] if cached else None):
+            return cached[1]
+        
+        generation, started = self._cache_generation, time.monotonic()
+        adapters = await self._run_blocking(self.list_adapters)
+        known = self.adapters
+        self.adapters = {
+            adapter['mac']: known[adapter['mac']].merge(adapter) if adapter['mac'] in known
+            else AdapterRecord.from_dict(adapter)
+            for adapter in adapters
+        }
+        if generation == self._cache_generation:
+            self._adapter_list = (started, adapters)
+        return adapters
+    
+    async def get_adapter_info_async(self, adapter_id: Optional[str] = None,
+                                     refresh: bool = False) -> Dict:
+        """Async version of get_adapter_info; refresh bypasses the cache"""
+        cached = self._adapter_info.get(adapter_id)
+        if not refresh and self._cache_fresh(cached[0] if cached else None):
+            return cached[1]
+        
+        generation, started = self._cache_generation, time.monotonic()
+        info = await self._run_blocking(self.get_adapter_info, adapter_id)
+        if generation == self._cache_generation:
+            self._adapter_info = {**self._adapter_info, adapter_id: (started, info)}
+        return info
+    
+    async def set_adapter_power_async(self, power_on: bool) -> Tuple[bool, str]:
+        """Async version of set_adapter_power"""
+        try:
+            return await self._run_blocking(self.set_adapter_power, power_on)
+        finally:
+            self.invalidate_cache()
+    
+    async def get_devices_async(self) -> List[Dict]:
+        """Async version of get_devices"""
+        return await self._run_blocking(self.get_devices)
+    
+    async def get_device_info_async(self, mac_address: str) -> Dict:
+        """Async version of get_device_info"""
+        if self._cache_fresh(self._device_read_at.get(mac_address)):
+            record = self.devices.get(mac_address)
+            # Evicted devices come back as partial records built from events
+            if record is not None and record.paired is not None:
+                return record.to_dict()
+        
+        generation, started = self._cache_generation, time.monotonic()
+        info = await self._run_blocking(self.get_device_info, mac_address)
+        if 'error' not in info:
+            self.devices.put(DeviceRecord.from_info(info))
+            self.series.record(mac_address, info)
+            if generation == self._cache_generation:
+                self._device_read_at[mac_address] = started
+        return info
+    
+    async def get_device_snapshot_async(self) -> List[Dict]:
+        """Async version of get_device_snapshot"""
+        return await self._run_blocking(self.get_device_snapshot)
+    
+    async def get_device_records_async(self, refresh: bool = False) -> List[DeviceRecord]:
+        """
+        Get a record for every known device from one snapshot, and remember
+        them in the device registry
+        
+        Served from the registry while the last snapshot is younger than
+        cache_max_age and no device was added since.
+        
+        Args:
+            refresh: Read a new snapshot even if the cached one is fresh
+        
+        Returns:
+            List of DeviceRecord
+        """
+        macs = self._snapshot_macs
+        if not refresh and self._cache_fresh(self._snapshot_at if macs is not None else None):
+            records = [self.devices.get(mac) for mac in macs]
+            return [record for record in records if record is not None]
+        
+        generation, started = self._cache_generation, time.monotonic()
+        version = self.devices.version
+        snapshot = await self._run_blocking(self.get_device_snapshot)
+        SNAPSHOT_SECONDS.observe(time.monotonic() - started)
+        SNAPSHOT_DEVICES.observe(len(snapshot))
+        records = [self.devices.put(DeviceRecord.from_info(info)) for info in snapshot]
+        for info in snapshot:
+            self.series.record(info['mac'], info)
+        if generation == self._cache_generation:
+            # The snapshot is the full device list; forget devices BlueZ
+            # dropped without telling us, but not ones an event added since
+            current = {record.mac for record in records}
+            for record in self.devices.records():
+                if record.mac not in current and self.devices.changed_at(record.mac) <= version:
+                    self.devices.discard(record.mac)
+            self._device_read_at.update((record.mac, started) for record in records)
+            self._snapshot_macs = [record.mac for record in records]
+            self._snapshot_at = started
+        return records
+    
+    async def _mutate_device(self, func: Callable, mac_address: str, *args,
+                             priority: int = INTERACTIVE):
+        """
+        Run a device operation through the scheduler, after any earlier
+        operation on the same device, and drop the cached state it touched
+        """
+        async def run():
+            try:
+                return await self._run_blocking(func, mac_address, *args)
+            finally:
+                self.invalidate_cache(mac_address)
+        
+        return await self.scheduler.submit(mac_address, func.__name__, run, priority)
+    
+    async def pair_device_async(self, mac_address: str) -> Tuple[bool, str]:
+        """Async version of pair_device"""
+        return await self._mutate_device(self.pair_device, mac_address)
+    
+    async def trust_device_async(self, mac_address: str) -> Tuple[bool, str]:
+        """Async version of trust_device"""
+        return await self._mutate_device(self.trust_device, mac_address)
+    
+    async def untrust_device_async(self, mac_address: str) -> Tuple[bool, str]:
+        """Async version of untrust_device"""
+        return await self._mutate_device(self.untrust_device, mac_address)
+    
+    async def connect_device_async(self, mac_address: str,
+                                   priority: int = INTERACTIVE) -> Tuple[bool, str]:
+        """
+        Async version of connect_device
+        
+        Args:
+            mac_address: MAC address of the device
+            priority: Scheduler priority; BACKGROUND for automatic reconnects
+        """
+        return await self._mutate_device(self.connect_device, mac_address, priority=priority)
+    
+    async def disconnect_device_async(self, mac_address: str) -> Tuple[bool, str]:
+        """Async version of disconnect_device"""
+        return await self._mutate_device(self.disconnect_device, mac_address)
+    
+    async def remove_device_async(self, mac_address: str) -> Tuple[bool, str]:
+        """Async version of remove_device"""
+        return await self._mutate_device(self.remove_device, mac_address)
+    
+    async def setup_device_async(self, mac_address: str,
+                                 progress: Optional[Callable[[str, str, str], None]] = None
+                                 ) -> Tuple[bool, List[Dict]]:
+        """Async version of setup_device"""
+        return await self._mutate_device(self.setup_device, mac_address, progress)
+    
+    async def bulk_device_action_async(self, action: str, mac_addresses: List[str],
+                                       on_result: Optional[Callable[[Dict], None]] = None
+                                       ) -> List[Dict]:
+        """
+        Run one operation on many devices
+        
+        All devices are handed to the scheduler at once, which runs up to
+        max_parallel of them at the same time and keeps each device's
+        operations in order with anything else queued for it.
+        
+        Args:
+            action: One of BULK_ACTIONS
+            mac_addresses: Devices to operate on
+            on_result: Called with each device's result as soon as it is known
+            
+        Returns:
+            List of {'mac', 'success', 'message'} dicts in the order given
+        """
+        if action not in self.BULK_ACTIONS:
+            raise ValueError(f"Unknown action: {action}")
+        operation = getattr(self, f'{action}_device_async')
+        
+        async def run(mac_address: str) -> Dict:
+            try:
+                success, detail = await operation(mac_address)
+                # setup reports its steps; the last one says how it ended
+                message = detail[-1]['message'] if action == 'setup' else detail
+            except Exception as e:
+                success, message = False, str(e)
+            result = {'mac': mac_address, 'success': success, 'message': message}
+            if on_result:
+                on_result(result)
+            return result
+        
+        return list(await asyncio.gather(*(run(mac) for mac in mac_addresses)))
+    
+    def add_event_listener(self, listener: Callable[[Dict], None]) -> None:
+        """
+        Register a listener for BlueZ change events
+        
+        Listeners are called from a backend thread with dicts like
+        {'event': 'new'|'changed'|'removed', 'object': 'device'|'adapter',
+        'mac': ..., 'props': {...}}, where props use get_device_info keys.
+        
+        Args:
+            listener: Callable taking the event dict
+        """
+        self.event_listeners = self.event_listeners + [listener]
+    
+    def remove_event_listener(self, listener: Callable[[Dict], None]) -> None:
+        """Unregister a listener added with add_event_listener"""
+        self.event_listeners = [l for l in self.event_listeners if l is not listener]
+    
+    def _emit_event(self, event: Dict) -> None:
+        import logging
+        logger = logging.getLogger(__name__)
+        
+        # Keep the records and the state cache current before anyone reacts
+        # to the change
+        mac = event['mac']
+        if event['object'] == 'device':
+            if event['event'] == 'removed':
+                self.devices.discard(mac)
+                self.series.discard(mac)
+                self._device_read_at.pop(mac, None)
+            else:
+                self.devices.update(mac, event['props'])
+                self.series.record(mac, event['props'])
+                if event['event'] == 'new':
+                    # The cached device list does not have it yet
+                    self._snapshot_macs = None
+        else:
+            if mac in self.adapters:
+                self.adapters = {**self.adapters, mac: self.adapters[mac].merge(event['props'])}
+            self._adapter_info = {}
+        
+        for listener in self.event_listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                logger.error(f"Event listener failed: {e}")
+    
+    def start_events(self) -> None:
+        """
+        Make sure the primary bluetoothctl session, whose [NEW]/[CHG]/[DEL]
+        notifications feed the event listeners, is running
+        """
+        self.pool.run('', timeout=10, pinned=True)
+    
+    def warm_up(self) -> None:
+        """Start the remaining bluetoothctl sessions so no request waits for a process start"""
+        self.pool.start_all()
+    
+    def _on_primary_session_restart(self) -> None:
+        """
+        The bluetoothctl session carrying events and discovery was replaced:
+        changes made while it was down were never reported, and discovery it
+        had started ended with it
+        """
+        import logging
+        logger = logging.getLogger(__name__)
+        
+        self.invalidate_cache()
+        if self.scanning:
+            logger.warning("Event session restarted during a scan, restarting discovery")
+            try:
+                # The session is still checked out by the caller; scan on
+                # runs once it is released
+                self.executor.submit(self.start_discovery)
+            except RuntimeError:
+                # Shutting down
+                pass
+    
+    def _on_bluetoothctl_event(self, line: str) -> None:
+        """Translate a bluetoothctl notification line into an event"""
+        event = parse_event(line)
+        if event:
+            self._emit_event(event)
+    
     def list_adapters(self) -> List[Dict]:
         """
         Get list of Bluetooth adapters
@@ -98,20 +637,7 @@ class BluetoothManager:
         returncode, stdout, stderr = self.execute_command('list')
         logger.info(f"list_adapters - Found output length: {len(stdout)} chars")
         
-        adapters = []
-        for line in stdout.split('\n'):
-            # Format: "Controller MAC_ADDRESS NAME [default]"
-            match = re.search(r'Controller ([0-9A-F:]{17}) (.+?)( \[default\])?$', line)
-            if match:
-                mac, name, is_default = match.groups()
-                adapters.append({
-                    'id': mac,
-                    'name': name.strip(),
-                    'mac': mac,
-                    'default': is_default is not None
-                })
-        
-        return adapters
+        return parse_controllers(stdout)
     
     def get_adapter_info(self, adapter_id: Optional[str] = None) -> Dict:
         """
@@ -130,20 +656,7 @@ class BluetoothManager:
         returncode, stdout, stderr = self.execute_command(cmd)
         logger.info(f"get_adapter_info - Output: {stdout[:300]}")
         
-        info = {'id': adapter_id}
-        for line in stdout.split('\n'):
-            if 'Name:' in line:
-                info['name'] = line.split('Name:')[1].strip()
-            elif 'Alias:' in line:
-                info['alias'] = line.split('Alias:')[1].strip()
-            elif 'Powered:' in line:
-                info['powered'] = 'yes' in line.lower()
-            elif 'Discoverable:' in line:
-                info['discoverable'] = 'yes' in line.lower()
-            elif 'Pairable:' in line:
-                info['pairable'] = 'yes' in line.lower()
-        
-        return info
+        return parse_adapter_info(adapter_id, stdout)
     
     def set_adapter_power(self, power_on: bool) -> Tuple[bool, str]:
         """
@@ -172,10 +685,37 @@ class BluetoothManager:
             logger.error(f"Power command failed: {error_msg}")
             return False, error_msg
     
+    def start_discovery(self) -> Tuple[bool, str]:
+        """
+        Start device discovery
+        
+        Returns:
+            Tuple of (success, message)
+        """
+        returncode, stdout, stderr = self.execute_command('scan on')
+        if returncode != 0 and "failed" in stderr.lower():
+            return False, self._parse_error(stderr)
+        return True, "Discovery started"
+    
+    def stop_discovery(self) -> Tuple[bool, str]:
+        """
+        Stop device discovery
+        
+        Returns:
+            Tuple of (success, message)
+        """
+        returncode, stdout, stderr = self.execute_command('scan off')
+        if returncode != 0:
+            return False, self._parse_error(stderr)
+        return True, "Discovery stopped"
+    
     async def start_scan_async(self, callback: Callable[[Dict], None]) -> None:
         """
         Start Bluetooth scanning and call callback with discovered devices
         
+        Discovery is driven by BlueZ change events rather than polling, so a
+        device reaches the callback as soon as BlueZ reports it.
+        
         Args:
             callback: Async function to call with device updates
         """
@@ -189,63 +729,134 @@ class BluetoothManager:
         self.scanning = True
         logger.info("Starting Bluetooth scan...")
         
-        # Start scan with regular bluetoothctl command
-        returncode, stdout, stderr = self.execute_command('scan on')
-        if returncode != 0 and "failed" in stderr.lower():
-            logger.error(f"Failed to start scan: {stderr}")
+        loop = asyncio.get_running_loop()
+        events: asyncio.Queue = asyncio.Queue()
+        self.scan_events = events
+        
+        def on_event(event: Dict) -> None:
+            if event['object'] == 'device':
+                loop.call_soon_threadsafe(events.put_nowait, event)
+        
+        self.add_event_listener(on_event)
+        
+        try:
+            await self._run_blocking(self.start_events)
+            success, message = await self._run_blocking(self.start_discovery)
+        except Exception as e:
+            success, message = False, str(e)
+        if not success:
+            logger.error(f"Failed to start scan: {message}")
+            self.remove_event_listener(on_event)
+            self.scan_events = None
             self.scanning = False
             return
         
         logger.info("Scan started successfully")
         
-        # Keep track of seen devices
-        seen_devices = set()
-        scan_start_time = asyncio.get_event_loop().time()
+        # Devices we already looked at during this scan, bounded so a busy
+        # neighbourhood cannot grow it forever
+        seen_devices = DeviceRegistry(max_size=self.devices.max_size)
         max_scan_duration = 60  # 60 seconds max scan
+        scan_deadline = loop.time() + max_scan_duration
+        
+        def discovered(record: DeviceRecord) -> Dict:
+            return {
+                'type': 'discovered',
+                'mac': record.mac,
+                'name': record.display_name,
+                'rssi': record.rssi,
+                'discovered_at': datetime.now().isoformat()
+            }
+        
+        # Devices announced before we knew whether they are paired; a few
+        # workers look them up, so a slow lookup (or a user's operation the
+        # lookup yields to) never holds up the events behind it
+        lookups: asyncio.Queue = asyncio.Queue()
+        
+        async def resolve() -> None:
+            while True:
+                mac = await lookups.get()
+                try:
+                    info = await self.scheduler.submit(
+                        mac, 'info', lambda: self.get_device_info_async(mac), BACKGROUND)
+                    if 'error' in info or mac not in seen_devices:
+                        continue
+                    record = seen_devices.update(mac, info)
+                    if record.paired:
+                        await callback({'type': 'discovered_removed', 'mac': record.mac})
+                    else:
+                        await callback(discovered(record))
+                except Exception as e:
+                    logger.error(f"Scan lookup for {mac} failed: {e}")
+        
+        resolvers = [asyncio.create_task(resolve()) for _ in range(self.scheduler.max_parallel)]
         
         try:
             while self.scanning:
-                # Check if scan duration exceeded
-                if asyncio.get_event_loop().time() - scan_start_time > max_scan_duration:
+                remaining = scan_deadline - loop.time()
+                if remaining <= 0:
                     logger.info("Scan duration limit reached (60s), stopping...")
                     self.scanning = False
                     break
                 
-                # Get current devices list
-                devices = self.get_devices()
+                try:
+                    event = await asyncio.wait_for(events.get(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    continue
+                if event is None:
+                    # stop_scan() wakes us up
+                    continue
                 
-                for device in devices:
-                    mac = device['mac']
-                    if mac not in seen_devices:
-                        seen_devices.add(mac)
-                        logger.info(f"Discovered device: {mac} - {device['name']}")
-                        
-                        # Get device info to check if it's paired
-                        info = self.get_device_info(mac)
-                        
-                        # Only send unpaired devices as "discovered"
-                        if not info.get('paired', False):
-                            await callback({
-                                'type': 'discovered',
-                                'mac': mac,
-                                'name': device['name'],
-                                'rssi': info.get('rssi'),
-                                'discovered_at': datetime.now().isoformat()
-                            })
+                mac = event['mac']
+                props = event['props']
                 
-                # Wait a bit before next poll
-                await asyncio.sleep(2)
+                if event['event'] == 'removed':
+                    seen_devices.discard(mac)
+                    continue
+                
+                record = seen_devices.get(mac)
+                if record is None:
+                    # The registry knows whether the device is paired if a
+                    # snapshot or an earlier event reported it
+                    known = self.devices.get(mac)
+                    if known is not None and known.paired is not None:
+                        record = seen_devices.put(known)
+                    else:
+                        record = seen_devices.update(mac, props)
+                        lookups.put_nowait(mac)
+                    
+                    logger.info(f"Discovered device: {mac} - {record.display_name}")
+                    SCAN_DISCOVERED.inc()
+                    
+                    # Only send unpaired devices as "discovered"
+                    if not record.paired:
+                        await callback(discovered(record))
+                elif not record.paired and 'rssi' in props:
+                    seen_devices.update(mac, props)
+                    await callback({
+                        'type': 'rssi_update',
+                        'mac': record.mac,
+                        'rssi': props['rssi']
+                    })
                 
         except Exception as e:
             logger.error(f"Scan error: {e}")
         finally:
             logger.info("Stopping scan...")
-            # Stop scan
-            returncode, stdout, stderr = self.execute_command('scan off')
-            if returncode == 0:
+            for resolver in resolvers:
+                resolver.cancel()
+            await asyncio.gather(*resolvers, return_exceptions=True)
+            self.remove_event_listener(on_event)
+            self.scan_events = None
+            try:
+                success, message = await self._run_blocking(self.stop_discovery)
+            except RuntimeError as e:
+                # The executor was shut down under us
+                success, message = False, str(e)
+            if success:
                 logger.info("Scan stopped successfully")
             else:
-                logger.error(f"Error stopping scan: {stderr}")
+                logger.error(f"Error stopping scan: {message}")
             self.scanning = False
             logger.info("Scan complete")
     
@@ -261,6 +872,10 @@ class BluetoothManager:
         
         self.scanning = False
         
+        # Wake the scan loop so it stops right away
+        if self.scan_events is not None:
+            self.scan_events.put_nowait(None)
+        
         if self.scan_process:
             try:
                 # Try to gracefully stop
@@ -280,18 +895,7 @@ class BluetoothManager:
         """
         returncode, stdout, stderr = self.execute_command('devices')
         
-        devices = []
-        for line in stdout.split('\n'):
-            # Format: "Device MAC_ADDRESS NAME"
-            match = re.search(r'Device ([0-9A-F:]{17}) (.+)', line)
-            if match:
-                mac, name = match.groups()
-                devices.append({
-                    'mac': mac,
-                    'name': name.strip()
-                })
-        
-        return devices
+        return parse_devices(stdout)
     
     def get_device_info(self, mac_address: str) -> Dict:
         """
@@ -308,37 +912,80 @@ class BluetoothManager:
         if returncode != 0:
             return {'error': self._parse_error(stderr)}
         
-        info = {'mac': mac_address}
-        
-        for key, pattern in self.INFO_PATTERNS.items():
-            for line in stdout.split('\n'):
-                match = pattern.search(line)
-                if match:
-                    value = match.group(1)
-                    if key in ['paired', 'bonded', 'trusted', 'blocked', 'connected']:
-                        info[key] = value.lower() == 'yes'
-                    elif key in ['battery', 'rssi']:
-                        info[key] = int(value)
-                    else:
-                        info[key] = value
-                    break
+        return parse_device_info(mac_address, stdout)
+    
+    def get_device_snapshot(self) -> List[Dict]:
+        """
+        Get full information about every known device in one session
         
-        # Extract UUIDs
-        info['uuids'] = []
-        in_uuid_section = False
-        for line in stdout.split('\n'):
-            if 'UUID:' in line:
-                in_uuid_section = True
-                uuid_match = re.search(r'UUID: (.+?) \((.+?)\)', line)
-                if uuid_match:
-                    info['uuids'].append({
-                        'uuid': uuid_match.group(1),
-                        'name': uuid_match.group(2)
-                    })
-            elif in_uuid_section and line.strip() and not line.startswith('\t'):
-                in_uuid_section = False
+        The device list and all 'info' commands go to a single bluetoothctl
+        session as one batch, so the cost is two round trips regardless of
+        how many devices there are.
         
-        return info
+        Returns:
+            List of get_device_info dictionaries
+        """
+        import logging
+        logger = logging.getLogger(__name__)
+        
+        with self.pool.session() as session:
+            returncode, stdout, stderr = session.run('devices')
+            macs = [device['mac'] for device in parse_devices(stdout)]
+            if not macs:
+                return []
+            returncode, stdout, stderr = session.run_batch([f'info {mac}' for mac in macs])
+        
+        if returncode < 0:
+            logger.error(f"Device snapshot failed: {stderr}")
+            raise RuntimeError(stderr)
+        
+        infos = parse_device_info_blocks(stdout)
+        return [infos[mac] for mac in macs if mac in infos]
+    
+    def wait_for_device_state(self, mac_address: str, expected: Optional[Dict],
+                              timeout: Optional[float] = None) -> bool:
+        """
+        Wait until BlueZ reports a device state, instead of sleeping a fixed time
+        
+        The device is re-checked whenever a change event for it arrives, with
+        a short backing-off poll as a fallback, so the wait ends as soon as
+        the state is visible.
+        
+        Args:
+            mac_address: MAC address of the device
+            expected: get_device_info values to wait for (e.g. {'paired': True}),
+                or None to wait for the device to disappear
+            timeout: Maximum seconds to wait (defaults to STATE_WAIT_TIMEOUT)
+            
+        Returns:
+            True if the state was observed before the timeout
+        """
+        changed = threading.Event()
+        
+        def on_event(event: Dict) -> None:
+            if event['object'] == 'device' and event['mac'] == mac_address:
+                changed.set()
+        
+        self.add_event_listener(on_event)
+        try:
+            deadline = time.monotonic() + (timeout if timeout is not None else self.STATE_WAIT_TIMEOUT)
+            interval = 0.05
+            while True:
+                info = self.get_device_info(mac_address)
+                if expected is None:
+                    if 'error' in info:
+                        return True
+                elif all(info.get(key) == value for key, value in expected.items()):
+                    return True
+                
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                changed.wait(min(interval, remaining))
+                changed.clear()
+                interval = min(interval * 2, 0.5)
+        finally:
+            self.remove_event_listener(on_event)
     
     def pair_device(self, mac_address: str) -> Tuple[bool, str]:
         """
@@ -350,7 +997,6 @@ class BluetoothManager:
         Returns:
             Tuple of (success, message)
         """
-        import time
         import logging
         logger = logging.getLogger(__name__)
         
@@ -361,8 +1007,9 @@ class BluetoothManager:
         
         if returncode == 0 or 'Pairing successful' in stdout or 'already paired' in stdout.lower():
             # Wait for pairing to settle
-            logger.info("Pairing successful, waiting 2 seconds for state to settle...")
-            time.sleep(2)
+            logger.info("Pairing successful, waiting for BlueZ to report it...")
+            if not self.wait_for_device_state(mac_address, {'paired': True}):
+                logger.warning(f"{mac_address} not reported as paired yet")
             return True, "Device paired successfully"
         else:
             error_msg = self._parse_error(stderr + stdout)
@@ -379,7 +1026,6 @@ class BluetoothManager:
         Returns:
             Tuple of (success, message)
         """
-        import time
         import logging
         logger = logging.getLogger(__name__)
         
@@ -389,8 +1035,9 @@ class BluetoothManager:
         logger.info(f"Trust command result - returncode: {returncode}, stdout: {stdout}, stderr: {stderr}")
         
         if returncode == 0 or 'trust succeeded' in stdout.lower():
-            # Small delay for trust to settle
-            time.sleep(1)
+            # Wait for trust to settle
+            if not self.wait_for_device_state(mac_address, {'trusted': True}):
+                logger.warning(f"{mac_address} not reported as trusted yet")
             return True, "Device trusted"
         else:
             return False, self._parse_error(stderr)
@@ -422,7 +1069,6 @@ class BluetoothManager:
         Returns:
             Tuple of (success, message)
         """
-        import time
         import logging
         logger = logging.getLogger(__name__)
         
@@ -433,7 +1079,8 @@ class BluetoothManager:
         
         if returncode == 0 or 'Connection successful' in stdout or 'Connected: yes' in stdout:
             # Wait for connection to fully establish
-            time.sleep(2)
+            if not self.wait_for_device_state(mac_address, {'connected': True}):
+                logger.warning(f"{mac_address} not reported as connected yet")
             return True, "Connected successfully"
         else:
             error_msg = self._parse_error(stderr + stdout)
@@ -467,7 +1114,6 @@ class BluetoothManager:
         Returns:
             Tuple of (success, message)
         """
-        import time
         import logging
         logger = logging.getLogger(__name__)
         
@@ -478,7 +1124,7 @@ class BluetoothManager:
         if device_info.get('connected', False):
             logger.info(f"Device is connected, disconnecting first...")
             self.disconnect_device(mac_address)
-            time.sleep(1)
+            self.wait_for_device_state(mac_address, {'connected': False})
         
         returncode, stdout, stderr = self.execute_command(f'remove {mac_address}')
         
@@ -486,17 +1132,55 @@ class BluetoothManager:
         
         if returncode == 0 or 'Device has been removed' in stdout:
             # Wait for removal to settle
-            time.sleep(1)
+            if not self.wait_for_device_state(mac_address, None):
+                logger.warning(f"{mac_address} still reported by BlueZ after removal")
             return True, "Device removed"
         else:
             error_msg = self._parse_error(stderr)
             logger.error(f"Remove failed: {error_msg}")
             return False, error_msg
     
+    def setup_device(self, mac_address: str,
+                     progress: Optional[Callable[[str, str, str], None]] = None
+                     ) -> Tuple[bool, List[Dict]]:
+        """
+        Pair, trust and connect a device in one go, on a single bluetoothctl
+        session, stopping at the first step that fails
+        
+        Args:
+            mac_address: MAC address of the device
+            progress: Called from the worker thread with (step, status,
+                message) as each step starts ('running') and ends ('done' or
+                'failed')
+            
+        Returns:
+            Tuple of (success, list of {'step', 'success', 'message'} dicts
+            for the steps that ran)
+        """
+        steps = (
+            ('pair', self.pair_device),
+            ('trust', self.trust_device),
+            ('connect', self.connect_device),
+        )
+        results = []
+        with self.command_session():
+            for step, func in steps:
+                if progress:
+                    progress(step, 'running', '')
+                success, message = func(mac_address)
+                results.append({'step': step, 'success': success, 'message': message})
+                if progress:
+                    progress(step, 'done' if success else 'failed', message)
+                if not success:
+                    return False, results
+        return True, results
+    
     def _parse_error(self, error_output: str) -> str:
         """
         Convert bluetoothctl errors to user-friendly messages
         
+        Each error is also counted by category in the metrics.
+        
         Args:
             error_output: Error output from bluetoothctl
             
@@ -505,21 +1189,17 @@ class BluetoothManager:
         """
         error_lower = error_output.lower()
         
-        if "page timeout" in error_lower or "page-timeout" in error_lower:
-            return "Device not found or not responding. Make sure the device is in pairing mode and nearby."
-        elif "already exists" in error_lower or "already paired" in error_lower:
-            return "Device is already paired."
-        elif "not ready" in error_lower:
-            return "Bluetooth adapter not ready. Try powering it off and on again."
-        elif "not available" in error_lower:
-            return "Device not available. Make sure it's powered on."
-        elif "connection refused" in error_lower:
-            return "Connection refused by device."
-        elif "authentication failed" in error_lower:
-            return "Authentication failed. Try removing and re-pairing the device."
-        elif "failed" in error_lower:
+        for patterns, category, message in ERROR_CATEGORIES:
+            if any(pattern in error_lower for pattern in patterns):
+                OPERATION_ERRORS.inc(category)
+                return message
+        
+        if "failed" in error_lower:
+            OPERATION_ERRORS.inc('failed')
             return f"Operation failed: {error_output[:100]}"
         elif error_output:
+            OPERATION_ERRORS.inc('other')
             return error_output[:200]
         else:
+            OPERATION_ERRORS.inc('unknown')
             return "Unknown error occurred"
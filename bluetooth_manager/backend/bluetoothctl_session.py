@@ -0,0 +1,400 @@
+"""
+bluetoothctl Session Pool
+Keeps long-lived interactive bluetoothctl processes and frames the output of
+each command, so a command costs a BlueZ round trip instead of a process spawn
+"""
+
+import itertools
+import logging
+import re
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from metrics import COMMAND_SECONDS, COMMAND_TIMEOUTS
+from profiling import record
+
+
+logger = logging.getLogger(__name__)
+
+
+# Strip colour codes, readline control bytes and the interactive prompt
+ANSI_PATTERN = re.compile(r'\x1b\[[0-9;?]*[A-Za-z]|[\x01\x02\r]')
+PROMPT_PATTERN = re.compile(r'^(?:\[[^\]\n]*\][#>] ?)+')
+
+# Asynchronous notifications bluetoothctl prints whenever BlueZ objects change
+EVENT_PATTERN = re.compile(r'^\[(NEW|CHG|DEL)\] ')
+
+# Lines bluetoothctl prints for our sync marker, which is an unknown command
+HELP_PATTERN = re.compile(r'^Use "(help|menu|back)\b')
+
+# Lines that mean the command did not succeed
+FAILURE_PATTERN = re.compile(
+    r'Failed to|org\.bluez\.Error|not available|No default controller|Invalid command'
+)
+
+# Commands whose result arrives asynchronously after bluetoothctl returns to
+# the prompt; the command is only complete once one of these lines is seen
+COMPLETION_PATTERNS = {
+    'pair': re.compile(r'Pairing successful|Failed to pair|not available'),
+    'connect': re.compile(r'Connection successful|Failed to connect|not available'),
+    'disconnect': re.compile(r'Successful disconnected|Failed to disconnect|not available'),
+    'remove': re.compile(r'Device has been removed|Failed to remove|not available'),
+    'trust': re.compile(r'trust succeeded|Failed to set trust|not available'),
+    'untrust': re.compile(r'untrust succeeded|Failed to set trust|not available'),
+    'power': re.compile(r'Changing power \w+ succeeded|Failed to set power|No default controller'),
+    'scan': re.compile(r'Discovery (started|stopped)|Failed to (start|stop) discovery|No default controller'),
+}
+
+# Commands that can hold a session for many seconds while BlueZ talks to the
+# device; the pool keeps them off the primary session, which carries the
+# event stream and discovery
+LONG_RUNNING = {'pair', 'connect', 'disconnect', 'remove'}
+
+TIMEOUT_MESSAGE = 'Command timed out'
+
+
+def clean_line(line: str) -> str:
+    """
+    Remove terminal control sequences and prompts from a bluetoothctl line
+
+    Args:
+        line: Raw line read from bluetoothctl
+
+    Returns:
+        The line as bluetoothctl would print it in a plain terminal
+    """
+    line = ANSI_PATTERN.sub('', line.rstrip('\n'))
+    return PROMPT_PATTERN.sub('', line).rstrip()
+
+
+class BluetoothctlSession:
+    """A single long-lived interactive bluetoothctl process"""
+
+    _tokens = itertools.count(1)
+
+    def __init__(self, binary: str = 'bluetoothctl',
+                 on_event: Optional[Callable[[str], None]] = None):
+        self.binary = binary
+        self.on_event = on_event
+        self.process: Optional[subprocess.Popen] = None
+        self.last_used = 0.0
+        self.spawn_count = 0
+        self._lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._lines: Optional[List[str]] = None
+        self._reader: Optional[threading.Thread] = None
+
+    def is_alive(self) -> bool:
+        """Check whether the bluetoothctl process is still running"""
+        return self.process is not None and self.process.poll() is None
+
+    def start(self) -> None:
+        """Spawn the bluetoothctl process and its output reader"""
+        self.close()
+        logger.info(f"Starting bluetoothctl session ({self.binary})")
+        started = time.perf_counter()
+        self.process = subprocess.Popen(
+            [self.binary],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            bufsize=1
+        )
+        self.spawn_count += 1
+        self.last_used = time.monotonic()
+        self._reader = threading.Thread(
+            target=self._read_output,
+            args=(self.process,),
+            name='bluetoothctl-reader',
+            daemon=True
+        )
+        self._reader.start()
+        # Swallow the startup banner so it is not attributed to the first command
+        returncode, _, stderr = self._exchange([], timeout=10)
+        if returncode != 0:
+            raise RuntimeError(f"bluetoothctl did not start: {stderr}")
+        record('spawn', time.perf_counter() - started)
+
+    def close(self) -> None:
+        """Terminate the bluetoothctl process"""
+        process, self.process = self.process, None
+        if process is None:
+            return
+        try:
+            if process.poll() is None:
+                process.stdin.write('exit\n')
+                process.stdin.flush()
+                process.wait(timeout=1)
+        except Exception:
+            process.kill()
+        with self._cond:
+            self._cond.notify_all()
+
+    def _read_output(self, process: subprocess.Popen) -> None:
+        """Reader thread: collect lines for the running command and dispatch events"""
+        for raw in process.stdout:
+            line = clean_line(raw)
+            if not line or HELP_PATTERN.match(line):
+                continue
+            if self.on_event and EVENT_PATTERN.match(line):
+                try:
+                    self.on_event(line)
+                except Exception as e:
+                    logger.error(f"bluetoothctl event handler failed: {e}")
+            with self._cond:
+                if self._lines is not None:
+                    self._lines.append(line)
+                    self._cond.notify_all()
+        with self._cond:
+            self._cond.notify_all()
+
+    def run(self, command: str, timeout: float = 30) -> Tuple[int, str, str]:
+        """
+        Run a command in this session and wait for its framed output
+
+        Args:
+            command: The bluetoothctl command, or '' to only round-trip the marker
+            timeout: Seconds to wait for the command to complete
+
+        Returns:
+            Tuple of (exit_code, stdout, stderr) in the shape of a one-shot run
+        """
+        verb = command.split(' ', 1)[0]
+        completion = COMPLETION_PATTERNS.get(verb)
+        with self._lock:
+            if not self.is_alive():
+                self.start()
+            started = time.perf_counter()
+            result = self._exchange([command] if command else [], timeout, completion)
+        self._record(verb or 'sync', started, result)
+        return result
+
+    def run_batch(self, commands: List[str], timeout: float = 30) -> Tuple[int, str, str]:
+        """
+        Run several synchronous commands (info, show, devices, ...) in one
+        round trip, with a single sync marker after the last one
+
+        Args:
+            commands: bluetoothctl commands to run in order
+            timeout: Seconds to wait for all of them
+
+        Returns:
+            Tuple of (exit_code, stdout, stderr) with the concatenated output
+        """
+        with self._lock:
+            if not self.is_alive():
+                self.start()
+            started = time.perf_counter()
+            result = self._exchange(commands, timeout)
+        self._record('batch', started, result)
+        return result
+
+    def _record(self, verb: str, started: float, result: Tuple[int, str, str]) -> None:
+        elapsed = time.perf_counter() - started
+        COMMAND_SECONDS.observe(elapsed, verb)
+        record('bluez', elapsed)
+        if result[2] == TIMEOUT_MESSAGE:
+            COMMAND_TIMEOUTS.inc(verb)
+
+    def _exchange(self, commands: List[str], timeout: float,
+                  completion: Optional[re.Pattern] = None) -> Tuple[int, str, str]:
+        """Write commands followed by a sync marker and collect their output"""
+        token = f'__sync_{next(self._tokens)}__'
+        deadline = time.monotonic() + timeout
+
+        with self._cond:
+            self._lines = []
+        try:
+            payload = ''.join(f'{command}\n' for command in commands) + f'{token}\n'
+            self.process.stdin.write(payload)
+            self.process.stdin.flush()
+
+            with self._cond:
+                while True:
+                    marker = next((i for i, line in enumerate(self._lines) if token in line), None)
+                    done = marker is not None and (
+                        completion is None or
+                        any(completion.search(line) for line in self._lines)
+                    )
+                    remaining = deadline - time.monotonic()
+                    if done or remaining <= 0 or not self.is_alive():
+                        break
+                    self._cond.wait(remaining)
+                lines = [line for line in self._lines if token not in line]
+        except (BrokenPipeError, OSError) as e:
+            self.close()
+            return -1, "", f"bluetoothctl session lost: {e}"
+        finally:
+            with self._cond:
+                self._lines = None
+            self.last_used = time.monotonic()
+
+        if not done:
+            # The session is in an unknown state; replace it on next use
+            self.close()
+            if remaining <= 0:
+                return -1, "\n".join(lines), TIMEOUT_MESSAGE
+            return -1, "\n".join(lines), "bluetoothctl session exited"
+
+        errors = [line for line in lines if FAILURE_PATTERN.search(line)]
+        return (1 if errors else 0), "\n".join(lines), "\n".join(errors)
+
+
+class BluetoothctlPool:
+    """
+    A small pool of bluetoothctl sessions with per-session serialization
+
+    Session 0 is the primary session: it delivers the [NEW]/[CHG]/[DEL]
+    notifications and runs discovery. Other commands go to the remaining
+    sessions first, and pair/connect/... never run on it, so a command that
+    times out (which replaces its session) rarely takes the event stream and
+    an active scan down with it. If it does, the primary session is respawned
+    right away and on_restart is called.
+    """
+
+    def __init__(self, size: int = 3, binary: str = 'bluetoothctl',
+                 idle_check: float = 30.0,
+                 on_event: Optional[Callable[[str], None]] = None,
+                 on_restart: Optional[Callable[[], None]] = None):
+        """
+        Args:
+            size: Number of concurrent bluetoothctl sessions
+            binary: bluetoothctl executable
+            idle_check: Health-check a session that has been idle this many seconds
+            on_event: Called with every [NEW]/[CHG]/[DEL] line of the primary session
+            on_restart: Called after the primary session was replaced, while it
+                is still checked out; must not run commands on it synchronously
+        """
+        self.idle_check = idle_check
+        self.on_restart = on_restart
+        self.sessions = [
+            BluetoothctlSession(binary, on_event=on_event if i == 0 else None)
+            for i in range(max(size, 1))
+        ]
+        self._free = [True] * len(self.sessions)
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def _candidates(self, pinned: bool, long_running: bool) -> Tuple[int, ...]:
+        """Sessions a checkout may use, in order of preference"""
+        if pinned:
+            return (0,)
+        others = tuple(range(1, len(self.sessions)))
+        if long_running and others:
+            return others
+        return others + (0,)
+
+    def _checkout(self, pinned: bool, long_running: bool = False) -> int:
+        candidates = self._candidates(pinned, long_running)
+        with self._cond:
+            while True:
+                for index in candidates:
+                    if self._free[index]:
+                        self._free[index] = False
+                        return index
+                self._cond.wait()
+
+    def _release(self, index: int) -> None:
+        with self._cond:
+            self._free[index] = True
+            self._cond.notify_all()
+
+    def _start(self, index: int) -> None:
+        """(Re)spawn a session, reporting a replaced primary session"""
+        session = self.sessions[index]
+        replaced = session.spawn_count > 0
+        session.start()
+        if replaced and index == 0 and self.on_restart:
+            try:
+                self.on_restart()
+            except Exception as e:
+                logger.error(f"bluetoothctl restart handler failed: {e}")
+
+    def _ensure_healthy(self, index: int) -> None:
+        """Respawn a dead session, and ping one that has been idle for a while"""
+        session = self.sessions[index]
+        if not session.is_alive():
+            if session.process is not None or session.spawn_count:
+                logger.warning("bluetoothctl session exited, respawning")
+            self._start(index)
+        elif time.monotonic() - session.last_used > self.idle_check:
+            returncode, _, stderr = session.run('', timeout=5)
+            if returncode != 0:
+                logger.warning(f"bluetoothctl session failed health check ({stderr}), respawning")
+                self._start(index)
+
+    @contextmanager
+    def session(self, pinned: bool = False, long_running: bool = False) -> Iterator[BluetoothctlSession]:
+        """
+        Check out a healthy session for several commands in a row
+
+        Args:
+            pinned: Use the primary session; discovery must be started and
+                stopped from the same D-Bus client
+            long_running: The commands include pair/connect/...; such
+                checkouts stay off the primary session (unless it is the
+                only one)
+        """
+        index = self._checkout(pinned, long_running)
+        try:
+            self._ensure_healthy(index)
+            yield self.sessions[index]
+        finally:
+            try:
+                # A timed-out command closed the session; the event stream
+                # must not wait for the next checkout to come back
+                if index == 0 and not self._closed and not self.sessions[0].is_alive():
+                    logger.warning("Primary bluetoothctl session lost, respawning")
+                    self._start(0)
+            except Exception as e:
+                logger.error(f"Could not respawn the primary bluetoothctl session: {e}")
+            finally:
+                self._release(index)
+
+    def run(self, command: str, timeout: float = 30, pinned: bool = False) -> Tuple[int, str, str]:
+        """
+        Run a command on an idle session
+
+        Args:
+            command: The bluetoothctl command
+            timeout: Seconds to wait for the command to complete
+            pinned: Run on the primary session
+
+        Returns:
+            Tuple of (exit_code, stdout, stderr)
+        """
+        long_running = command.split(' ', 1)[0] in LONG_RUNNING
+        with self.session(pinned, long_running) as session:
+            return session.run(command, timeout)
+
+    def start_all(self) -> None:
+        """Spawn the sessions that are not running yet, ahead of the first commands"""
+        for index, session in enumerate(self.sessions):
+            # A session that is checked out is running already
+            with self._cond:
+                if not self._free[index]:
+                    continue
+                self._free[index] = False
+            try:
+                if not session.is_alive():
+                    self._start(index)
+            finally:
+                self._release(index)
+
+    def stats(self) -> Dict:
+        """Session liveness and spawn counts"""
+        return {
+            'size': len(self.sessions),
+            'alive': sum(1 for s in self.sessions if s.is_alive()),
+            'spawned': sum(s.spawn_count for s in self.sessions),
+        }
+
+    def close(self) -> None:
+        """Terminate all sessions"""
+        self._closed = True
+        for session in self.sessions:
+            session.close()
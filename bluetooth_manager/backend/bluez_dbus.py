@@ -0,0 +1,644 @@
+"""
+BlueZ D-Bus Backend
+Talks to org.bluez over the system bus instead of scraping bluetoothctl output
+"""
+
+import logging
+import queue
+import threading
+import time
+from contextlib import nullcontext
+from typing import Callable, ContextManager, Dict, List, Optional, Tuple
+
+from jeepney import DBusAddress, DBusErrorResponse, HeaderFields, MatchRule, Properties, message_bus, new_method_call
+from jeepney.io.threading import DBusRouter, open_dbus_connection
+from jeepney.wrappers import unwrap_msg
+
+from bluetooth_manager import BluetoothManager
+from metrics import DBUS_CALL_SECONDS
+from profiling import record
+from utils import get_friendly_uuid_name
+
+
+logger = logging.getLogger(__name__)
+
+
+BLUEZ = 'org.bluez'
+ADAPTER_IFACE = 'org.bluez.Adapter1'
+DEVICE_IFACE = 'org.bluez.Device1'
+BATTERY_IFACE = 'org.bluez.Battery1'
+OBJECT_MANAGER_IFACE = 'org.freedesktop.DBus.ObjectManager'
+PROPERTIES_IFACE = 'org.freedesktop.DBus.Properties'
+
+# Errors for a device object path BlueZ does not (or no longer) serve
+UNKNOWN_DEVICE_ERRORS = (
+    'org.freedesktop.DBus.Error.UnknownObject',
+    'org.freedesktop.DBus.Error.UnknownMethod',
+    'org.freedesktop.DBus.Error.UnknownInterface',
+    'org.bluez.Error.DoesNotExist',
+)
+
+# Device1 properties and the get_device_info keys they map to
+DEVICE_PROPERTIES = {
+    'Name': 'name',
+    'Alias': 'alias',
+    'Paired': 'paired',
+    'Bonded': 'bonded',
+    'Trusted': 'trusted',
+    'Blocked': 'blocked',
+    'Connected': 'connected',
+    'RSSI': 'rssi',
+    'Class': 'class',
+    'Icon': 'icon',
+}
+
+
+def unwrap_variants(props: Dict) -> Dict:
+    """
+    Strip the (signature, value) variant wrappers from a property dict
+
+    Args:
+        props: Properties as returned by jeepney for an a{sv} argument
+
+    Returns:
+        Dictionary of plain property values
+    """
+    return {key: value[1] for key, value in props.items()}
+
+
+def device_path_to_mac(path: str) -> Optional[str]:
+    """
+    Extract the MAC address from a BlueZ device object path
+
+    Args:
+        path: Object path like /org/bluez/hci0/dev_AA_BB_CC_DD_EE_FF
+
+    Returns:
+        MAC address (AA:BB:CC:DD:EE:FF), or None for non-device paths
+    """
+    tail = path.rsplit('/', 1)[-1]
+    if not tail.startswith('dev_'):
+        return None
+    return tail[4:].replace('_', ':')
+
+
+def translate_device_props(props: Dict) -> Dict:
+    """
+    Convert Device1 properties to get_device_info keys and value formats
+
+    Args:
+        props: Unwrapped Device1 properties (possibly a partial change set)
+
+    Returns:
+        Dictionary with the same keys get_device_info uses
+    """
+    info = {}
+    for key, name in DEVICE_PROPERTIES.items():
+        if key not in props:
+            continue
+        value = props[key]
+        if key == 'Class':
+            value = f"0x{value:08x}"
+        elif key == 'RSSI':
+            value = int(value)
+        elif name in ('paired', 'bonded', 'trusted', 'blocked', 'connected'):
+            value = bool(value)
+        info[name] = value
+    if 'UUIDs' in props:
+        info['uuids'] = [
+            {'uuid': uuid, 'name': get_friendly_uuid_name(uuid)}
+            for uuid in props['UUIDs']
+        ]
+    return info
+
+
+class DBusBluetoothManager(BluetoothManager):
+    """Manages Bluetooth operations by calling org.bluez over D-Bus"""
+
+    def __init__(self, bus: str = 'SYSTEM', timeout: float = 30, **kwargs):
+        """
+        Args:
+            bus: 'SYSTEM' (BlueZ) or 'SESSION' (a local test bus)
+            timeout: Default D-Bus method call timeout in seconds
+            **kwargs: BluetoothManager options such as cache_max_age
+        """
+        super().__init__(**kwargs)
+        self.bus = bus
+        self.timeout = timeout
+        self._router = None
+        self._router_lock = threading.Lock()
+        self._signals: Optional[queue.Queue] = None
+        self._adapter_macs: Dict[str, str] = {}
+
+    @property
+    def router(self):
+        """Shared, thread-safe connection to the bus, opened on first use"""
+        with self._router_lock:
+            if self._router is None:
+                logger.info(f"Connecting to BlueZ on the {self.bus.lower()} bus")
+                self._router = DBusRouter(open_dbus_connection(self.bus))
+            return self._router
+
+    def create_pool(self, sessions: int, binary: str) -> None:
+        """No bluetoothctl sessions; every call goes over the bus"""
+        return None
+
+    def command_session(self) -> ContextManager[None]:
+        """All calls share the one D-Bus connection already"""
+        return nullcontext()
+
+    def close(self) -> None:
+        """Close the D-Bus connection"""
+        with self._router_lock:
+            router, self._router = self._router, None
+            signals, self._signals = self._signals, None
+        if signals is not None:
+            signals.put(None)
+        if router is not None:
+            router.close()
+            router.conn.close()
+        super().close()
+
+    # D-Bus helpers
+
+    def _call(self, path: str, interface: str, method: str,
+              signature: Optional[str] = None, body: tuple = (),
+              timeout: Optional[float] = None) -> tuple:
+        """Call a method on a BlueZ object and return the reply body"""
+        address = DBusAddress(path, bus_name=BLUEZ, interface=interface)
+        msg = new_method_call(address, method, signature, body)
+        started = time.perf_counter()
+        try:
+            reply = self.router.send_and_get_reply(msg, timeout=timeout or self.timeout)
+        finally:
+            elapsed = time.perf_counter() - started
+            DBUS_CALL_SECONDS.observe(elapsed, method)
+            record('bluez', elapsed)
+        return unwrap_msg(reply)
+
+    def _set_property(self, path: str, interface: str, name: str, signature: str, value) -> None:
+        address = DBusAddress(path, bus_name=BLUEZ, interface=interface)
+        msg = Properties(address).set(name, signature, value)
+        unwrap_msg(self.router.send_and_get_reply(msg, timeout=self.timeout))
+
+    def get_managed_objects(self) -> Dict[str, Dict[str, Dict]]:
+        """
+        Fetch every BlueZ object and its properties in a single call
+
+        Returns:
+            Mapping of object path to {interface: {property: value}}
+        """
+        (objects,) = self._call('/', OBJECT_MANAGER_IFACE, 'GetManagedObjects')
+        objects = {
+            path: {iface: unwrap_variants(props) for iface, props in interfaces.items()}
+            for path, interfaces in objects.items()
+        }
+        # Remember adapter addresses so adapter signals can be reported by MAC
+        # and device paths can be built without another GetManagedObjects
+        self._adapter_macs = {path: objects[path][ADAPTER_IFACE].get('Address')
+                              for path in self._adapter_paths(objects)}
+        return objects
+
+    def _adapter_paths(self, objects: Dict) -> List[str]:
+        return sorted(path for path, ifaces in objects.items() if ADAPTER_IFACE in ifaces)
+
+    def _adapter_path(self, objects: Optional[Dict] = None, adapter_id: Optional[str] = None) -> Optional[str]:
+        """Find an adapter by MAC address, or the default (first) adapter"""
+        objects = objects if objects is not None else self.get_managed_objects()
+        for path in self._adapter_paths(objects):
+            if adapter_id is None or objects[path][ADAPTER_IFACE].get('Address') == adapter_id:
+                return path
+        return None
+
+    def _default_adapter_path(self) -> Optional[str]:
+        """The default (first) adapter, from the adapters last seen on the bus"""
+        if not self._adapter_macs:
+            self.get_managed_objects()
+        return min(self._adapter_macs) if self._adapter_macs else None
+
+    def _device_path(self, mac_address: str) -> Optional[str]:
+        """Where BlueZ puts the device if it is known to the default adapter"""
+        adapter = self._default_adapter_path()
+        if adapter is None:
+            return None
+        return f"{adapter}/dev_{mac_address.upper().replace(':', '_')}"
+
+    def _find_device_path(self, mac_address: str) -> Optional[str]:
+        """Look the device up among every object BlueZ serves"""
+        for path, ifaces in self.get_managed_objects().items():
+            device = ifaces.get(DEVICE_IFACE)
+            if device and device.get('Address') == mac_address:
+                return path
+        return None
+
+    def _on_device(self, mac_address: str, func: Callable[[str], object]):
+        """
+        Run func on a device's object path without listing every object
+
+        The path is built from the default adapter's; only if BlueZ does not
+        know it (the device is on another adapter, or gone) is the device
+        looked up with GetManagedObjects and func retried.
+
+        Args:
+            mac_address: MAC address of the device
+            func: Called with the device's object path
+
+        Returns:
+            What func returned
+
+        Raises:
+            LookupError: BlueZ does not know the device
+        """
+        path = self._device_path(mac_address)
+        if path is not None:
+            try:
+                return func(path)
+            except DBusErrorResponse as e:
+                if e.name not in UNKNOWN_DEVICE_ERRORS:
+                    raise
+        found = self._find_device_path(mac_address)
+        if found is None or found == path:
+            raise LookupError(f"Device {mac_address} not available")
+        return func(found)
+
+    def _read_device(self, path: str) -> Dict[str, Dict]:
+        """Device1 and battery properties of one device, as {interface: props}"""
+        (props,) = self._call(path, PROPERTIES_IFACE, 'GetAll', 's', (DEVICE_IFACE,))
+        interfaces = {DEVICE_IFACE: unwrap_variants(props)}
+        try:
+            (percentage,) = self._call(path, PROPERTIES_IFACE, 'Get', 'ss', (BATTERY_IFACE, 'Percentage'))
+            interfaces[BATTERY_IFACE] = {'Percentage': percentage[1]}
+        except DBusErrorResponse:
+            # No Battery1 on this device
+            pass
+        return interfaces
+
+    def _error_message(self, error: Exception) -> str:
+        if isinstance(error, DBusErrorResponse):
+            detail = error.data[0] if error.data else ''
+            return self._parse_error(f"{error.name} {detail}".strip())
+        return self._parse_error(str(error))
+
+    def _device_info(self, mac_address: str, interfaces: Dict) -> Dict:
+        """Build a get_device_info dict from a device object's interfaces"""
+        info = {'mac': mac_address, 'uuids': []}
+        info.update(translate_device_props(interfaces[DEVICE_IFACE]))
+        battery = interfaces.get(BATTERY_IFACE, {}).get('Percentage')
+        if battery is not None:
+            info['battery'] = int(battery)
+        return info
+
+    # Change events
+
+    def start_events(self) -> None:
+        """Subscribe to BlueZ object and property change signals"""
+        with self._router_lock:
+            if self._signals is not None:
+                return
+            # Claimed before subscribing so concurrent callers subscribe once
+            self._signals = signals = queue.Queue()
+        filters = []
+        try:
+            router = self.router
+            self.get_managed_objects()
+            rules = [
+                dict(type='signal', interface=OBJECT_MANAGER_IFACE, path='/'),
+                dict(type='signal', interface=PROPERTIES_IFACE, member='PropertiesChanged',
+                     path_namespace='/org/bluez'),
+            ]
+            for rule in rules:
+                # The bus resolves org.bluez in AddMatch; locally signals carry the
+                # unique name, so the local filter leaves the sender out
+                filters.append(router.filter(MatchRule(**rule), queue=signals))
+                add_match = message_bus.AddMatch(MatchRule(sender=BLUEZ, **rule))
+                unwrap_msg(router.send_and_get_reply(add_match, timeout=self.timeout))
+        except Exception:
+            # Let the next call subscribe again
+            for handle in filters:
+                handle.close()
+            with self._router_lock:
+                if self._signals is signals:
+                    self._signals = None
+            raise
+        threading.Thread(target=self._dispatch_signals, args=(signals,),
+                         name='bluez-signals', daemon=True).start()
+
+    def warm_up(self) -> None:
+        """Connect to the bus now; there are no bluetoothctl sessions to start"""
+        _ = self.router
+
+    def _dispatch_signals(self, signals: queue.Queue) -> None:
+        """Signal thread: translate D-Bus signals into events"""
+        while True:
+            msg = signals.get()
+            if msg is None:
+                return
+            try:
+                event = self._signal_to_event(msg)
+            except Exception as e:
+                logger.error(f"Could not handle BlueZ signal: {e}")
+                continue
+            if event:
+                self._emit_event(event)
+
+    def _signal_to_event(self, msg) -> Optional[Dict]:
+        member = msg.header.fields.get(HeaderFields.member)
+        if member == 'InterfacesAdded':
+            path, interfaces = msg.body
+            if ADAPTER_IFACE in interfaces:
+                self._adapter_macs[path] = unwrap_variants(interfaces[ADAPTER_IFACE]).get('Address')
+            if DEVICE_IFACE not in interfaces:
+                return None
+            props = unwrap_variants(interfaces[DEVICE_IFACE])
+            return {'event': 'new', 'object': 'device', 'mac': props.get('Address') or device_path_to_mac(path),
+                    'props': translate_device_props(props)}
+        if member == 'InterfacesRemoved':
+            path, interfaces = msg.body
+            if ADAPTER_IFACE in interfaces:
+                self._adapter_macs.pop(path, None)
+            if DEVICE_IFACE not in interfaces:
+                return None
+            return {'event': 'removed', 'object': 'device', 'mac': device_path_to_mac(path), 'props': {}}
+        if member == 'PropertiesChanged':
+            path = msg.header.fields.get(HeaderFields.path)
+            interface, changed, _ = msg.body
+            changed = unwrap_variants(changed)
+            if interface == DEVICE_IFACE:
+                props = translate_device_props(changed)
+            elif interface == BATTERY_IFACE and 'Percentage' in changed:
+                props = {'battery': int(changed['Percentage'])}
+            elif interface == ADAPTER_IFACE:
+                props = {key.lower(): bool(value) for key, value in changed.items()
+                         if key in ('Powered', 'Discoverable', 'Pairable', 'Discovering')}
+                return {'event': 'changed', 'object': 'adapter', 'mac': self._adapter_macs.get(path),
+                        'props': props}
+            else:
+                return None
+            mac = device_path_to_mac(path)
+            if mac is None or not props:
+                return None
+            return {'event': 'changed', 'object': 'device', 'mac': mac, 'props': props}
+        return None
+
+    # Adapter operations
+
+    def list_adapters(self) -> List[Dict]:
+        """
+        Get list of Bluetooth adapters
+
+        Returns:
+            List of adapter dictionaries with 'id', 'name', 'mac' keys
+        """
+        objects = self.get_managed_objects()
+        adapters = []
+        for index, path in enumerate(self._adapter_paths(objects)):
+            adapter = objects[path][ADAPTER_IFACE]
+            mac = adapter.get('Address', '')
+            adapters.append({
+                'id': mac,
+                'name': adapter.get('Alias') or adapter.get('Name', ''),
+                'mac': mac,
+                'default': index == 0
+            })
+        return adapters
+
+    def get_adapter_info(self, adapter_id: Optional[str] = None) -> Dict:
+        """
+        Get detailed information about a Bluetooth adapter
+
+        Args:
+            adapter_id: MAC address of adapter (None for default)
+
+        Returns:
+            Dictionary with adapter information
+        """
+        objects = self.get_managed_objects()
+        info = {'id': adapter_id}
+        path = self._adapter_path(objects, adapter_id)
+        if path is None:
+            return info
+        adapter = objects[path][ADAPTER_IFACE]
+        info['name'] = adapter.get('Name')
+        info['alias'] = adapter.get('Alias')
+        for key in ('Powered', 'Discoverable', 'Pairable'):
+            info[key.lower()] = bool(adapter.get(key, False))
+        return info
+
+    def set_adapter_power(self, power_on: bool) -> Tuple[bool, str]:
+        """
+        Power on/off the Bluetooth adapter
+
+        Args:
+            power_on: True to power on, False to power off
+
+        Returns:
+            Tuple of (success, message)
+        """
+        try:
+            path = self._adapter_path()
+            if path is None:
+                return False, "Bluetooth adapter not ready. Try powering it off and on again."
+            self._set_property(path, ADAPTER_IFACE, 'Powered', 'b', power_on)
+            return True, f"Adapter powered {'on' if power_on else 'off'}"
+        except Exception as e:
+            logger.error(f"Power command failed: {e}")
+            return False, self._error_message(e)
+
+    def start_discovery(self) -> Tuple[bool, str]:
+        """
+        Start device discovery
+
+        Returns:
+            Tuple of (success, message)
+        """
+        try:
+            path = self._adapter_path()
+            if path is None:
+                return False, "Bluetooth adapter not ready. Try powering it off and on again."
+            self._call(path, ADAPTER_IFACE, 'StartDiscovery')
+            return True, "Discovery started"
+        except DBusErrorResponse as e:
+            if e.name == 'org.bluez.Error.InProgress':
+                return True, "Discovery already running"
+            return False, self._error_message(e)
+        except Exception as e:
+            return False, self._error_message(e)
+
+    def stop_discovery(self) -> Tuple[bool, str]:
+        """
+        Stop device discovery
+
+        Returns:
+            Tuple of (success, message)
+        """
+        try:
+            path = self._adapter_path()
+            if path is None:
+                return False, "Bluetooth adapter not ready. Try powering it off and on again."
+            self._call(path, ADAPTER_IFACE, 'StopDiscovery')
+            return True, "Discovery stopped"
+        except Exception as e:
+            return False, self._error_message(e)
+
+    # Device operations
+
+    def get_devices(self) -> List[Dict]:
+        """
+        Get list of all known devices
+
+        Returns:
+            List of device dictionaries
+        """
+        devices = []
+        for path, ifaces in self.get_managed_objects().items():
+            device = ifaces.get(DEVICE_IFACE)
+            if device:
+                devices.append({
+                    'mac': device['Address'],
+                    'name': (device.get('Alias') or device['Address']).strip()
+                })
+        return devices
+
+    def get_device_info(self, mac_address: str) -> Dict:
+        """
+        Get detailed information about a device
+
+        Args:
+            mac_address: MAC address of the device
+
+        Returns:
+            Dictionary with device information
+        """
+        try:
+            interfaces = self._on_device(mac_address, self._read_device)
+        except Exception as e:
+            return {'error': self._error_message(e)}
+        return self._device_info(mac_address, interfaces)
+
+    def get_device_snapshot(self) -> List[Dict]:
+        """
+        Get full information about every known device
+
+        Returns:
+            List of get_device_info dictionaries, from one GetManagedObjects call
+        """
+        return [
+            self._device_info(ifaces[DEVICE_IFACE]['Address'], ifaces)
+            for path, ifaces in self.get_managed_objects().items()
+            if DEVICE_IFACE in ifaces
+        ]
+
+    def _device_call(self, mac_address: str, method: str, timeout: Optional[float] = None) -> None:
+        self._on_device(mac_address, lambda path: self._call(path, DEVICE_IFACE, method, timeout=timeout))
+
+    def _set_trusted(self, mac_address: str, trusted: bool) -> None:
+        self._on_device(mac_address, lambda path: self._set_property(path, DEVICE_IFACE, 'Trusted', 'b', trusted))
+
+    def pair_device(self, mac_address: str) -> Tuple[bool, str]:
+        """
+        Pair with a device
+
+        Args:
+            mac_address: MAC address of the device
+
+        Returns:
+            Tuple of (success, message)
+        """
+        logger.info(f"Attempting to pair with device: {mac_address}")
+        try:
+            self._device_call(mac_address, 'Pair', timeout=60)
+            return True, "Device paired successfully"
+        except DBusErrorResponse as e:
+            if e.name == 'org.bluez.Error.AlreadyExists':
+                return True, "Device paired successfully"
+            logger.error(f"Pairing failed: {e}")
+            return False, self._error_message(e)
+        except Exception as e:
+            logger.error(f"Pairing failed: {e}")
+            return False, self._error_message(e)
+
+    def trust_device(self, mac_address: str) -> Tuple[bool, str]:
+        """
+        Trust a device (allow auto-reconnection)
+
+        Args:
+            mac_address: MAC address of the device
+
+        Returns:
+            Tuple of (success, message)
+        """
+        try:
+            self._set_trusted(mac_address, True)
+            return True, "Device trusted"
+        except Exception as e:
+            return False, self._error_message(e)
+
+    def untrust_device(self, mac_address: str) -> Tuple[bool, str]:
+        """
+        Untrust a device
+
+        Args:
+            mac_address: MAC address of the device
+
+        Returns:
+            Tuple of (success, message)
+        """
+        try:
+            self._set_trusted(mac_address, False)
+            return True, "Device untrusted"
+        except Exception as e:
+            return False, self._error_message(e)
+
+    def connect_device(self, mac_address: str) -> Tuple[bool, str]:
+        """
+        Connect to a device
+
+        Args:
+            mac_address: MAC address of the device
+
+        Returns:
+            Tuple of (success, message)
+        """
+        logger.info(f"Connecting to device: {mac_address}")
+        try:
+            self._device_call(mac_address, 'Connect', timeout=60)
+            return True, "Connected successfully"
+        except Exception as e:
+            logger.error(f"Connection failed: {e}")
+            return False, self._error_message(e)
+
+    def disconnect_device(self, mac_address: str) -> Tuple[bool, str]:
+        """
+        Disconnect from a device
+
+        Args:
+            mac_address: MAC address of the device
+
+        Returns:
+            Tuple of (success, message)
+        """
+        try:
+            self._device_call(mac_address, 'Disconnect')
+            return True, "Disconnected successfully"
+        except Exception as e:
+            return False, self._error_message(e)
+
+    def remove_device(self, mac_address: str) -> Tuple[bool, str]:
+        """
+        Remove a device (unpair); BlueZ disconnects it first
+
+        Args:
+            mac_address: MAC address of the device
+
+        Returns:
+            Tuple of (success, message)
+        """
+        logger.info(f"Removing device: {mac_address}")
+        try:
+            # Device objects are children of their adapter's
+            self._on_device(mac_address, lambda path: self._call(
+                path.rsplit('/', 1)[0], ADAPTER_IFACE, 'RemoveDevice', 'o', (path,)))
+            return True, "Device removed"
+        except Exception as e:
+            logger.error(f"Remove failed: {e}")
+            return False, self._error_message(e)
@@ -0,0 +1,292 @@
+"""
+Device History
+Persistent record of when devices were first seen, last seen and connected,
+in an SQLite database written in batches by a background thread
+"""
+
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from models import DeviceRegistry
+
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS devices (
+    mac TEXT PRIMARY KEY,
+    name TEXT,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    last_connected REAL,
+    last_rssi INTEGER,
+    paired INTEGER
+);
+CREATE INDEX IF NOT EXISTS devices_last_seen ON devices (last_seen);
+CREATE TABLE IF NOT EXISTS connections (
+    mac TEXT NOT NULL,
+    connected INTEGER NOT NULL,
+    at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS connections_mac_at ON connections (mac, at);
+CREATE INDEX IF NOT EXISTS connections_at ON connections (at);
+"""
+
+# Sightings of one device merge into its row: names, RSSI and paired state
+# only overwrite when known, times only move forward
+UPSERT_DEVICE = """
+INSERT INTO devices (mac, name, first_seen, last_seen, last_connected, last_rssi, paired)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (mac) DO UPDATE SET
+    name = coalesce(excluded.name, name),
+    first_seen = min(first_seen, excluded.first_seen),
+    last_seen = max(last_seen, excluded.last_seen),
+    last_connected = coalesce(max(last_connected, excluded.last_connected), last_connected, excluded.last_connected),
+    last_rssi = coalesce(excluded.last_rssi, last_rssi),
+    paired = coalesce(excluded.paired, paired)
+"""
+
+DEVICE_COLUMNS = ('mac', 'name', 'first_seen', 'last_seen', 'last_connected', 'last_rssi', 'paired')
+
+
+class _Sighting:
+    """Everything learned about one device since the last flush"""
+
+    __slots__ = ('name', 'first_seen', 'last_seen', 'last_connected', 'rssi', 'paired')
+
+    def __init__(self, now: float):
+        self.name: Optional[str] = None
+        self.first_seen = now
+        self.last_seen = now
+        self.last_connected: Optional[float] = None
+        self.rssi: Optional[int] = None
+        self.paired: Optional[bool] = None
+
+
+class HistoryStore:
+    """
+    Device sightings and connection history in SQLite
+
+    Recording only updates in-memory buffers, so it is safe from the event
+    loop and from backend event threads. Repeated sightings of a device
+    (every RSSI update during a scan) collapse into one row update per
+    flush. A writer thread commits the buffers every flush_interval seconds
+    in a single transaction. The database runs in WAL mode, so queries read
+    while the writer commits. Queries see what was flushed, at most
+    flush_interval seconds behind.
+    """
+
+    def __init__(self, path: str, devices: Optional[DeviceRegistry] = None,
+                 flush_interval: float = 1.0, retention_days: float = 30.0):
+        """
+        Args:
+            path: SQLite database file, created if missing
+            devices: Registry to fill in names and paired state that an
+                event does not carry
+            flush_interval: Seconds between batched writes
+            retention_days: Forget devices not seen and connection changes
+                older than this
+        """
+        self.path = path
+        self.devices = devices
+        self.flush_interval = flush_interval
+        self.retention = retention_days * 86400
+        self.written = 0
+        self.flushes = 0
+        self.last_flush_ms = 0.0
+        self._sightings: Dict[str, _Sighting] = {}
+        self._connections: List[Tuple[str, int, float]] = []
+        # Last recorded state per device, so repeated events add no rows
+        self._connected: Dict[str, bool] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+        self._read_lock = threading.Lock()
+        self._reader: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')
+        # With WAL, NORMAL only risks the last transactions on power loss
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.execute('PRAGMA busy_timeout=5000')
+        return connection
+
+    def start(self) -> None:
+        """Create the schema and start the writer thread"""
+        connection = self._connect()
+        connection.executescript(SCHEMA)
+        connection.commit()
+        self._reader = self._connect()
+        self._writer = threading.Thread(target=self._write_loop, args=(connection,),
+                                        name='history-writer', daemon=True)
+        self._writer.start()
+
+    def close(self) -> None:
+        """Write what is buffered and stop the writer thread"""
+        self._stop.set()
+        if self._writer is not None:
+            self._writer.join(timeout=10)
+        if self._reader is not None:
+            self._reader.close()
+
+    # Recording
+
+    def record_seen(self, mac: str, name: Optional[str] = None, rssi: Optional[int] = None,
+                    paired: Optional[bool] = None, connected: bool = False) -> None:
+        """Note that a device was seen (and what it reported)"""
+        now = time.time()
+        with self._lock:
+            sighting = self._sightings.get(mac)
+            if sighting is None:
+                sighting = self._sightings[mac] = _Sighting(now)
+            sighting.last_seen = now
+            if name is not None:
+                sighting.name = name
+            if rssi is not None:
+                sighting.rssi = rssi
+            if paired is not None:
+                sighting.paired = paired
+            if connected:
+                sighting.last_connected = now
+
+    def record_connection(self, mac: str, connected: bool) -> None:
+        """Note that a device connected or disconnected"""
+        with self._lock:
+            if self._connected.get(mac) == connected:
+                return
+            self._connected[mac] = connected
+            self._connections.append((mac, int(connected), time.time()))
+        if connected:
+            self.record_seen(mac, connected=True)
+
+    def on_event(self, event: Dict) -> None:
+        """BluetoothManager event listener feeding the history"""
+        if event['object'] != 'device':
+            return
+        if event['event'] == 'removed':
+            with self._lock:
+                self._connected.pop(event['mac'], None)
+            return
+        props = event['props']
+        if 'connected' in props:
+            self.record_connection(event['mac'], props['connected'])
+        # A disconnect or a trust change is not a sign of life; a new
+        # device, an advertisement (RSSI) or a name is
+        if event['event'] == 'new' or 'rssi' in props or 'name' in props:
+            name, paired = props.get('name'), props.get('paired')
+            record = self.devices.get(event['mac']) if self.devices is not None else None
+            if record is not None:
+                name, paired = record.alias or record.name or name, record.paired
+            self.record_seen(event['mac'], name, props.get('rssi'), paired)
+
+    # Writer
+
+    def _write_loop(self, connection: sqlite3.Connection) -> None:
+        next_prune = 0.0
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self._flush(connection)
+                if time.monotonic() >= next_prune:
+                    self._prune(connection)
+                    next_prune = time.monotonic() + 3600
+            except sqlite3.Error as e:
+                logger.error(f"Writing device history failed: {e}")
+        try:
+            self._flush(connection)
+        except sqlite3.Error as e:
+            logger.error(f"Writing device history failed: {e}")
+        connection.close()
+
+    def _flush(self, connection: sqlite3.Connection) -> None:
+        with self._lock:
+            sightings, self._sightings = self._sightings, {}
+            connections, self._connections = self._connections, []
+        if not sightings and not connections:
+            return
+        started = time.perf_counter()
+        with connection:
+            connection.executemany(UPSERT_DEVICE, [
+                (mac, s.name, s.first_seen, s.last_seen, s.last_connected, s.rssi,
+                 None if s.paired is None else int(s.paired))
+                for mac, s in sightings.items()
+            ])
+            connection.executemany('INSERT INTO connections (mac, connected, at) VALUES (?, ?, ?)',
+                                   connections)
+        self.written += len(sightings) + len(connections)
+        self.flushes += 1
+        self.last_flush_ms = (time.perf_counter() - started) * 1000
+
+    def _prune(self, connection: sqlite3.Connection) -> None:
+        cutoff = time.time() - self.retention
+        with connection:
+            connection.execute('DELETE FROM devices WHERE last_seen < ?', (cutoff,))
+            connection.execute('DELETE FROM connections WHERE at < ?', (cutoff,))
+
+    # Queries
+
+    def _query(self, sql: str, parameters: tuple) -> List[tuple]:
+        with self._read_lock:
+            return self._reader.execute(sql, parameters).fetchall()
+
+    def seen_since(self, since: float, limit: int = 500) -> List[Dict]:
+        """
+        Devices seen after a point in time, most recently seen first
+
+        Args:
+            since: Unix timestamp
+            limit: Most devices to return
+
+        Returns:
+            Device rows as dictionaries
+        """
+        rows = self._query(f'SELECT {", ".join(DEVICE_COLUMNS)} FROM devices '
+                           'WHERE last_seen >= ? ORDER BY last_seen DESC LIMIT ?', (since, limit))
+        return [dict(zip(DEVICE_COLUMNS, row)) for row in rows]
+
+    def device(self, mac: str) -> Optional[Dict]:
+        """A device's row, or None if it was never seen"""
+        rows = self._query(f'SELECT {", ".join(DEVICE_COLUMNS)} FROM devices WHERE mac = ?', (mac,))
+        return dict(zip(DEVICE_COLUMNS, rows[0])) if rows else None
+
+    def connection_history(self, mac: str, limit: int = 100) -> List[Dict]:
+        """
+        A device's connects and disconnects, newest first
+
+        Args:
+            mac: MAC address of the device
+            limit: Most changes to return
+
+        Returns:
+            List of {'connected', 'at'} dictionaries
+        """
+        rows = self._query('SELECT connected, at FROM connections WHERE mac = ? '
+                           'ORDER BY at DESC LIMIT ?', (mac, limit))
+        return [{'connected': bool(connected), 'at': at} for connected, at in rows]
+
+    async def seen_since_async(self, since: float, limit: int = 500) -> List[Dict]:
+        return await asyncio.get_running_loop().run_in_executor(None, self.seen_since, since, limit)
+
+    async def device_history_async(self, mac: str, limit: int = 100) -> Optional[Dict]:
+        """A device's row with its connection history, or None if never seen"""
+        def read():
+            device = self.device(mac)
+            if device is not None:
+                device['connections'] = self.connection_history(mac, limit)
+            return device
+        return await asyncio.get_running_loop().run_in_executor(None, read)
+
+    def stats(self) -> Dict:
+        """Buffered and written rows, and how long the last batch took"""
+        with self._lock:
+            pending = len(self._sightings) + len(self._connections)
+        return {
+            'pending': pending,
+            'written': self.written,
+            'flushes': self.flushes,
+            'last_flush_ms': round(self.last_flush_ms, 1),
+        }
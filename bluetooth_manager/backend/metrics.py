@@ -0,0 +1,242 @@
+"""
+Metrics
+Minimal Prometheus counters and histograms, cheap enough to record on every
+command and request, rendered in the Prometheus text format for GET /metrics
+"""
+
+import asyncio
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+
+# Seconds, from a cached read to a slow pairing
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count per label combination"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        """Add to the count for the given label values"""
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self) -> Iterator[str]:
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} counter'
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield f'{self.name}{_labels(self.labelnames, labels)} {_number(value)}'
+
+
+class Histogram:
+    """
+    Distribution of observed values per label combination
+
+    observe() only bumps one bucket; the cumulative counts Prometheus
+    expects are summed up when the metrics are rendered.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # Label values -> [per-bucket counts (last one is +Inf), sum]
+        self._values: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        """Record one value for the given label values"""
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def collect(self) -> Iterator[str]:
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} histogram'
+        with self._lock:
+            values = [(labels, list(counts), total) for labels, (counts, total) in self._values.items()]
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                yield f'{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}'
+            yield f'{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}'
+            yield f'{self.name}_count{_labels(self.labelnames, labels)} {cumulative}'
+
+
+def gauge(name: str, documentation: str, samples: Union[float, Dict[Tuple[str, ...], float]],
+          labelnames: Sequence[str] = (), kind: str = 'gauge') -> List[str]:
+    """
+    Render a value read at scrape time, e.g. from one of the stats() methods
+
+    Args:
+        name: Metric name
+        documentation: HELP text
+        samples: A single value, or label values -> value
+        labelnames: Label names for the keys of samples
+        kind: Prometheus type, 'gauge' or 'counter'
+
+    Returns:
+        Lines in the Prometheus text format
+    """
+    lines = [f'# HELP {name} {documentation}', f'# TYPE {name} {kind}']
+    if not isinstance(samples, dict):
+        samples = {(): samples}
+    for labels, value in samples.items():
+        lines.append(f'{name}{_labels(labelnames, labels)} {_number(value)}')
+    return lines
+
+
+class Registry:
+    """The metrics rendered by GET /metrics"""
+
+    def __init__(self):
+        self._metrics: List[Union[Counter, Histogram]] = []
+        self._collectors: List[Callable[[], Iterable[str]]] = []
+
+    def register(self, metric):
+        """Add a Counter or Histogram; returns it for assignment"""
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[str]]) -> None:
+        """Add a function producing scrape-time lines, e.g. with gauge()"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        for collector in self._collectors:
+            lines.extend(collector())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+COMMAND_SECONDS = REGISTRY.register(Histogram(
+    'bluetoothctl_command_duration_seconds', 'Time bluetoothctl took to answer a command, by command verb',
+    ('command',)))
+COMMAND_TIMEOUTS = REGISTRY.register(Counter(
+    'bluetoothctl_command_timeouts_total', 'bluetoothctl commands that did not finish in time, by command verb',
+    ('command',)))
+DBUS_CALL_SECONDS = REGISTRY.register(Histogram(
+    'bluez_dbus_call_duration_seconds', 'Time BlueZ took to answer a D-Bus method call, by method',
+    ('method',)))
+OPERATION_ERRORS = REGISTRY.register(Counter(
+    'bluetooth_errors_total', 'Bluetooth errors reported to users, by category',
+    ('category',)))
+SNAPSHOT_SECONDS = REGISTRY.register(Histogram(
+    'bluetooth_device_snapshot_duration_seconds', 'Time to read the state of every known device from BlueZ'))
+SNAPSHOT_DEVICES = REGISTRY.register(Histogram(
+    'bluetooth_device_snapshot_devices', 'Devices returned per device snapshot',
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)))
+SCAN_DISCOVERED = REGISTRY.register(Counter(
+    'bluetooth_scan_devices_discovered_total', 'Devices reported by scans'))
+HTTP_SECONDS = REGISTRY.register(Histogram(
+    'http_request_duration_seconds', 'Time to handle an HTTP request, by route',
+    ('method', 'route', 'status')))
+BROADCAST_SECONDS = REGISTRY.register(Histogram(
+    'websocket_broadcast_duration_seconds', 'Time to queue a message for every WebSocket client',
+    buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01)))
+EVENT_LOOP_LAG = REGISTRY.register(Histogram(
+    'event_loop_lag_seconds', 'How much later than scheduled the event loop ran a periodic timer',
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)))
+
+
+async def watch_event_loop_lag(interval: float = 0.1) -> None:
+    """
+    Sample event loop lag into EVENT_LOOP_LAG until cancelled
+
+    A sleep that wakes up late means something held the loop: blocking
+    code in a handler, or more callbacks than it can keep up with.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(loop.time() - started - interval, 0.0))
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every HTTP request into HTTP_SECONDS
+
+    Requests are labelled with the route template (/api/devices/{mac}/info,
+    not the MAC address) the router matched, so the label set stays small.
+    """
+
+    def __init__(self, app, routes: Optional[Callable[[], Iterable]] = None):
+        """
+        Args:
+            app: The ASGI app to wrap
+            routes: Returns the application's routes, for their templates
+        """
+        self.app = app
+        self.routes = routes
+        self._templates: Optional[Dict[object, str]] = None
+
+    def _route(self, scope: Dict) -> str:
+        if self._templates is None and self.routes is not None:
+            # Routes and mounts are all registered by the first request
+            self._templates = {
+                getattr(route, 'endpoint', None) or getattr(route, 'app', None): route.path
+                for route in self.routes()
+            }
+        return (self._templates or {}).get(scope.get('endpoint'), 'unmatched')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_SECONDS.observe(time.perf_counter() - started,
+                                 scope['method'], self._route(scope), str(status))
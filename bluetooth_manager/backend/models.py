@@ -0,0 +1,321 @@
+"""
+Device and Adapter Records
+Compact, immutable records for Bluetooth state and a bounded registry that
+holds the latest record per MAC address
+"""
+
+import sys
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, fields, replace
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+def intern_mac(mac: str) -> str:
+    """
+    Intern a MAC address so every record and registry key shares one string
+
+    Args:
+        mac: MAC address in XX:XX:XX:XX:XX:XX form
+
+    Returns:
+        The interned MAC address
+    """
+    return sys.intern(mac)
+
+
+# get_device_info keys that are stored under a different attribute name
+DEVICE_ATTRIBUTES = {'class': 'device_class'}
+DEVICE_KEYS = {attribute: key for key, attribute in DEVICE_ATTRIBUTES.items()}
+
+
+@dataclass(frozen=True, slots=True)
+class DeviceRecord:
+    """
+    State of one Bluetooth device
+
+    Fields are None when BlueZ did not report them, so a record serializes
+    back to exactly the keys get_device_info returned.
+    """
+
+    mac: str
+    name: Optional[str] = None
+    alias: Optional[str] = None
+    paired: Optional[bool] = None
+    bonded: Optional[bool] = None
+    trusted: Optional[bool] = None
+    blocked: Optional[bool] = None
+    connected: Optional[bool] = None
+    battery: Optional[int] = None
+    rssi: Optional[int] = None
+    device_class: Optional[str] = None
+    icon: Optional[str] = None
+    uuids: Optional[Tuple[Tuple[str, str], ...]] = None
+
+    @classmethod
+    def from_info(cls, info: Dict) -> 'DeviceRecord':
+        """
+        Build a record from a get_device_info dictionary
+
+        Args:
+            info: Dictionary as returned by get_device_info
+
+        Returns:
+            The equivalent DeviceRecord
+        """
+        values = {}
+        for key, value in info.items():
+            if key == 'mac':
+                value = intern_mac(value)
+            elif key == 'uuids':
+                value = tuple((uuid['uuid'], uuid['name']) for uuid in value)
+            values[DEVICE_ATTRIBUTES.get(key, key)] = value
+        return cls(**{key: value for key, value in values.items() if key in _DEVICE_FIELDS})
+
+    def merge(self, props: Dict) -> 'DeviceRecord':
+        """
+        Apply changed properties, e.g. from a change event
+
+        Args:
+            props: Changed values using get_device_info keys
+
+        Returns:
+            A new record, or this one if nothing changed
+        """
+        changes = {}
+        for key, value in props.items():
+            attribute = DEVICE_ATTRIBUTES.get(key, key)
+            if attribute == 'uuids' and value is not None:
+                value = tuple((uuid['uuid'], uuid['name']) for uuid in value)
+            if attribute in _DEVICE_FIELDS and attribute != 'mac' and getattr(self, attribute) != value:
+                changes[attribute] = value
+        return replace(self, **changes) if changes else self
+
+    @property
+    def display_name(self) -> str:
+        """Name shown to users: alias, else name, else the MAC address"""
+        return self.alias or self.name or self.mac
+
+    def to_dict(self) -> Dict:
+        """Serialize to the get_device_info dictionary shape"""
+        info = {'mac': self.mac}
+        for attribute in _DEVICE_FIELDS:
+            value = getattr(self, attribute)
+            if value is None or attribute == 'mac':
+                continue
+            if attribute == 'uuids':
+                value = [{'uuid': uuid, 'name': name} for uuid, name in value]
+            info[DEVICE_KEYS.get(attribute, attribute)] = value
+        return info
+
+    def to_summary(self) -> Dict:
+        """Serialize to the GET /api/devices list entry shape"""
+        return {
+            'mac': self.mac,
+            'name': self.display_name,
+            'connected': bool(self.connected),
+            'paired': bool(self.paired),
+            'rssi': self.rssi
+        }
+
+
+_DEVICE_FIELDS = tuple(field.name for field in fields(DeviceRecord))
+
+
+@dataclass(frozen=True, slots=True)
+class AdapterRecord:
+    """State of one Bluetooth adapter"""
+
+    mac: str
+    name: str = ''
+    default: bool = False
+    alias: Optional[str] = None
+    powered: Optional[bool] = None
+    discoverable: Optional[bool] = None
+    pairable: Optional[bool] = None
+    discovering: Optional[bool] = None
+
+    @classmethod
+    def from_dict(cls, adapter: Dict) -> 'AdapterRecord':
+        """
+        Build a record from a list_adapters entry
+
+        Args:
+            adapter: Dictionary with 'mac', 'name' and 'default' keys
+
+        Returns:
+            The equivalent AdapterRecord
+        """
+        return cls(mac=intern_mac(adapter['mac']), name=adapter.get('name', ''),
+                   default=adapter.get('default', False))
+
+    def merge(self, props: Dict) -> 'AdapterRecord':
+        """
+        Apply changed adapter properties (powered, discoverable, ...)
+
+        Args:
+            props: Changed values, e.g. from get_adapter_info or a change event
+
+        Returns:
+            A new record, or this one if nothing changed
+        """
+        changes = {
+            key: value for key, value in props.items()
+            if key in _ADAPTER_FIELDS and key != 'mac' and getattr(self, key) != value
+        }
+        return replace(self, **changes) if changes else self
+
+    def to_dict(self) -> Dict:
+        """Serialize to the list_adapters entry shape"""
+        return {'id': self.mac, 'name': self.name, 'mac': self.mac, 'default': self.default}
+
+
+_ADAPTER_FIELDS = tuple(field.name for field in fields(AdapterRecord))
+
+
+class DeviceRegistry:
+    """
+    Latest DeviceRecord per MAC address, bounded with LRU eviction
+
+    Busy places can have hundreds of BLE advertisers; once max_size devices
+    are known, the scan-only device that was touched least recently is
+    dropped, so paired, trusted and connected devices stay. An evicted device
+    still exists in BlueZ, so it is not reported as removed.
+    Thread-safe, since event threads and the executor both update it.
+
+    Every change that alters a record, adds one or removes one increments
+    `version`, and the registry remembers the version each device last
+    changed at, so readers can ask what changed since a version they saw.
+    """
+
+    def __init__(self, max_size: int = 1024):
+        """
+        Args:
+            max_size: Maximum number of devices to keep
+        """
+        self.max_size = max(max_size, 1)
+        self.evictions = 0
+        self.version = 0
+        # Versions older than this may have lost removals to trimming
+        self.horizon = 0
+        self._records: 'OrderedDict[str, DeviceRecord]' = OrderedDict()
+        self._changed: Dict[str, int] = {}
+        self._removed: 'OrderedDict[str, int]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __contains__(self, mac: str) -> bool:
+        return mac in self._records
+
+    def __iter__(self) -> Iterator[DeviceRecord]:
+        return iter(self.records())
+
+    def get(self, mac: str) -> Optional[DeviceRecord]:
+        """Look up a device and mark it as recently used"""
+        with self._lock:
+            record = self._records.get(mac)
+            if record is not None:
+                self._records.move_to_end(mac)
+            return record
+
+    def put(self, record: DeviceRecord) -> DeviceRecord:
+        """
+        Store a record, replacing any earlier one for the same device
+
+        Args:
+            record: The device's current state
+
+        Returns:
+            The stored record
+        """
+        with self._lock:
+            self._store(record)
+            return record
+
+    def update(self, mac: str, props: Dict) -> DeviceRecord:
+        """
+        Merge changed properties into a device's record, creating it if needed
+
+        Args:
+            mac: MAC address of the device
+            props: Changed values using get_device_info keys
+
+        Returns:
+            The updated record
+        """
+        with self._lock:
+            record = self._records.get(mac)
+            if record is None:
+                record = DeviceRecord(mac=intern_mac(mac))
+            record = record.merge(props)
+            self._store(record)
+            return record
+
+    def discard(self, mac: str) -> Optional[DeviceRecord]:
+        """Forget a device, returning its last record if it was known"""
+        with self._lock:
+            record = self._records.pop(mac, None)
+            if record is not None:
+                self._tombstone(mac)
+            return record
+
+    def clear(self) -> None:
+        """Forget every device"""
+        with self._lock:
+            for mac in list(self._records):
+                del self._records[mac]
+                self._tombstone(mac)
+
+    def records(self) -> List[DeviceRecord]:
+        """Snapshot of all records, least recently used first"""
+        with self._lock:
+            return list(self._records.values())
+
+    def changed_at(self, mac: str) -> int:
+        """Version at which a device last changed (0 if unknown)"""
+        return self._changed.get(mac, 0)
+
+    def removed_since(self, version: int) -> List[str]:
+        """
+        Devices removed after a version
+
+        Args:
+            version: A version previously read from `version`
+
+        Returns:
+            MAC addresses removed since then; only complete when version is
+            not older than `horizon`
+        """
+        with self._lock:
+            return [mac for mac, removed_at in self._removed.items() if removed_at > version]
+
+    def _store(self, record: DeviceRecord) -> None:
+        previous = self._records.get(record.mac)
+        self._records[record.mac] = record
+        self._records.move_to_end(record.mac)
+        if previous != record:
+            self.version += 1
+            self._changed[record.mac] = self.version
+            self._removed.pop(record.mac, None)
+        while len(self._records) > self.max_size:
+            self._evict()
+
+    def _evict(self) -> None:
+        # Least recently used scan-only device; any device if none is left
+        mac = next((mac for mac, record in self._records.items()
+                    if not (record.paired or record.trusted or record.connected)),
+                   next(iter(self._records)))
+        del self._records[mac]
+        self._changed.pop(mac, None)
+        self.evictions += 1
+
+    def _tombstone(self, mac: str) -> None:
+        self.version += 1
+        self._changed.pop(mac, None)
+        self._removed[mac] = self.version
+        self._removed.move_to_end(mac)
+        while len(self._removed) > self.max_size:
+            _, removed_at = self._removed.popitem(last=False)
+            self.horizon = removed_at
@@ -0,0 +1,283 @@
+"""
+bluetoothctl Output Parsers
+Single-pass parsers for the text bluetoothctl prints for info, show, devices
+and list, and for its [NEW]/[CHG]/[DEL] notification lines
+"""
+
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from profiling import timed
+
+
+def _yes_no(value: str) -> bool:
+    return value.lower() == 'yes'
+
+
+def _number(value: str) -> int:
+    """Parse '0x64 (100)', '0xffffffc4 (-60)' or a bare decimal such as '-60'"""
+    start = value.find('(')
+    if start >= 0:
+        return int(value[start + 1:value.index(')', start)])
+    return int(value)
+
+
+def _hex_word(value: str) -> str:
+    return value.split(' ', 1)[0]
+
+
+# Property keys as printed by bluetoothctl, and the get_device_info keys they
+# map to with the conversion applied to the value
+DEVICE_FIELDS: Dict[str, Tuple[str, Callable[[str], object]]] = {
+    'Name': ('name', str),
+    'Alias': ('alias', str),
+    'Paired': ('paired', _yes_no),
+    'Bonded': ('bonded', _yes_no),
+    'Trusted': ('trusted', _yes_no),
+    'Blocked': ('blocked', _yes_no),
+    'Connected': ('connected', _yes_no),
+    'Battery Percentage': ('battery', _number),
+    'RSSI': ('rssi', _number),
+    'Class': ('class', _hex_word),
+    'Icon': ('icon', str),
+}
+
+ADAPTER_FIELDS: Dict[str, Tuple[str, Callable[[str], object]]] = {
+    'Name': ('name', str),
+    'Alias': ('alias', str),
+    'Powered': ('powered', _yes_no),
+    'Discoverable': ('discoverable', _yes_no),
+    'Pairable': ('pairable', _yes_no),
+}
+
+MAC_LENGTH = 17
+MAC_CHARS = frozenset('0123456789ABCDEF:')
+
+
+def _is_mac(text: str) -> bool:
+    """Check for an upper-case XX:XX:XX:XX:XX:XX address without a regex"""
+    if len(text) != MAC_LENGTH:
+        return False
+    for i in range(2, MAC_LENGTH, 3):
+        if text[i] != ':':
+            return False
+    return frozenset(text) <= MAC_CHARS
+
+
+def _split_property(line: str) -> Tuple[str, str]:
+    """Split an indented 'Key: value' line; the key is '' if there is none"""
+    key, sep, value = line.strip().partition(': ')
+    if not sep:
+        # "Key:" with an empty value
+        if key.endswith(':'):
+            return key[:-1], ''
+        return '', ''
+    return key, value
+
+
+def parse_property(text: str) -> Optional[Tuple[str, object]]:
+    """
+    Parse a single 'Key: value' property into a get_device_info item
+
+    Args:
+        text: Property text, e.g. 'RSSI: 0xffffffc4 (-60)'
+
+    Returns:
+        Tuple of (key, value), or None for properties get_device_info ignores
+    """
+    key, value = _split_property(text)
+    field = DEVICE_FIELDS.get(key)
+    if field is None:
+        return None
+    name, convert = field
+    try:
+        return name, convert(value)
+    except ValueError:
+        return None
+
+
+def _parse_block(lines: Iterator[str], fields: Dict, info: Dict) -> Dict:
+    """Fill info from one object's property lines, first occurrence wins"""
+    uuids = info.get('uuids')
+    for line in lines:
+        key, sep, value = line.strip().partition(': ')
+        field = fields.get(key)
+        if field is not None:
+            name, convert = field
+            if name not in info:
+                try:
+                    info[name] = convert(value)
+                except ValueError:
+                    pass
+        elif key == 'UUID' and uuids is not None:
+            # "UUID: Audio Sink                (0000110b-0000-...)"
+            label, _, uuid = value.rpartition(' (')
+            if uuid.endswith(')'):
+                uuids.append({'uuid': uuid[:-1], 'name': label.strip()})
+    return info
+
+
+def _property_lines(text: str) -> Iterator[str]:
+    """Lines of command output without interleaved notifications"""
+    for line in text.split('\n'):
+        if line and line[0] != '[':
+            yield line
+
+
+@timed('parse')
+def parse_device_info(mac_address: str, text: str) -> Dict:
+    """
+    Parse the output of 'info MAC'
+
+    Args:
+        mac_address: MAC address of the device
+        text: Output of the info command
+
+    Returns:
+        Dictionary with device information
+    """
+    return _parse_block(_property_lines(text), DEVICE_FIELDS, {'mac': mac_address, 'uuids': []})
+
+
+@timed('parse')
+def parse_device_info_blocks(text: str) -> Dict[str, Dict]:
+    """
+    Parse the concatenated output of several 'info MAC' commands
+
+    Args:
+        text: Output of a batch of info commands
+
+    Returns:
+        Dictionary of MAC address to get_device_info dictionary
+    """
+    blocks: Dict[str, List[str]] = {}
+    current: Optional[List[str]] = None
+    for line in _property_lines(text):
+        if line.startswith('Device '):
+            # "Device MAC (public)" starts a block; "Device MAC not available"
+            # means the device went away between 'devices' and 'info'
+            mac = line[7:7 + MAC_LENGTH]
+            rest = line[7 + MAC_LENGTH:]
+            if _is_mac(mac) and rest in ('', ' (public)', ' (random)'):
+                current = blocks.setdefault(mac, [])
+            else:
+                current = None
+        elif current is not None:
+            current.append(line)
+    return {
+        mac: _parse_block(iter(lines), DEVICE_FIELDS, {'mac': mac, 'uuids': []})
+        for mac, lines in blocks.items()
+    }
+
+
+@timed('parse')
+def parse_adapter_info(adapter_id: Optional[str], text: str) -> Dict:
+    """
+    Parse the output of 'show [MAC]'
+
+    Args:
+        adapter_id: MAC address of adapter (None for default)
+        text: Output of the show command
+
+    Returns:
+        Dictionary with adapter information
+    """
+    return _parse_block(_property_lines(text), ADAPTER_FIELDS, {'id': adapter_id})
+
+
+def _object_lines(text: str, kind: str) -> Iterator[Tuple[str, str]]:
+    """Yield (mac, rest) for 'Kind MAC rest' lines such as 'Device MAC Name'"""
+    prefix = kind + ' '
+    start = len(prefix)
+    for line in text.split('\n'):
+        if line.startswith(prefix) and line[start + MAC_LENGTH:start + MAC_LENGTH + 1] == ' ':
+            mac = line[start:start + MAC_LENGTH]
+            if _is_mac(mac):
+                yield mac, line[start + MAC_LENGTH + 1:]
+
+
+@timed('parse')
+def parse_devices(text: str) -> List[Dict]:
+    """
+    Parse the output of 'devices'
+
+    Args:
+        text: Output of the devices command
+
+    Returns:
+        List of dictionaries with 'mac' and 'name' keys
+    """
+    return [{'mac': mac, 'name': name.strip()} for mac, name in _object_lines(text, 'Device')]
+
+
+@timed('parse')
+def parse_controllers(text: str) -> List[Dict]:
+    """
+    Parse the output of 'list'
+
+    Args:
+        text: Output of the list command
+
+    Returns:
+        List of adapter dictionaries with 'id', 'name', 'mac', 'default' keys
+    """
+    adapters = []
+    for mac, rest in _object_lines(text, 'Controller'):
+        # Format: "Controller MAC_ADDRESS NAME [default]"
+        is_default = rest.endswith(' [default]')
+        if is_default:
+            rest = rest[:-len(' [default]')]
+        adapters.append({
+            'id': mac,
+            'name': rest.strip(),
+            'mac': mac,
+            'default': is_default
+        })
+    return adapters
+
+
+def parse_event(line: str) -> Optional[Dict]:
+    """
+    Translate a bluetoothctl notification line into an event
+
+    Args:
+        line: A cleaned '[NEW]', '[CHG]' or '[DEL]' line
+
+    Returns:
+        Event dictionary with 'event', 'object', 'mac' and 'props' keys, or
+        None for notifications about other objects and properties
+    """
+    tag = line[:6]
+    if tag == '[NEW] ':
+        kind = 'new'
+    elif tag == '[CHG] ':
+        kind = 'changed'
+    elif tag == '[DEL] ':
+        kind = 'removed'
+    else:
+        return None
+
+    obj, _, rest = line[6:].partition(' ')
+    mac, _, text = rest.partition(' ')
+    if not _is_mac(mac):
+        return None
+
+    if obj == 'Device':
+        if kind == 'new':
+            props = {'name': text.strip()}
+        elif kind == 'removed':
+            props = {}
+        else:
+            prop = parse_property(text)
+            if prop is None:
+                return None
+            props = dict([prop])
+        return {'event': kind, 'object': 'device', 'mac': mac, 'props': props}
+
+    if obj == 'Controller' and kind == 'changed':
+        key, value = _split_property(text)
+        if not key or value not in ('yes', 'no'):
+            return None
+        return {'event': kind, 'object': 'adapter', 'mac': mac,
+                'props': {key.lower(): value == 'yes'}}
+
+    return None
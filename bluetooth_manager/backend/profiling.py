@@ -0,0 +1,169 @@
+"""
+Request Profiling
+Per-request timing broken down by phase (queueing, bluetoothctl spawn, BlueZ
+round trips, parsing, serialization) for Server-Timing headers and the
+slow-request log, and an on-demand sampling profiler
+"""
+
+import functools
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional
+
+
+logger = logging.getLogger(__name__)
+
+# Phases in the order they are reported
+PHASES = ('queue', 'spawn', 'bluez', 'parse', 'serialize')
+
+
+class RequestTimings:
+    """Seconds spent per phase while handling one request"""
+
+    __slots__ = ('started', 'phases', '_lock')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        # Bulk requests record from several worker threads at once
+        self._lock = threading.Lock()
+
+    def add(self, phase: str, seconds: float) -> None:
+        with self._lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def breakdown(self) -> Dict[str, float]:
+        """Milliseconds per phase, plus 'app' for the rest and 'total'"""
+        total = time.perf_counter() - self.started
+        with self._lock:
+            phases = dict(self.phases)
+        result = {phase: round(phases[phase] * 1000, 2) for phase in PHASES if phase in phases}
+        # Phases from parallel threads can add up to more than the wall time
+        result['app'] = round(max(total - sum(phases.values()), 0.0) * 1000, 2)
+        result['total'] = round(total * 1000, 2)
+        return result
+
+    def server_timing(self) -> str:
+        """The breakdown as a Server-Timing header value"""
+        return ', '.join(f'{phase};dur={ms}' for phase, ms in self.breakdown().items())
+
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar('request_timings', default=None)
+
+
+def record(phase: str, seconds: float) -> None:
+    """
+    Add time to a phase of the request being handled, if any
+
+    Worker threads see the request through the context copied by
+    BluetoothManager._run_blocking; outside a request this is a no-op.
+    """
+    timings = _current.get()
+    if timings is not None:
+        timings.add(phase, seconds)
+
+
+def timed(phase: str) -> Callable[[Callable], Callable]:
+    """Decorator recording a function's run time under a phase"""
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(phase, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+class TimingMiddleware:
+    """
+    ASGI middleware collecting RequestTimings for every HTTP request
+
+    Adds a Server-Timing header when enabled, and logs requests slower than
+    slow_request_ms with their breakdown. With both off it passes requests
+    straight through.
+    """
+
+    def __init__(self, app, server_timing: Callable[[], bool],
+                 slow_request_ms: Callable[[], float]):
+        """
+        Args:
+            app: The ASGI app to wrap
+            server_timing: Returns whether to add Server-Timing headers
+            slow_request_ms: Returns the slow-request log threshold (0: off)
+        """
+        self.app = app
+        self.server_timing = server_timing
+        self.slow_request_ms = slow_request_ms
+
+    async def __call__(self, scope, receive, send):
+        header = self.server_timing()
+        slow_ms = self.slow_request_ms()
+        if scope['type'] != 'http' or not (header or slow_ms):
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _current.set(timings)
+
+        async def send_wrapper(message):
+            if header and message['type'] == 'http.response.start':
+                message.setdefault('headers', [])
+                message['headers'] = list(message['headers']) + [
+                    (b'server-timing', timings.server_timing().encode())
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            if slow_ms:
+                breakdown = timings.breakdown()
+                if breakdown['total'] >= slow_ms:
+                    phases = ' '.join(f'{phase}={ms}ms' for phase, ms in breakdown.items())
+                    logger.warning(f"Slow request {scope['method']} {scope['path']}: {phases}")
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+def sample_stacks(seconds: float, interval: float) -> str:
+    """
+    Sample every thread's stack for a while
+
+    Args:
+        seconds: How long to sample
+        interval: Seconds between samples
+
+    Returns:
+        Collapsed stacks ('thread;outer;...;inner count' per line), the
+        input format of flamegraph.pl and speedscope
+    """
+    own = threading.get_ident()
+    stacks: Counter = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            frames = []
+            while frame is not None:
+                frames.append(_frame_name(frame))
+                frame = frame.f_back
+            frames.append(names.get(ident, f'thread-{ident}'))
+            stacks[';'.join(reversed(frames))] += 1
+        time.sleep(interval)
+    return ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
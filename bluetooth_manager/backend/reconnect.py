@@ -0,0 +1,235 @@
+"""
+Auto-Reconnect Supervisor
+Brings trusted devices back when they drop, retrying with exponential
+backoff and jitter, without getting in the way of user actions
+"""
+
+import asyncio
+import logging
+import random
+import time
+from typing import Dict, Optional, Set
+
+from bluetooth_manager import BluetoothManager
+from scheduler import BACKGROUND
+
+
+logger = logging.getLogger(__name__)
+
+
+class _Watch:
+    """Reconnect state of one disconnected device"""
+
+    __slots__ = ('disconnected_at', 'attempts', 'due')
+
+    def __init__(self, disconnected_at: float, due: float):
+        self.disconnected_at = disconnected_at
+        self.attempts = 0
+        self.due = due
+
+
+class ReconnectSupervisor:
+    """
+    Reconnects paired, trusted devices that are not connected
+
+    Attempts back off exponentially per device (with jitter, so devices that
+    dropped together do not retry in lockstep) and start over when the
+    adapter powers on. Across all devices, at most one attempt runs at a
+    time, no faster than attempts_per_minute, and none while a scan or any
+    other device operation is in progress.
+
+    Devices the user disconnected or removed are left alone until they
+    connect again; callers mark them with pause().
+    """
+
+    # Seconds to wait before trying again while the user is busy
+    BUSY_RETRY = 5.0
+
+    def __init__(self, manager: BluetoothManager, initial_delay: float = 2.0,
+                 max_delay: float = 300.0, attempts_per_minute: float = 6.0):
+        """
+        Args:
+            manager: Source of device state and change events
+            initial_delay: Seconds before the first attempt after a drop
+            max_delay: Longest backoff between attempts on one device
+            attempts_per_minute: Global limit on reconnect attempts
+        """
+        self.manager = manager
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.attempt_interval = 60.0 / attempts_per_minute
+        self.watching: Dict[str, _Watch] = {}
+        self.paused: Set[str] = set()
+        self.powered = True
+        self.attempts = 0
+        self.failures = 0
+        self.reconnects = 0
+        self._reconnect_total = 0.0
+        self._reconnect_max = 0.0
+        self._last_attempt = 0.0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Watch the devices that are disconnected now and follow changes"""
+        self._loop = asyncio.get_running_loop()
+        for record in self.manager.devices.records():
+            if record.paired and record.trusted and record.connected is False:
+                self._watch(record.mac)
+        self.manager.add_event_listener(self._on_event)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop reconnecting, waiting for an attempt in progress to be cancelled"""
+        self.manager.remove_event_listener(self._on_event)
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def pause(self, mac: str) -> None:
+        """Leave a device alone until it connects again, e.g. before a user disconnect"""
+        self.paused.add(mac)
+        self.watching.pop(mac, None)
+
+    def resume(self, mac: str) -> None:
+        """Undo pause(), e.g. when the user's disconnect failed"""
+        self.paused.discard(mac)
+        record = self.manager.devices.get(mac)
+        if record is not None and record.paired and record.trusted and record.connected is False:
+            self._watch(mac)
+
+    def _backoff(self, attempts: int) -> float:
+        """Delay before the next attempt: exponential, with the upper half jittered"""
+        delay = min(self.initial_delay * 2 ** attempts, self.max_delay)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _watch(self, mac: str) -> None:
+        if mac in self.watching or mac in self.paused:
+            return
+        now = time.monotonic()
+        self.watching[mac] = _Watch(now, now + self._backoff(0))
+        self._wakeup.set()
+
+    def _connected(self, mac: str) -> None:
+        self.paused.discard(mac)
+        watch = self.watching.pop(mac, None)
+        if watch is None:
+            return
+        elapsed = time.monotonic() - watch.disconnected_at
+        self.reconnects += 1
+        self._reconnect_total += elapsed
+        self._reconnect_max = max(self._reconnect_max, elapsed)
+        logger.info(f"{mac} reconnected after {elapsed:.1f}s ({watch.attempts} attempts)")
+
+    def _on_event(self, event: Dict) -> None:
+        """Event listener, called from a backend thread"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._handle_event, event)
+
+    def _handle_event(self, event: Dict) -> None:
+        mac, props = event['mac'], event['props']
+        if event['object'] == 'adapter':
+            if props.get('powered') is True and not self.powered:
+                self._powered_on()
+            if 'powered' in props:
+                self.powered = props['powered']
+            return
+
+        if event['event'] == 'removed':
+            self.watching.pop(mac, None)
+            self.paused.discard(mac)
+        elif props.get('connected') is True:
+            self._connected(mac)
+        elif props.get('connected') is False or props.get('trusted') is False:
+            record = self.manager.devices.get(mac)
+            if record is not None and record.paired and record.trusted and not record.connected:
+                self._watch(mac)
+            else:
+                self.watching.pop(mac, None)
+
+    def _powered_on(self) -> None:
+        """The adapter came back: retry every device soon, from a fresh backoff"""
+        now = time.monotonic()
+        for watch in self.watching.values():
+            watch.attempts = 0
+            watch.due = now + self._backoff(0)
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            now = time.monotonic()
+            due = min((watch.due for watch in self.watching.values()), default=None)
+            if due is None or due > now:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), None if due is None else due - now)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            # Never compete with the user or with ourselves
+            wait = self._last_attempt + self.attempt_interval - now
+            if self.manager.scanning or self.manager.scheduler.busy or not self.powered:
+                wait = max(wait, self.BUSY_RETRY)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+
+            mac = min(self.watching, key=lambda m: self.watching[m].due)
+            try:
+                await self._attempt(mac)
+            except Exception as e:
+                logger.warning(f"Reconnect attempt for {mac} failed: {e}")
+
+    async def _attempt(self, mac: str) -> None:
+        watch = self.watching[mac]
+        self._last_attempt = time.monotonic()
+
+        info = await self.manager.get_device_info_async(mac)
+        if 'error' in info or not info.get('paired') or not info.get('trusted'):
+            self.watching.pop(mac, None)
+            return
+        if info.get('connected'):
+            self._connected(mac)
+            return
+
+        self.attempts += 1
+        watch.attempts += 1
+        logger.info(f"Reconnecting {mac} (attempt {watch.attempts})")
+        success, message = await self.manager.connect_device_async(mac, priority=BACKGROUND)
+        if success:
+            self._connected(mac)
+            return
+
+        self.failures += 1
+        # The device may have been paused or reconnected meanwhile
+        if self.watching.get(mac) is watch:
+            watch.due = time.monotonic() + self._backoff(watch.attempts)
+            logger.info(f"Reconnecting {mac} failed ({message}), next attempt in "
+                        f"{watch.due - time.monotonic():.0f}s")
+
+    def stats(self) -> Dict:
+        """Attempt counts, time-to-reconnect and the devices being watched"""
+        now = time.monotonic()
+        return {
+            'watching': len(self.watching),
+            'paused': len(self.paused),
+            'attempts': self.attempts,
+            'failures': self.failures,
+            'reconnects': self.reconnects,
+            'time_to_reconnect_avg_s': round(self._reconnect_total / self.reconnects, 1) if self.reconnects else 0.0,
+            'time_to_reconnect_max_s': round(self._reconnect_max, 1),
+            'devices': {
+                mac: {
+                    'attempts': watch.attempts,
+                    'down_for_s': round(now - watch.disconnected_at, 1),
+                    'next_attempt_in_s': round(max(watch.due - now, 0.0), 1),
+                }
+                for mac, watch in self.watching.items()
+            },
+        }
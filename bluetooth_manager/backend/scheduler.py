@@ -0,0 +1,174 @@
+"""
+Device Operation Scheduler
+Runs Bluetooth operations one at a time per device and in parallel across
+devices, with priorities, a global concurrency limit and coalescing of
+duplicate requests
+"""
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Tuple
+
+from profiling import record
+
+# Lower runs first
+INTERACTIVE = 0
+BACKGROUND = 1
+
+
+class _Job:
+    """One submitted operation and the future its callers wait on"""
+
+    __slots__ = ('mac', 'operation', 'func', 'priority', 'future', 'submitted_at', 'context')
+
+    def __init__(self, mac: str, operation: str, func: Callable[[], Awaitable],
+                 priority: int, future: asyncio.Future):
+        self.mac = mac
+        self.operation = operation
+        self.func = func
+        self.priority = priority
+        self.future = future
+        self.submitted_at = time.monotonic()
+        # The submitter's context, e.g. its request timings
+        self.context = contextvars.copy_context()
+
+
+class DeviceScheduler:
+    """
+    Per-device operation queues sharing a global concurrency limit
+
+    Operations on the same MAC address run in submission order, never two at
+    once, so a remove cannot race a connect. Devices take turns for the
+    max_parallel running slots, highest priority first, so scan lookups wait
+    while a user is pairing. Submitting the same operation for a device whose
+    latest operation is exactly that one, still queued or running, joins it
+    instead of running it twice.
+
+    Must be used from a single event loop.
+    """
+
+    def __init__(self, max_parallel: int = 4):
+        """
+        Args:
+            max_parallel: Most devices with an operation running at once
+        """
+        self.max_parallel = max(max_parallel, 1)
+        self.completed = 0
+        self.failed = 0
+        self.coalesced = 0
+        self._queues: Dict[str, Deque[_Job]] = {}
+        self._latest: Dict[str, _Job] = {}
+        self._running: Dict[str, _Job] = {}
+        self._ready: List[Tuple[int, int, str]] = []
+        self._order = itertools.count()
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    async def submit(self, mac: str, operation: str, func: Callable[[], Awaitable],
+                     priority: int = INTERACTIVE):
+        """
+        Run an operation on a device once it is that device's turn
+
+        Args:
+            mac: MAC address of the device the operation acts on
+            operation: Name identifying the operation, used for coalescing
+            func: Coroutine function performing the operation
+            priority: INTERACTIVE or BACKGROUND
+
+        Returns:
+            Whatever func returns; exceptions propagate to every caller
+        """
+        latest = self._latest.get(mac)
+        if latest is not None and latest.operation == operation and not latest.future.done():
+            self.coalesced += 1
+            if priority < latest.priority and mac not in self._running:
+                latest.priority = priority
+                self._push(mac)
+            return await asyncio.shield(latest.future)
+
+        job = _Job(mac, operation, func, priority, asyncio.get_running_loop().create_future())
+        self._latest[mac] = job
+        self._queues.setdefault(mac, deque()).append(job)
+        if mac not in self._running:
+            self._push(mac)
+        self._dispatch()
+        # Shielded so a caller that goes away (e.g. an HTTP client that
+        # disconnected) does not cancel an operation others may be joined to
+        return await asyncio.shield(job.future)
+
+    def _push(self, mac: str) -> None:
+        """Make a device with queued work eligible for a running slot"""
+        priority = min(job.priority for job in self._queues[mac])
+        heapq.heappush(self._ready, (priority, next(self._order), mac))
+
+    def _dispatch(self) -> None:
+        """Start queued operations while running slots are free"""
+        while self._ready and len(self._running) < self.max_parallel:
+            _, _, mac = heapq.heappop(self._ready)
+            queue = self._queues.get(mac)
+            # Entries go stale when a device got a second, higher priority
+            # entry or already started through another one
+            if mac in self._running or not queue:
+                continue
+            job = queue.popleft()
+            if not queue:
+                del self._queues[mac]
+            self._running[mac] = job
+            wait = time.monotonic() - job.submitted_at
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+            # Run in the submitter's context rather than whichever task
+            # happens to be dispatching
+            job.context.run(record, 'queue', wait)
+            job.context.run(asyncio.ensure_future, self._run(job))
+
+    async def _run(self, job: _Job) -> None:
+        try:
+            result = await job.func()
+        except asyncio.CancelledError:
+            job.future.cancel()
+            raise
+        except Exception as e:
+            self.failed += 1
+            job.future.set_exception(e)
+            # Mark it retrieved in case every caller already went away
+            job.future.exception()
+        else:
+            self.completed += 1
+            job.future.set_result(result)
+        finally:
+            del self._running[job.mac]
+            if self._latest.get(job.mac) is job:
+                del self._latest[job.mac]
+            if job.mac in self._queues:
+                self._push(job.mac)
+            self._dispatch()
+
+    @property
+    def busy(self) -> bool:
+        """True while any operation is queued or running"""
+        return bool(self._running or self._queues)
+
+    def stats(self) -> Dict:
+        """Queue depth, running operations and wait times"""
+        started = self.completed + self.failed + len(self._running)
+        now = time.monotonic()
+        queued = [job for queue in self._queues.values() for job in queue]
+        return {
+            'max_parallel': self.max_parallel,
+            'running': len(self._running),
+            'queued': len(queued),
+            'devices_waiting': len(self._queues),
+            'completed': self.completed,
+            'failed': self.failed,
+            'coalesced': self.coalesced,
+            'wait_avg_ms': round(self._wait_total / started * 1000, 1) if started else 0.0,
+            'wait_max_ms': round(self._wait_max * 1000, 1),
+            'oldest_queued_ms': round(max((now - job.submitted_at for job in queued), default=0.0) * 1000, 1),
+            'operations': {mac: job.operation for mac, job in self._running.items()},
+        }
+
@@ -0,0 +1,172 @@
+"""
+Device State Sync
+Keeps WebSocket clients in sync with the device list: a full snapshot when a
+client connects, then versioned field-level deltas as devices change
+"""
+
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+from bluetooth_manager import DEVICE_NOT_AVAILABLE, BluetoothManager
+from websocket_hub import WebSocketClient, WebSocketHub
+
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceStateSync:
+    """
+    Publishes device state changes over the WebSocket hub
+
+    Messages:
+        {"type": "snapshot", "version": N, "devices": [<device>, ...]}
+        {"type": "delta", "version": N, "changes": [
+            {"mac": ..., "op": "upsert", "fields": {<changed fields>}},
+            {"mac": ..., "op": "remove"}]}
+
+    Devices use the GET /api/devices entry shape. Every delta increments the
+    version by one, so a client that sees a gap (for example after its queue
+    dropped messages) asks for a new snapshot by sending "sync".
+    """
+
+    def __init__(self, manager: BluetoothManager, hub: WebSocketHub,
+                 flush_interval: float = 0.1, reconcile_interval: float = 30.0):
+        """
+        Args:
+            manager: Source of device records and change events
+            hub: WebSocket fan-out
+            flush_interval: Seconds changes are collected into one delta
+            reconcile_interval: Seconds between full comparisons with BlueZ,
+                which catch changes no event reported
+        """
+        self.manager = manager
+        self.hub = hub
+        self.flush_interval = flush_interval
+        self.reconcile_interval = reconcile_interval
+        self.version = 0
+        self.devices: Dict[str, Dict] = {}
+        self._dirty: set = set()
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._reconcile_task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        """Load the current devices and start following changes"""
+        self._loop = asyncio.get_running_loop()
+        try:
+            await self.reconcile()
+        except Exception as e:
+            logger.warning(f"Could not load devices for state sync: {e}")
+        self.manager.add_event_listener(self._on_event)
+        self._reconcile_task = asyncio.create_task(self._reconcile_loop())
+
+    def stop(self) -> None:
+        """Stop following changes"""
+        self.manager.remove_event_listener(self._on_event)
+        if self._reconcile_task:
+            self._reconcile_task.cancel()
+        if self._flush_handle:
+            self._flush_handle.cancel()
+
+    def snapshot_message(self) -> Dict:
+        """The full device list at the current version"""
+        return {
+            'type': 'snapshot',
+            'version': self.version,
+            'devices': list(self.devices.values())
+        }
+
+    def send_snapshot(self, client: WebSocketClient) -> None:
+        """Queue a snapshot for one client"""
+        self.hub.send(client, self.snapshot_message())
+
+    async def refresh_device(self, mac: str) -> None:
+        """
+        Re-read one device from BlueZ and publish what changed, e.g. right
+        after an operation on it
+
+        Only a device BlueZ reports as unknown is removed; when reading it
+        fails for another reason (a timeout, a lost session) clients keep
+        the last known state until the next event or reconcile.
+
+        Args:
+            mac: MAC address of the device
+        """
+        info = await self.manager.get_device_info_async(mac)
+        error = info.get('error')
+        if error == DEVICE_NOT_AVAILABLE:
+            self.manager.devices.discard(mac)
+        elif error:
+            logger.debug(f"Could not refresh {mac}: {error}")
+            return
+        self._dirty.add(mac)
+        self._flush()
+
+    async def reconcile(self) -> None:
+        """Compare the whole device list with BlueZ and publish the differences"""
+        records = await self.manager.get_device_records_async()
+        current = {record.mac: record.to_summary() for record in records}
+        changes = [{'mac': mac, 'op': 'remove'} for mac in self.devices if mac not in current]
+        for mac, summary in current.items():
+            change = self._diff(mac, summary)
+            if change:
+                changes.append(change)
+        self._publish(changes, current)
+
+    async def _reconcile_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.reconcile_interval)
+            try:
+                await self.reconcile()
+            except Exception as e:
+                logger.warning(f"Device state reconcile failed: {e}")
+
+    def _on_event(self, event: Dict) -> None:
+        """Event listener, called from a backend thread"""
+        if event['object'] == 'device' and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._mark_dirty, event['mac'])
+
+    def _mark_dirty(self, mac: str) -> None:
+        self._dirty.add(mac)
+        if self._flush_handle is None:
+            self._flush_handle = self._loop.call_later(self.flush_interval, self._flush)
+
+    def _flush(self) -> None:
+        """Publish one delta for every device that changed since the last one"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        dirty, self._dirty = self._dirty, set()
+
+        devices = dict(self.devices)
+        changes = []
+        for mac in dirty:
+            record = self.manager.devices.get(mac)
+            if record is None:
+                if devices.pop(mac, None) is not None:
+                    changes.append({'mac': mac, 'op': 'remove'})
+                continue
+            summary = record.to_summary()
+            change = self._diff(mac, summary)
+            if change:
+                changes.append(change)
+            devices[mac] = summary
+        self._publish(changes, devices)
+
+    def _diff(self, mac: str, summary: Dict) -> Optional[Dict]:
+        """Field-level change between the published and the current summary"""
+        previous = self.devices.get(mac)
+        if previous is None:
+            return {'mac': mac, 'op': 'upsert', 'fields': summary}
+        fields = {key: value for key, value in summary.items() if previous.get(key) != value}
+        if not fields:
+            return None
+        return {'mac': mac, 'op': 'upsert', 'fields': fields}
+
+    def _publish(self, changes: List[Dict], devices: Dict[str, Dict]) -> None:
+        self.devices = devices
+        if not changes:
+            return
+        self.version += 1
+        self.hub.broadcast({'type': 'delta', 'version': self.version, 'changes': changes})
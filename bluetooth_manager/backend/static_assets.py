@@ -0,0 +1,221 @@
+"""
+Static Assets
+Serves the frontend with content-hashed URLs that browsers cache for good,
+gzip/brotli variants precompressed at build time, and an index.html that is
+revalidated with an ETag
+
+Run as a script at image build time to write the compressed variants:
+
+    python3 backend/static_assets.py web
+"""
+
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import sys
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from fastapi.responses import FileResponse, Response
+
+
+logger = logging.getLogger(__name__)
+
+# Worth compressing; images and fonts already are
+COMPRESSIBLE = ('.css', '.js', '.html', '.svg', '.json', '.txt')
+
+# Preferred first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+# static/... URLs in src/href attributes of index.html
+STATIC_URL = re.compile(r'(?<=["\'])static/([^"\'?#]+)')
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=5).hexdigest()
+
+
+def hashed_path(path: str, digest: str) -> str:
+    """css/style.css -> css/style.<digest>.css"""
+    root, extension = os.path.splitext(path)
+    return f'{root}.{digest}{extension}'
+
+
+def accepted_encodings(request: Request) -> set:
+    """Content codings the client accepts (q=0 excluded)"""
+    accepted = set()
+    for part in request.headers.get('accept-encoding', '').split(','):
+        coding, _, params = part.partition(';')
+        name, _, value = params.partition('=')
+        try:
+            if name.strip() == 'q' and float(value) == 0:
+                continue
+        except ValueError:
+            pass
+        if coding.strip():
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def compress(data: bytes, encoding: str) -> Optional[bytes]:
+    """data compressed with the best settings, or None if no brotli module"""
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli.compress(data, quality=11)
+
+
+def build(web_dir: str) -> List[Tuple[str, int, Dict[str, int]]]:
+    """
+    Write .gz and .br variants next to every compressible asset
+
+    A variant is only kept if it is smaller than the original. Brotli needs
+    the brotli module, which only has to be installed while building.
+
+    Returns:
+        (path, size, {encoding: compressed size}) for every asset compressed
+    """
+    built = []
+    for path in walk(web_dir):
+        # index.html is rewritten with the hashed URLs and compressed at startup
+        if path == 'index.html' or not path.endswith(COMPRESSIBLE):
+            continue
+        full = os.path.join(web_dir, path)
+        with open(full, 'rb') as handle:
+            data = handle.read()
+        sizes = {}
+        for encoding, suffix in ENCODINGS:
+            compressed = compress(data, encoding)
+            if compressed is None or len(compressed) >= len(data):
+                if os.path.exists(full + suffix):
+                    os.remove(full + suffix)
+                continue
+            with open(full + suffix, 'wb') as handle:
+                handle.write(compressed)
+            sizes[encoding] = len(compressed)
+        built.append((path, len(data), sizes))
+    return built
+
+
+def walk(web_dir: str) -> List[str]:
+    """Asset paths relative to web_dir, leaving out compressed variants"""
+    paths = []
+    for directory, _, files in os.walk(web_dir):
+        for name in files:
+            if name.endswith(tuple(suffix for _, suffix in ENCODINGS)):
+                continue
+            paths.append(os.path.relpath(os.path.join(directory, name), web_dir).replace(os.sep, '/'))
+    return sorted(paths)
+
+
+class _Asset:
+    __slots__ = ('path', 'media_type', 'variants')
+
+    def __init__(self, path: str, media_type: str, variants: Dict[str, str]):
+        self.path = path
+        self.media_type = media_type
+        # encoding -> file holding the asset in that encoding
+        self.variants = variants
+
+
+class StaticAssets:
+    """
+    The frontend files under one directory, hashed once at startup
+
+    /static/<name>.<hash>.<ext> is served with a year-long immutable
+    Cache-Control, so the browser only downloads an asset again once its
+    content (and so its URL) changes. index.html links to those URLs and is
+    served with an ETag and no-cache, so opening the panel costs one
+    conditional request. Precompressed variants are used when the client
+    accepts them and they are not older than the file they were made from.
+    """
+
+    def __init__(self, web_dir: str):
+        """
+        Args:
+            web_dir: Directory holding index.html and the assets
+        """
+        self.web_dir = web_dir
+        self.assets: Dict[str, _Asset] = {}
+        # Asset path -> its content-hashed path
+        self.urls: Dict[str, str] = {}
+        for path in walk(web_dir):
+            full = os.path.join(web_dir, path)
+            with open(full, 'rb') as handle:
+                digest = content_hash(handle.read())
+            variants = {}
+            for encoding, suffix in ENCODINGS:
+                variant = full + suffix
+                if os.path.exists(variant) and os.path.getmtime(variant) >= os.path.getmtime(full):
+                    variants[encoding] = variant
+            media_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+            asset = _Asset(full, media_type, variants)
+            self.urls[path] = hashed_path(path, digest)
+            self.assets[self.urls[path]] = asset
+            # The plain path keeps working, but is not cached for long
+            self.assets[path] = asset
+        self.index: Optional[Dict[str, bytes]] = None
+        self.index_etag = ''
+        index = os.path.join(web_dir, 'index.html')
+        if os.path.exists(index):
+            with open(index, 'rb') as handle:
+                self._render_index(handle.read().decode('utf-8'))
+        logger.info(f"Serving {len(self.urls)} static assets from {web_dir}")
+
+    def _render_index(self, html: str) -> None:
+        """index.html with hashed asset URLs, plus its compressed forms"""
+        body = STATIC_URL.sub(
+            lambda match: 'static/' + self.urls.get(match.group(1), match.group(1)), html).encode('utf-8')
+        self.index = {'identity': body}
+        for encoding, _ in ENCODINGS:
+            compressed = compress(body, encoding)
+            if compressed is not None and len(compressed) < len(body):
+                self.index[encoding] = compressed
+        self.index_etag = f'"{content_hash(body)}"'
+
+    def _encoding(self, request: Request, available) -> str:
+        accepted = accepted_encodings(request)
+        for encoding, _ in ENCODINGS:
+            if encoding in available and encoding in accepted:
+                return encoding
+        return 'identity'
+
+    def asset_response(self, request: Request, path: str) -> Response:
+        """Response for /static/<path>"""
+        asset = self.assets.get(path)
+        if asset is None:
+            raise HTTPException(status_code=404, detail="Not found")
+        encoding = self._encoding(request, asset.variants)
+        headers = {'Cache-Control': IMMUTABLE if path not in self.urls else 'no-cache'}
+        if asset.variants:
+            headers['Vary'] = 'Accept-Encoding'
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+            return FileResponse(asset.variants[encoding], media_type=asset.media_type, headers=headers)
+        return FileResponse(asset.path, media_type=asset.media_type, headers=headers)
+
+    def index_response(self, request: Request) -> Response:
+        """Response for /, carrying index_etag"""
+        if self.index is None:
+            raise HTTPException(status_code=404, detail="Frontend not installed")
+        headers = {'ETag': self.index_etag, 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+        encoding = self._encoding(request, self.index)
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return Response(self.index[encoding], media_type='text/html; charset=utf-8', headers=headers)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        sys.exit('Usage: static_assets.py <web directory>')
+    for path, size, sizes in build(sys.argv[1]):
+        compressed = ', '.join(f'{encoding} {length}' for encoding, length in sizes.items())
+        print(f'{path}: {size} bytes -> {compressed or "not compressed"}')
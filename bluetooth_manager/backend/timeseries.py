@@ -0,0 +1,189 @@
+"""
+Device Time Series
+RSSI and battery samples per device in fixed-size ring buffers backed by
+`array`, with min/max/avg downsampling for charts
+"""
+
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+# Sample type per metric: signed short for dBm, unsigned byte for percent
+METRICS = {'rssi': 'h', 'battery': 'B'}
+
+
+class RingSeries:
+    """
+    The latest `capacity` (timestamp, value) samples of one metric
+
+    Timestamps and values live in two flat arrays (10 bytes per RSSI
+    sample) that grow up to capacity and then wrap around, overwriting the
+    oldest sample.
+    """
+
+    __slots__ = ('capacity', 'times', 'values', 'start')
+
+    def __init__(self, capacity: int, typecode: str):
+        """
+        Args:
+            capacity: Most samples to keep
+            typecode: array typecode of the values
+        """
+        self.capacity = max(capacity, 1)
+        self.times = array('d')
+        self.values = array(typecode)
+        # Index of the oldest sample once the buffer is full
+        self.start = 0
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def append(self, timestamp: float, value: int) -> None:
+        # Values first: a value the typecode cannot hold raises before
+        # anything changed
+        if len(self.times) < self.capacity:
+            self.values.append(value)
+            self.times.append(timestamp)
+        else:
+            self.values[self.start] = value
+            self.times[self.start] = timestamp
+            self.start = (self.start + 1) % self.capacity
+
+    def last(self) -> Optional[Tuple[float, int]]:
+        """The newest sample, if any"""
+        if not self.times:
+            return None
+        index = (self.start - 1) % len(self.times)
+        return self.times[index], self.values[index]
+
+    def downsample(self, since: float, until: float, window: float) -> List[Tuple[float, int, int, float, int]]:
+        """
+        Aggregate the samples between since and until into windows
+
+        Args:
+            since: Start of the first window (Unix timestamp)
+            until: End of the range
+            window: Window length in seconds
+
+        Returns:
+            (window start, min, max, average, sample count) for every window
+            holding at least one sample, oldest first
+        """
+        buckets: Dict[int, list] = {}
+        times, values = self.times, self.values
+        size = len(times)
+        for offset in range(size):
+            index = (self.start + offset) % size
+            timestamp = times[index]
+            if timestamp < since or timestamp > until:
+                continue
+            value = values[index]
+            key = int((timestamp - since) // window)
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = [value, value, value, 1]
+            else:
+                if value < bucket[0]:
+                    bucket[0] = value
+                if value > bucket[1]:
+                    bucket[1] = value
+                bucket[2] += value
+                bucket[3] += 1
+        return [(since + key * window, low, high, total / count, count)
+                for key, (low, high, total, count) in sorted(buckets.items())]
+
+    def nbytes(self) -> int:
+        return self.times.itemsize * len(self.times) + self.values.itemsize * len(self.values)
+
+
+class DeviceSeries:
+    """
+    RSSI and battery series for the most recently active devices
+
+    Memory is bounded by max_devices x (capacity + battery_capacity)
+    samples; the device updated least recently is dropped first. A value
+    equal to the previous sample is only stored again after `heartbeat`
+    seconds, so polling a device whose battery does not change adds almost
+    nothing. Thread-safe, like the DeviceRegistry it shadows.
+    """
+
+    def __init__(self, max_devices: int = 256, capacity: int = 1024, battery_capacity: int = 256,
+                 heartbeat: float = 60.0):
+        """
+        Args:
+            max_devices: Most devices to keep series for
+            capacity: RSSI samples kept per device
+            battery_capacity: Battery samples kept per device
+            heartbeat: Seconds after which an unchanged value is stored again
+        """
+        self.max_devices = max(max_devices, 1)
+        self.capacities = {'rssi': capacity, 'battery': battery_capacity}
+        self.heartbeat = heartbeat
+        self._series: 'OrderedDict[str, Dict[str, RingSeries]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, mac: str, values: Dict, timestamp: Optional[float] = None) -> None:
+        """
+        Store the metrics found in a get_device_info dictionary or event props
+
+        Args:
+            mac: MAC address of the device
+            values: Dictionary that may hold 'rssi' and 'battery'
+            timestamp: When the values were read (default: now)
+        """
+        samples = [(metric, values[metric]) for metric in METRICS if values.get(metric) is not None]
+        if not samples:
+            return
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            series = self._series.get(mac)
+            if series is None:
+                series = self._series[mac] = {}
+                while len(self._series) > self.max_devices:
+                    self._series.popitem(last=False)
+            else:
+                self._series.move_to_end(mac)
+            for metric, value in samples:
+                ring = series.get(metric)
+                if ring is None:
+                    ring = series[metric] = RingSeries(self.capacities[metric], METRICS[metric])
+                last = ring.last()
+                if last is not None and last[1] == value and timestamp - last[0] < self.heartbeat:
+                    continue
+                try:
+                    ring.append(timestamp, value)
+                except (OverflowError, TypeError):
+                    # Not a sane reading; keep the series as it was
+                    pass
+
+    def downsample(self, mac: str, metric: str, since: float, until: float,
+                   window: float) -> Optional[List[Tuple[float, int, int, float, int]]]:
+        """
+        Windows of min/max/average for one device's metric
+
+        Returns:
+            As RingSeries.downsample, or None if the device has no samples
+            of that metric
+        """
+        with self._lock:
+            ring = self._series.get(mac, {}).get(metric)
+            if ring is None:
+                return None
+            return ring.downsample(since, until, window)
+
+    def discard(self, mac: str) -> None:
+        """Forget a device's series"""
+        with self._lock:
+            self._series.pop(mac, None)
+
+    def stats(self) -> Dict:
+        """Devices tracked, samples stored and their memory use"""
+        with self._lock:
+            rings = [ring for series in self._series.values() for ring in series.values()]
+        return {
+            'devices': len(self._series),
+            'samples': sum(len(ring) for ring in rings),
+            'bytes': sum(ring.nbytes() for ring in rings),
+        }
@@ -0,0 +1,158 @@
+"""
+Warm Start
+Saves the device and adapter state to disk while running and on shutdown,
+and restores it at startup, so the first device list is served right away
+instead of after a full BlueZ round trip
+"""
+
+import asyncio
+import dataclasses
+import gzip
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+from models import DeviceRecord, intern_mac
+
+
+logger = logging.getLogger(__name__)
+
+FORMAT = 2
+DEVICE_FIELDS = [field.name for field in dataclasses.fields(DeviceRecord)]
+
+
+def encode_state(state: Dict) -> Dict:
+    """
+    A BluetoothManager.export_state result in the snapshot format
+
+    Devices are stored as rows of values under one list of field names,
+    which keeps the file small and lets fields added later default when an
+    older file is loaded.
+    """
+    return {
+        'format': FORMAT,
+        'saved_at': time.time(),
+        'fields': DEVICE_FIELDS,
+        'devices': [[getattr(record, field) for field in DEVICE_FIELDS] for record in state['records']],
+        'snapshot': state['snapshot'],
+        'adapters': state['adapters'],
+        'adapter_info': state['adapter_info'],
+    }
+
+
+def decode_devices(fields: List[str], rows: List[list]) -> List[DeviceRecord]:
+    """DeviceRecords from snapshot rows, skipping fields this version does not know"""
+    known = set(DEVICE_FIELDS)
+    records = []
+    for row in rows:
+        values = {field: value for field, value in zip(fields, row) if field in known}
+        values['mac'] = intern_mac(values['mac'])
+        if values.get('uuids') is not None:
+            values['uuids'] = tuple(tuple(uuid) for uuid in values['uuids'])
+        records.append(DeviceRecord(**values))
+    return records
+
+
+class WarmStart:
+    """
+    State snapshot of a BluetoothManager in a gzip-compressed JSON file
+
+    Saves go to a temporary file that is renamed into place, so a crash
+    while saving leaves the previous snapshot intact. Periodic saves are
+    skipped while the registry and the adapters have not changed.
+    """
+
+    def __init__(self, manager, path: str, interval: float = 60.0, max_age_days: float = 7.0):
+        """
+        Args:
+            manager: BluetoothManager to save and restore
+            path: Snapshot file
+            interval: Seconds between periodic saves
+            max_age_days: Ignore a snapshot older than this at startup
+        """
+        self.manager = manager
+        self.path = path
+        self.interval = interval
+        self.max_age = max_age_days * 86400
+        self._saved: Optional[tuple] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def load(self) -> int:
+        """
+        Restore the saved state into the manager
+
+        Returns:
+            Number of devices restored (0 if there was no usable snapshot)
+        """
+        try:
+            with gzip.open(self.path, 'rt', encoding='utf-8') as handle:
+                state = json.load(handle)
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable state snapshot {self.path}: {e}")
+            return 0
+        if state.get('format') != FORMAT:
+            logger.info(f"Ignoring state snapshot in format {state.get('format')}")
+            return 0
+        age = time.time() - state.get('saved_at', 0)
+        if age > self.max_age:
+            logger.info(f"Ignoring state snapshot saved {age / 86400:.0f} days ago")
+            return 0
+        try:
+            records = decode_devices(state['fields'], state['devices'])
+        except (KeyError, TypeError, ValueError) as e:
+            logger.warning(f"Ignoring malformed state snapshot {self.path}: {e}")
+            return 0
+        self.manager.restore_state(records, [intern_mac(mac) for mac in state.get('snapshot', [])],
+                                   state.get('adapters'), state.get('adapter_info'))
+        logger.info(f"Restored {len(records)} devices from a state snapshot saved {age:.0f}s ago")
+        return len(records)
+
+    def save(self) -> bool:
+        """
+        Write the current state if it changed since the last save
+
+        Returns:
+            Whether the file was written
+        """
+        version = self.manager.devices.version
+        exported = self.manager.export_state()
+        marker = (version, exported['adapters'], exported['adapter_info'])
+        if marker == self._saved:
+            return False
+        state = encode_state(exported)
+        temporary = f'{self.path}.tmp'
+        with gzip.open(temporary, 'wt', encoding='utf-8', compresslevel=6) as handle:
+            json.dump(state, handle, separators=(',', ':'))
+        os.replace(temporary, self.path)
+        self._saved = marker
+        return True
+
+    async def save_async(self) -> None:
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self.save)
+        except OSError as e:
+            logger.error(f"Saving the state snapshot failed: {e}")
+
+    async def _save_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.save_async()
+
+    def start(self) -> None:
+        """Start saving every interval seconds"""
+        self._task = asyncio.ensure_future(self._save_periodically())
+
+    async def stop(self) -> None:
+        """Stop the periodic saves and write a final snapshot"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.save_async()
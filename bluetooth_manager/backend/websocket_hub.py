@@ -0,0 +1,195 @@
+"""
+WebSocket Broadcast Hub
+Fans messages out to WebSocket clients through per-client bounded queues, so
+a slow client never delays the broadcaster or the other clients
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from typing import Dict, Hashable, List, Optional, Set
+
+from fastapi import WebSocket
+
+from metrics import BROADCAST_SECONDS
+
+
+logger = logging.getLogger(__name__)
+
+
+def encode_message(message: Dict) -> str:
+    """Encode a message the way WebSocket.send_json does"""
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+def coalesce_key(message: Dict) -> Optional[Hashable]:
+    """
+    Key under which a newer message replaces a queued older one
+
+    Only messages that carry the latest value of something, like a signal
+    strength reading, can be coalesced; everything else is delivered as is.
+
+    Args:
+        message: The message being broadcast
+
+    Returns:
+        A hashable key, or None if the message must not be coalesced
+    """
+    if message.get('type') == 'rssi_update':
+        return ('rssi_update', message.get('mac'))
+    return None
+
+
+class WebSocketClient:
+    """One connected client with its outbound queue and sender task"""
+
+    def __init__(self, websocket: WebSocket, queue_size: int):
+        self.websocket = websocket
+        self.queue_size = queue_size
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        # Entries are [key, text] lists so a coalesced message can be
+        # replaced in place without losing its position in the queue
+        self._queue: deque = deque()
+        self._pending: Dict[Hashable, list] = {}
+        self._wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.closed = False
+
+    def enqueue(self, text: str, key: Optional[Hashable] = None) -> None:
+        """Queue an encoded message without waiting for the client"""
+        if self.closed:
+            return
+        if key is not None:
+            entry = self._pending.get(key)
+            if entry is not None:
+                entry[1] = text
+                self.coalesced += 1
+                return
+        if len(self._queue) >= self.queue_size:
+            old_key, _ = self._queue.popleft()
+            if old_key is not None:
+                self._pending.pop(old_key, None)
+            if not self.dropped:
+                logger.warning("WebSocket client is not keeping up, dropping its oldest messages")
+            self.dropped += 1
+        entry = [key, text]
+        self._queue.append(entry)
+        if key is not None:
+            self._pending[key] = entry
+        self._wakeup.set()
+
+    async def run(self, send_timeout: float) -> None:
+        """Sender task: deliver queued messages until the client goes away"""
+        try:
+            while not self.closed:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                while self._queue and not self.closed:
+                    key, text = self._queue.popleft()
+                    if key is not None:
+                        self._pending.pop(key, None)
+                    await asyncio.wait_for(self.websocket.send_text(text), send_timeout)
+                    self.sent += 1
+        except Exception as e:
+            logger.info(f"WebSocket client send failed, disconnecting it: {e}")
+        finally:
+            self.closed = True
+
+    def stop(self) -> None:
+        """Stop the sender task"""
+        self.closed = True
+        self._queue.clear()
+        self._pending.clear()
+        self._wakeup.set()
+
+
+class WebSocketHub:
+    """Set of connected clients and the broadcast fan-out"""
+
+    def __init__(self, queue_size: int = 256, send_timeout: float = 10.0):
+        """
+        Args:
+            queue_size: Messages queued per client before the oldest is dropped
+            send_timeout: Seconds a single send may take before the client is
+                considered dead and disconnected
+        """
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.clients: Set[WebSocketClient] = set()
+        self.broadcasts = 0
+        # Counters of clients that already left
+        self._sent = 0
+        self._dropped = 0
+        self._coalesced = 0
+
+    def connect(self, websocket: WebSocket) -> WebSocketClient:
+        """
+        Register an accepted WebSocket and start its sender task
+
+        Args:
+            websocket: The accepted connection
+
+        Returns:
+            The client handle to pass to send() and disconnect()
+        """
+        client = WebSocketClient(websocket, self.queue_size)
+        client.task = asyncio.create_task(client.run(self.send_timeout))
+        self.clients.add(client)
+        return client
+
+    def disconnect(self, client: WebSocketClient) -> None:
+        """Unregister a client and stop its sender task"""
+        if client in self.clients:
+            self.clients.discard(client)
+            self._sent += client.sent
+            self._dropped += client.dropped
+            self._coalesced += client.coalesced
+        client.stop()
+
+    def send(self, client: WebSocketClient, message: Dict) -> None:
+        """Queue a message for one client"""
+        client.enqueue(encode_message(message))
+
+    def broadcast(self, message: Dict) -> None:
+        """
+        Queue a message for every client
+
+        The message is encoded once, and the call returns immediately;
+        each client's sender task delivers it at that client's pace.
+
+        Args:
+            message: JSON-serializable message
+        """
+        self.broadcasts += 1
+        if not self.clients:
+            return
+        started = time.perf_counter()
+        text = encode_message(message)
+        key = coalesce_key(message)
+        for client in list(self.clients):
+            if client.closed:
+                self.disconnect(client)
+            else:
+                client.enqueue(text, key)
+        BROADCAST_SECONDS.observe(time.perf_counter() - started)
+
+    def stats(self) -> Dict:
+        """Client count and delivery counters"""
+        clients: List[WebSocketClient] = list(self.clients)
+        return {
+            'clients': len(clients),
+            'broadcasts': self.broadcasts,
+            'sent': self._sent + sum(c.sent for c in clients),
+            'dropped': self._dropped + sum(c.dropped for c in clients),
+            'coalesced': self._coalesced + sum(c.coalesced for c in clients),
+            'queued': sum(len(c._queue) for c in clients),
+        }
+
+    def close(self) -> None:
+        """Stop every sender task"""
+        for client in list(self.clients):
+            self.disconnect(client)
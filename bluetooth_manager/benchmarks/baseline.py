@@ -0,0 +1,66 @@
+"""
+Benchmark Baselines
+Stores benchmark results in baseline.json and compares new runs against them,
+so a change that makes a hot path slower shows up before it ships
+"""
+
+import json
+import os
+from typing import Dict, List, Tuple
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# (name, value, unit, higher is better)
+Result = Tuple[str, float, str, bool]
+
+
+def save(suite: str, results: List[Result], path: str = BASELINE) -> None:
+    """Replace a suite's stored baseline with these results"""
+    baselines: Dict = {}
+    if os.path.exists(path):
+        with open(path) as handle:
+            baselines = json.load(handle)
+    baselines[suite] = {
+        name: {'value': round(value, 3), 'unit': unit, 'higher_is_better': higher}
+        for name, value, unit, higher in results
+    }
+    with open(path, 'w') as handle:
+        json.dump(baselines, handle, indent=2, sort_keys=True)
+        handle.write('\n')
+
+
+def compare(suite: str, results: List[Result], tolerance: float,
+            path: str = BASELINE) -> List[str]:
+    """
+    Compare results with a suite's stored baseline
+
+    Args:
+        suite: Name of the benchmark script
+        results: This run's results
+        tolerance: Allowed slowdown as a fraction, e.g. 0.25 for 25%
+        path: Baseline file
+
+    Returns:
+        Descriptions of the results that regressed beyond the tolerance
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path) as handle:
+        baseline = json.load(handle).get(suite, {})
+    regressions = []
+    for name, value, unit, higher in results:
+        stored = baseline.get(name)
+        if not stored or not stored['value']:
+            continue
+        ratio = value / stored['value']
+        change = ratio - 1 if not higher else 1 - ratio
+        if change > tolerance:
+            regressions.append(f'{name}: {value:.2f} {unit} vs baseline {stored["value"]:.2f} {unit} '
+                               f'({change:+.0%} worse)')
+    return regressions
+
+
+def report(results: List[Result]) -> None:
+    width = max(len(name) for name, *_ in results)
+    for name, value, unit, _ in results:
+        print(f'{name:<{width}}  {value:10.2f} {unit}')
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Backend benchmark
+Drives BluetoothManager and the HTTP API against the fake bluetoothctl in
+benchmarks/fake, timing command round trips, device lookups, the device list
+and scan throughput without Bluetooth hardware. With --backend dbus it drives
+DBusBluetoothManager against the fake org.bluez (benchmarks/fake/bluez.py) on
+a private session bus instead, and results go to the bench_backend_dbus suite.
+
+Usage:
+    python3 benchmarks/bench_backend.py [--devices N] [--latency-ms N]
+                                        [--backend bluetoothctl|dbus]
+                                        [--save] [--tolerance FRACTION]
+
+Results are compared with benchmarks/baseline.json (exit status 1 on a
+regression beyond the tolerance); --save stores this run as the baseline.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'backend'))
+sys.path.insert(0, HERE)
+
+import baseline  # noqa: E402
+
+SUITE = 'bench_backend'
+
+
+def use_fake(args: argparse.Namespace, state_path: str) -> None:
+    """Point bluetoothctl at the fake, with a fresh simulated world"""
+    os.environ['PATH'] = os.path.join(HERE, 'fake') + os.pathsep + os.environ['PATH']
+    os.environ['FAKE_BT_STATE'] = state_path
+    os.environ['FAKE_BT_DEVICES'] = str(args.devices)
+    os.environ['FAKE_BT_PAIRED'] = str(args.devices)
+    os.environ['FAKE_BT_LATENCY_MS'] = str(args.latency_ms)
+    os.environ['FAKE_BT_DISCOVERY_RATE'] = str(args.discovery_rate)
+
+
+def percentiles(samples):
+    """Median and 95th percentile in milliseconds"""
+    samples = sorted(sample * 1000 for sample in samples)
+    return statistics.median(samples), samples[min(int(len(samples) * 0.95), len(samples) - 1)]
+
+
+def timed_calls(func, count: int):
+    samples = []
+    for _ in range(count):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+async def timed_awaits(func, count: int):
+    samples = []
+    for _ in range(count):
+        started = time.perf_counter()
+        await func()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+async def asgi_get(app, path: str, query: str = '', headers=()):
+    """Run one GET through the ASGI app in-process, returning (status, headers)"""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': 'GET', 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+        'query_string': query.encode(), 'root_path': '',
+        'headers': [(b'host', b'bench')] + [(k.encode(), v.encode()) for k, v in headers],
+        'client': ('127.0.0.1', 0), 'server': ('bench', 80),
+    }
+    response = {}
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+            response['headers'] = {k.decode(): v.decode() for k, v in message['headers']}
+
+    await app(scope, receive, send)
+    return response['status'], response['headers']
+
+
+async def bench_api(manager, count: int):
+    """GET /api/devices uncached, cached, and revalidated with If-None-Match"""
+    import app as api
+    # app configures INFO logging on import; keep per-request lines out of the report
+    logging.getLogger().setLevel(logging.WARNING)
+    api.bt_manager = manager
+    results = []
+
+    manager.cache_max_age = 0
+    p50, p95 = percentiles(await timed_awaits(lambda: asgi_get(api.app, '/api/devices'), count))
+    results += [('GET /api/devices, uncached p50', p50, 'ms', False),
+                ('GET /api/devices, uncached p95', p95, 'ms', False)]
+
+    manager.cache_max_age = 3600
+    _, headers = await asgi_get(api.app, '/api/devices')
+    p50, _ = percentiles(await timed_awaits(lambda: asgi_get(api.app, '/api/devices'), count * 10))
+    results.append(('GET /api/devices, cached p50', p50, 'ms', False))
+
+    etag = headers['etag']
+    status, _ = await asgi_get(api.app, '/api/devices', headers=[('if-none-match', etag)])
+    if status != 304:
+        sys.exit(f'Expected 304 for a matching ETag, got {status}')
+    p50, _ = percentiles(await timed_awaits(
+        lambda: asgi_get(api.app, '/api/devices', headers=[('if-none-match', etag)]), count * 10))
+    results.append(('GET /api/devices, 304 p50', p50, 'ms', False))
+    return results
+
+
+async def bench_scan(manager, seconds: float):
+    """Devices a scan reports per second while the fake announces new ones"""
+    discovered = 0
+
+    async def callback(message):
+        nonlocal discovered
+        if message['type'] == 'discovered':
+            discovered += 1
+
+    scan = asyncio.ensure_future(manager.start_scan_async(callback))
+    await asyncio.sleep(seconds)
+    manager.stop_scan()
+    await scan
+    return [('scan, discovered devices', discovered / seconds, '/s', True)]
+
+
+async def run(args: argparse.Namespace):
+    if args.backend == 'dbus':
+        from bluez_dbus import DBusBluetoothManager
+        manager = DBusBluetoothManager(bus='SESSION')
+    else:
+        from bluetooth_manager import BluetoothManager
+        manager = BluetoothManager()
+    results = []
+    try:
+        # Warm the session pool (or the bus connection) so startup is not timed
+        await manager.get_device_records_async()
+        macs = [record.mac for record in manager.devices.records()]
+        if len(macs) != args.devices:
+            sys.exit(f'Expected {args.devices} devices from the fake, found {len(macs)}')
+
+        # The D-Bus backend has no bluetoothctl to send commands to
+        if manager.pool is not None:
+            p50, p95 = percentiles(await manager._run_blocking(
+                timed_calls, lambda: manager.execute_command('devices'), args.count))
+            results += [('execute_command devices p50', p50, 'ms', False),
+                        ('execute_command devices p95', p95, 'ms', False)]
+
+        p50, p95 = percentiles(await manager._run_blocking(
+            timed_calls, lambda: manager.get_device_info(macs[0]), args.count))
+        results += [('get_device_info p50', p50, 'ms', False),
+                    ('get_device_info p95', p95, 'ms', False)]
+
+        results += await bench_api(manager, args.count)
+        results += await bench_scan(manager, args.scan_seconds)
+    finally:
+        manager.close()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark the backend against the fake bluetoothctl')
+    parser.add_argument('--devices', type=int, default=50, help='Known devices in the simulated world')
+    parser.add_argument('--latency-ms', type=int, default=20, help='Fake latency of asynchronous BlueZ calls')
+    parser.add_argument('--discovery-rate', type=float, default=50, help='Devices announced per second while scanning')
+    parser.add_argument('--backend', choices=('bluetoothctl', 'dbus'), default='bluetoothctl',
+                        help='Backend to drive: the fake bluetoothctl or the fake org.bluez')
+    parser.add_argument('--count', type=int, default=50, help='Timed calls per measurement')
+    parser.add_argument('--scan-seconds', type=float, default=3.0, help='How long to scan')
+    parser.add_argument('--save', action='store_true', help='Store the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='Allowed slowdown against the baseline, as a fraction')
+    args = parser.parse_args()
+
+    suite = SUITE
+    if args.backend == 'dbus':
+        suite = f'{SUITE}_dbus'
+        sys.path.insert(0, os.path.join(HERE, 'fake'))
+        from bluez import FakeBlueZ, session_bus
+        with session_bus(), FakeBlueZ(devices=args.devices, paired=args.devices,
+                                      discovery_rate=args.discovery_rate, latency_ms=args.latency_ms):
+            results = asyncio.run(run(args))
+    else:
+        with tempfile.TemporaryDirectory() as workdir:
+            use_fake(args, os.path.join(workdir, 'state.json'))
+            results = asyncio.run(run(args))
+
+    baseline.report(results)
+    if args.save:
+        baseline.save(suite, results)
+        return
+    regressions = baseline.compare(suite, results, args.tolerance)
+    if regressions:
+        print('\nRegressions against benchmarks/baseline.json:')
+        for regression in regressions:
+            print(f'  {regression}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
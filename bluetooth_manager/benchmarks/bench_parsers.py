@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Parser micro-benchmark
+Times the bluetoothctl output parsers over captured command output and
+compares them with the per-pattern regex parsing they replaced.
+
+Usage:
+    python3 benchmarks/bench_parsers.py [--devices N] [--repeat N]
+                                        [--save] [--tolerance FRACTION]
+
+Results are compared with benchmarks/baseline.json (exit status 1 on a
+regression beyond the tolerance); --save stores this run as the baseline.
+"""
+
+import argparse
+import os
+import re
+import sys
+import timeit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..', 'backend'))
+sys.path.insert(0, HERE)
+
+import baseline  # noqa: E402
+
+from parsers import (  # noqa: E402
+    parse_adapter_info, parse_controllers, parse_device_info,
+    parse_device_info_blocks, parse_devices, parse_event
+)
+
+
+FIXTURES = os.path.join(HERE, 'fixtures')
+SUITE = 'bench_parsers'
+
+# The regex-per-property parsing get_device_info used before parsers.py
+LEGACY_INFO_PATTERNS = {
+    'name': re.compile(r'Name: (.+)'),
+    'alias': re.compile(r'Alias: (.+)'),
+    'paired': re.compile(r'Paired: (yes|no)'),
+    'bonded': re.compile(r'Bonded: (yes|no)'),
+    'trusted': re.compile(r'Trusted: (yes|no)'),
+    'blocked': re.compile(r'Blocked: (yes|no)'),
+    'connected': re.compile(r'Connected: (yes|no)'),
+    'battery': re.compile(r'Battery Percentage: 0x[0-9a-f]+ \((\d+)\)'),
+    'rssi': re.compile(r'RSSI: 0x[0-9a-f]+ \((-?\d+)\)'),
+    'class': re.compile(r'Class: (0x[0-9a-f]+)'),
+    'icon': re.compile(r'Icon: (.+)'),
+}
+
+
+def legacy_parse_device_info(mac_address: str, stdout: str) -> dict:
+    lines = [line for line in stdout.split('\n') if not line.startswith('[')]
+    info = {'mac': mac_address}
+    for key, pattern in LEGACY_INFO_PATTERNS.items():
+        for line in lines:
+            match = pattern.search(line)
+            if match:
+                value = match.group(1)
+                if key in ['paired', 'bonded', 'trusted', 'blocked', 'connected']:
+                    info[key] = value.lower() == 'yes'
+                elif key in ['battery', 'rssi']:
+                    info[key] = int(value)
+                else:
+                    info[key] = value
+                break
+    info['uuids'] = []
+    for line in lines:
+        if 'UUID:' in line:
+            uuid_match = re.search(r'UUID: (.+?) \((.+?)\)', line)
+            if uuid_match:
+                info['uuids'].append({'uuid': uuid_match.group(1), 'name': uuid_match.group(2)})
+    return info
+
+
+def load(name: str) -> str:
+    with open(os.path.join(FIXTURES, name)) as handle:
+        return handle.read().rstrip('\n')
+
+
+def header_mac(text: str) -> str:
+    return text.split('\n', 1)[0].split(' ')[1]
+
+
+def measure(func, number: int, repeat: int) -> float:
+    """Best time per call in microseconds"""
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark the bluetoothctl parsers')
+    parser.add_argument('--devices', type=int, default=50, help='Devices in the batched snapshot')
+    parser.add_argument('--repeat', type=int, default=5, help='Timing repeats (best is reported)')
+    parser.add_argument('--number', type=int, default=2000, help='Calls per timing repeat')
+    parser.add_argument('--save', action='store_true', help='Store the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='Allowed slowdown against the baseline, as a fraction')
+    args = parser.parse_args()
+
+    infos = [load(name) for name in sorted(os.listdir(FIXTURES)) if name.startswith('info_')]
+    show, devices, controllers = load('show.txt'), load('devices.txt'), load('list.txt')
+    batch = '\n'.join(infos[i % len(infos)] for i in range(args.devices))
+
+    # The new parser must agree with the old one on everything but the UUID
+    # entries, which the old parser stored with label and UUID swapped
+    for text in infos:
+        mac = header_mac(text)
+        new, old = parse_device_info(mac, text), legacy_parse_device_info(mac, text)
+        new.pop('uuids'), old.pop('uuids')
+        if new != old:
+            sys.exit(f'parse_device_info disagrees for {mac}:\n  new {new}\n  old {old}')
+
+    def per_device(func):
+        return sum(measure(lambda t=t: func(header_mac(t), t), args.number, args.repeat)
+                   for t in infos) / len(infos)
+
+    events = [
+        '[NEW] Device 5C:FB:7C:12:34:56 JBL Flip 5',
+        '[CHG] Device 38:18:4C:1A:2B:3C RSSI: 0xffffffc4 (-60)',
+        '[CHG] Device 38:18:4C:1A:2B:3C Connected: yes',
+        '[CHG] Controller DC:A6:32:00:11:22 Discovering: yes',
+        '[DEL] Device 7A:11:52:9C:0D:4E 7A-11-52-9C-0D-4E',
+    ]
+
+    rows = [
+        ('info, legacy regex (per device)', per_device(legacy_parse_device_info)),
+        ('info, single pass (per device)', per_device(parse_device_info)),
+        (f'info batch of {args.devices} (per device)',
+         measure(lambda: parse_device_info_blocks(batch), max(args.number // args.devices, 1),
+                 args.repeat) / args.devices),
+        ('show', measure(lambda: parse_adapter_info(None, show), args.number, args.repeat)),
+        ('devices', measure(lambda: parse_devices(devices), args.number, args.repeat)),
+        ('list', measure(lambda: parse_controllers(controllers), args.number, args.repeat)),
+        ('event line', sum(measure(lambda e=e: parse_event(e), args.number, args.repeat)
+                           for e in events) / len(events)),
+    ]
+
+    results = [(name, usec, 'us', False) for name, usec in rows]
+    baseline.report(results)
+    if args.save:
+        baseline.save(SUITE, results)
+        return
+    regressions = baseline.compare(SUITE, results, args.tolerance)
+    if regressions:
+        print('\nRegressions against benchmarks/baseline.json:')
+        for regression in regressions:
+            print(f'  {regression}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
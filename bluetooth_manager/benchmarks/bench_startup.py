@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark
+Starts the add-on against the fake bluetoothctl in benchmarks/fake again and
+again and measures, from process start, how long it takes until
+GET /api/health answers, until the first GET /api/devices returns and until
+the backend reports itself ready (events subscribed, device list loaded,
+sessions started). Cold starts begin without a state snapshot; warm starts
+restore the snapshot the previous run saved on shutdown.
+
+Usage:
+    python3 benchmarks/bench_startup.py [--runs N] [--devices N]
+                                        [--startup-ms N] [--save]
+
+Results are compared with benchmarks/baseline.json (exit status 1 on a
+regression beyond the tolerance); --save stores this run as the baseline.
+"""
+
+import argparse
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, '..')
+sys.path.insert(0, HERE)
+
+import baseline  # noqa: E402
+
+SUITE = 'bench_startup'
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def get_json(url: str):
+    """The decoded response, or None if the server did not answer"""
+    try:
+        with urllib.request.urlopen(url, timeout=10) as response:
+            return json.load(response)
+    except OSError:
+        return None
+
+
+def start_once(args: argparse.Namespace, workdir: str, state_file: str) -> dict:
+    """Start the add-on, time the startup milestones and shut it down cleanly"""
+    port = free_port()
+    base = f'http://127.0.0.1:{port}'
+    env = dict(os.environ)
+    env.update({
+        'PATH': os.path.join(HERE, 'fake') + os.pathsep + env['PATH'],
+        'FAKE_BT_STATE': os.path.join(workdir, 'fake.json'),
+        'FAKE_BT_DEVICES': str(args.devices),
+        'FAKE_BT_PAIRED': str(args.devices),
+        'FAKE_BT_LATENCY_MS': str(args.latency_ms),
+        'FAKE_BT_STARTUP_MS': str(args.startup_ms),
+        'WEB_DIR': os.path.join(ROOT, 'web'),
+    })
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'backend', 'app.py'), '--port', str(port),
+         '--log-level', 'warning', '--auto-reconnect', 'false', '--state-file', state_file],
+        env=env, stdout=subprocess.DEVNULL if not args.server_log else None,
+        stderr=subprocess.STDOUT if not args.server_log else None,
+    )
+    timings = {}
+    try:
+        deadline = started + 30
+        while 'health' not in timings:
+            if server.poll() is not None:
+                sys.exit('The add-on exited during startup (rerun with --server-log)')
+            if time.perf_counter() > deadline:
+                sys.exit('The add-on did not answer /api/health within 30 s')
+            health = get_json(f'{base}/api/health')
+            if health is None:
+                time.sleep(0.01)
+                continue
+            timings['health'] = time.perf_counter() - started
+            if health.get('ready'):
+                timings['ready'] = timings['health']
+        devices = get_json(f'{base}/api/devices')
+        if not devices or len(devices['devices']) != args.devices:
+            sys.exit(f'Expected {args.devices} devices from the first /api/devices, got {devices}')
+        timings['devices'] = time.perf_counter() - started
+        while 'ready' not in timings:
+            if time.perf_counter() > deadline:
+                sys.exit('The backend did not report ready within 30 s')
+            if (get_json(f'{base}/api/health') or {}).get('ready'):
+                timings['ready'] = time.perf_counter() - started
+            else:
+                time.sleep(0.01)
+    finally:
+        # SIGINT runs the shutdown path, which saves the state snapshot
+        server.send_signal(signal.SIGINT)
+        try:
+            server.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            server.kill()
+    return timings
+
+
+def summarize(label: str, runs: list) -> list:
+    results = []
+    for key, milestone in (('health', 'first /api/health'), ('devices', 'first /api/devices'),
+                           ('ready', 'backend ready')):
+        median = statistics.median(run[key] for run in runs) * 1000
+        results.append((f'{label} start, {milestone}', median, 'ms', False))
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark add-on startup against the fake bluetoothctl')
+    parser.add_argument('--runs', type=int, default=5, help='Starts per measurement (cold and warm)')
+    parser.add_argument('--devices', type=int, default=50, help='Known devices in the simulated world')
+    parser.add_argument('--latency-ms', type=int, default=20, help='Fake latency of asynchronous BlueZ calls')
+    parser.add_argument('--startup-ms', type=int, default=300,
+                        help='Fake time for a bluetoothctl process to connect to bluetoothd')
+    parser.add_argument('--server-log', action='store_true', help='Show the add-on log')
+    parser.add_argument('--save', action='store_true', help='Store the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='Allowed slowdown against the baseline, as a fraction')
+    args = parser.parse_args()
+
+    cold, warm = [], []
+    with tempfile.TemporaryDirectory() as workdir:
+        state_file = os.path.join(workdir, 'state.json.gz')
+        for _ in range(args.runs):
+            if os.path.exists(state_file):
+                os.remove(state_file)
+            cold.append(start_once(args, workdir, state_file))
+            warm.append(start_once(args, workdir, state_file))
+
+    results = summarize('cold', cold) + summarize('warm', warm)
+    baseline.report(results)
+    if args.save:
+        baseline.save(SUITE, results)
+        return
+    regressions = baseline.compare(SUITE, results, args.tolerance)
+    if regressions:
+        print('\nRegressions against benchmarks/baseline.json:')
+        for regression in regressions:
+            print(f'  {regression}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+Fake BlueZ
+Serves enough of the org.bluez object tree on a D-Bus bus to drive
+DBusBluetoothManager without Bluetooth hardware: ObjectManager, Adapter1,
+Device1, Battery1 and Properties, with InterfacesAdded, InterfacesRemoved
+and PropertiesChanged signals. Run it on a private session bus and point
+DBusBluetoothManager(bus='SESSION') at the same bus:
+
+    dbus-daemon --session --fork --print-address
+    export DBUS_SESSION_BUS_ADDRESS=<printed address>
+    python3 benchmarks/fake/bluez.py --devices 20
+
+Tests and benchmarks import FakeBlueZ and session_bus() instead.
+"""
+
+import argparse
+import os
+import queue
+import random
+import shutil
+import subprocess
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from jeepney import DBusAddress, HeaderFields, MessageType, message_bus, new_error, new_method_return, new_signal
+from jeepney.io.blocking import open_dbus_connection
+
+
+BLUEZ = 'org.bluez'
+ADAPTER_IFACE = 'org.bluez.Adapter1'
+DEVICE_IFACE = 'org.bluez.Device1'
+BATTERY_IFACE = 'org.bluez.Battery1'
+OBJECT_MANAGER_IFACE = 'org.freedesktop.DBus.ObjectManager'
+PROPERTIES_IFACE = 'org.freedesktop.DBus.Properties'
+
+UNKNOWN_OBJECT = 'org.freedesktop.DBus.Error.UnknownObject'
+UNKNOWN_METHOD = 'org.freedesktop.DBus.Error.UnknownMethod'
+INVALID_ARGS = 'org.freedesktop.DBus.Error.InvalidArgs'
+
+NAMES = [
+    'JBL Flip 5', 'Bose QC35', 'Sony WH-1000XM4', 'Logitech K380', 'MX Master 3',
+    'Echo Dot', 'AirPods Pro', 'Galaxy Buds', 'Mi Band 6', 'UE Boom 3',
+]
+UUIDS = [
+    '0000110b-0000-1000-8000-00805f9b34fb',
+    '0000110c-0000-1000-8000-00805f9b34fb',
+    '0000111e-0000-1000-8000-00805f9b34fb',
+    '0000180f-0000-1000-8000-00805f9b34fb',
+]
+
+
+class BlueZError(Exception):
+    """A D-Bus error reply"""
+
+    def __init__(self, name: str, message: str = ''):
+        super().__init__(f'{name}: {message}')
+        self.name = name
+        self.message = message
+
+
+def device_path(adapter_path: str, mac: str) -> str:
+    return f"{adapter_path}/dev_{mac.replace(':', '_')}"
+
+
+@contextmanager
+def session_bus() -> Iterator[str]:
+    """
+    Run a private dbus-daemon for the duration of the block
+
+    Yields:
+        The bus address, also set as DBUS_SESSION_BUS_ADDRESS
+    """
+    if shutil.which('dbus-daemon') is None:
+        raise RuntimeError('dbus-daemon is not installed')
+    daemon = subprocess.Popen(['dbus-daemon', '--session', '--nofork', '--print-address'],
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    previous = os.environ.get('DBUS_SESSION_BUS_ADDRESS')
+    try:
+        address = daemon.stdout.readline().strip()
+        if not address:
+            raise RuntimeError('dbus-daemon did not print its address')
+        os.environ['DBUS_SESSION_BUS_ADDRESS'] = address
+        yield address
+    finally:
+        if previous is None:
+            os.environ.pop('DBUS_SESSION_BUS_ADDRESS', None)
+        else:
+            os.environ['DBUS_SESSION_BUS_ADDRESS'] = previous
+        daemon.terminate()
+        daemon.wait(timeout=5)
+
+
+class FakeBlueZ:
+    """
+    In-memory org.bluez served from a background thread
+
+    Devices are spread over the adapters in turn. Properties are stored as
+    jeepney (signature, value) variants, exactly as they go over the bus.
+    `calls` counts the method calls received by member name, so callers can
+    check how many round trips an operation took.
+    """
+
+    def __init__(self, bus: str = 'SESSION', adapters: int = 1, devices: int = 8,
+                 paired: Optional[int] = None, failures=(), discovery_rate: float = 5.0,
+                 latency_ms: int = 0, seed: int = 1):
+        """
+        Args:
+            bus: Bus to serve on, normally 'SESSION' (see session_bus)
+            adapters: Number of adapters (hci0, hci1, ...)
+            devices: Number of known devices
+            paired: Known devices that start paired (default: half)
+            failures: Failure modes: page-timeout, auth-failed, not-ready
+            discovery_rate: New devices announced per second while discovering
+            latency_ms: Delay before Pair and Connect reply
+            seed: Seed for generated names, addresses and RSSI values
+        """
+        self.bus = bus
+        self.failures = set(failures)
+        self.discovery_rate = discovery_rate
+        self.latency = latency_ms / 1000
+        self.calls: Counter = Counter()
+        self.objects: Dict[str, Dict[str, Dict[str, tuple]]] = {}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._actions: queue.Queue = queue.Queue()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._next_announce = 0.0
+        self.conn = None
+        self.adapter_paths = [f'/org/bluez/hci{index}' for index in range(max(adapters, 1))]
+        for index, path in enumerate(self.adapter_paths):
+            self.objects[path] = {ADAPTER_IFACE: {
+                'Address': ('s', f'00:1A:7D:DA:71:{index:02X}'),
+                'Name': ('s', f'fake-hci{index}'),
+                'Alias': ('s', f'fake-hci{index}'),
+                'Powered': ('b', True),
+                'Discoverable': ('b', False),
+                'Pairable': ('b', True),
+                'Discovering': ('b', False),
+            }}
+        paired = devices // 2 if paired is None else paired
+        for index in range(devices):
+            self._new_device(self.adapter_paths[index % len(self.adapter_paths)], index < paired)
+
+    # Lifecycle
+
+    def start(self) -> 'FakeBlueZ':
+        """Own org.bluez on the bus and start answering calls"""
+        self.conn = open_dbus_connection(self.bus)
+        reply = self.conn.send_and_get_reply(message_bus.RequestName(BLUEZ))
+        if reply.body[0] != 1:
+            raise RuntimeError(f'Could not own {BLUEZ} (RequestName returned {reply.body[0]})')
+        self._thread = threading.Thread(target=self._serve, name='fake-bluez', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        if self.conn is not None:
+            self.conn.close()
+
+    def __enter__(self) -> 'FakeBlueZ':
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    # State, for tests
+
+    def device_macs(self, paired: Optional[bool] = None) -> List[str]:
+        """Addresses of the known devices, optionally only (un)paired ones"""
+        with self._lock:
+            return [ifaces[DEVICE_IFACE]['Address'][1] for ifaces in self.objects.values()
+                    if DEVICE_IFACE in ifaces
+                    and (paired is None or ifaces[DEVICE_IFACE]['Paired'][1] == paired)]
+
+    def path_of(self, mac: str) -> Optional[str]:
+        with self._lock:
+            for path, ifaces in self.objects.items():
+                if DEVICE_IFACE in ifaces and ifaces[DEVICE_IFACE]['Address'][1] == mac:
+                    return path
+        return None
+
+    def property(self, path: str, interface: str, name: str):
+        with self._lock:
+            return self.objects[path][interface][name][1]
+
+    def change(self, path: str, interface: str, **props: tuple) -> None:
+        """Change properties from outside, as BlueZ would, and signal it"""
+        self._actions.put(lambda: self._set(path, interface, props))
+
+    def add_device(self, adapter_path: Optional[str] = None) -> None:
+        """Announce a new device on an adapter (default: the first)"""
+        self._actions.put(lambda: self._announce(adapter_path or self.adapter_paths[0]))
+
+    # Serving
+
+    def _serve(self) -> None:
+        while not self._stop.is_set():
+            try:
+                msg = self.conn.receive(timeout=0.02)
+            except TimeoutError:
+                msg = None
+            if msg is not None and msg.header.message_type == MessageType.method_call:
+                self._handle(msg)
+            while not self._actions.empty():
+                self._actions.get()()
+            self._discover()
+
+    def _handle(self, msg) -> None:
+        fields = msg.header.fields
+        member = fields.get(HeaderFields.member)
+        self.calls[member] += 1
+        try:
+            signature, body = self._dispatch(fields.get(HeaderFields.path), fields.get(HeaderFields.interface),
+                                             member, msg.body)
+        except BlueZError as e:
+            self.conn.send(new_error(msg, e.name, 's', (e.message,)))
+            return
+        self.conn.send(new_method_return(msg, signature, body))
+
+    def _dispatch(self, path: str, interface: str, member: str, args: tuple):
+        if path == '/' and member == 'GetManagedObjects':
+            with self._lock:
+                return 'a{oa{sa{sv}}}', (self.objects,)
+        if path not in self.objects:
+            raise BlueZError(UNKNOWN_OBJECT, f"No such object path '{path}'")
+        ifaces = self.objects[path]
+        if interface == PROPERTIES_IFACE:
+            name = args[0]
+            if name not in ifaces:
+                raise BlueZError(INVALID_ARGS, f'No such interface {name!r}')
+            if member == 'GetAll':
+                return 'a{sv}', (ifaces[name],)
+            if member == 'Get':
+                if args[1] not in ifaces[name]:
+                    raise BlueZError(INVALID_ARGS, f'No such property {args[1]!r}')
+                return 'v', (ifaces[name][args[1]],)
+            if member == 'Set':
+                self._set(path, name, {args[1]: args[2]})
+                return None, ()
+        elif interface == ADAPTER_IFACE and ADAPTER_IFACE in ifaces:
+            return self._adapter_call(path, member, args)
+        elif interface == DEVICE_IFACE and DEVICE_IFACE in ifaces:
+            return self._device_call(path, member)
+        raise BlueZError(UNKNOWN_METHOD, f'Method {member!r} on {interface!r} does not exist')
+
+    def _adapter_call(self, path: str, member: str, args: tuple):
+        if 'not-ready' in self.failures:
+            raise BlueZError('org.bluez.Error.NotReady', 'Resource Not Ready')
+        if member == 'StartDiscovery':
+            if self.property(path, ADAPTER_IFACE, 'Discovering'):
+                raise BlueZError('org.bluez.Error.InProgress', 'Operation already in progress')
+            self._set(path, ADAPTER_IFACE, {'Discovering': ('b', True)})
+            self._next_announce = time.monotonic()
+            return None, ()
+        if member == 'StopDiscovery':
+            self._set(path, ADAPTER_IFACE, {'Discovering': ('b', False)})
+            return None, ()
+        if member == 'RemoveDevice':
+            (device,) = args
+            if device not in self.objects or not device.startswith(path + '/'):
+                raise BlueZError('org.bluez.Error.DoesNotExist', 'Does Not Exist')
+            with self._lock:
+                removed = self.objects.pop(device)
+            self._signal('/', OBJECT_MANAGER_IFACE, 'InterfacesRemoved', 'oas', (device, list(removed)))
+            return None, ()
+        raise BlueZError(UNKNOWN_METHOD, f'Method {member!r} does not exist')
+
+    def _device_call(self, path: str, member: str):
+        device = self.objects[path][DEVICE_IFACE]
+        if member == 'Pair':
+            time.sleep(self.latency)
+            if device['Paired'][1]:
+                raise BlueZError('org.bluez.Error.AlreadyExists', 'Already Exists')
+            if 'auth-failed' in self.failures:
+                raise BlueZError('org.bluez.Error.AuthenticationFailed', 'Authentication Failed')
+            if 'page-timeout' in self.failures:
+                raise BlueZError('org.bluez.Error.ConnectionAttemptFailed', 'Page Timeout')
+            self._set(path, DEVICE_IFACE, {'Paired': ('b', True), 'Bonded': ('b', True)})
+            return None, ()
+        if member == 'Connect':
+            time.sleep(self.latency)
+            if 'page-timeout' in self.failures:
+                raise BlueZError('org.bluez.Error.Failed', 'br-connection-page-timeout')
+            self._set(path, DEVICE_IFACE, {'Connected': ('b', True)})
+            return None, ()
+        if member == 'Disconnect':
+            if not device['Connected'][1]:
+                raise BlueZError('org.bluez.Error.NotConnected', 'Not Connected')
+            self._set(path, DEVICE_IFACE, {'Connected': ('b', False)})
+            return None, ()
+        raise BlueZError(UNKNOWN_METHOD, f'Method {member!r} does not exist')
+
+    # Changes and signals
+
+    def _signal(self, path: str, interface: str, member: str, signature: str, body: tuple) -> None:
+        self.conn.send(new_signal(DBusAddress(path, interface=interface), member, signature, body))
+
+    def _set(self, path: str, interface: str, props: Dict[str, tuple]) -> None:
+        with self._lock:
+            self.objects[path][interface].update(props)
+        self._signal(path, PROPERTIES_IFACE, 'PropertiesChanged', 'sa{sv}as', (interface, props, []))
+
+    def _new_device(self, adapter_path: str, paired: bool) -> str:
+        rng = self._rng
+        mac = ':'.join(f'{rng.randrange(256):02X}' for _ in range(6))
+        name = f'{rng.choice(NAMES)} {rng.randrange(1000)}'
+        path = device_path(adapter_path, mac)
+        ifaces = {DEVICE_IFACE: {
+            'Address': ('s', mac),
+            'AddressType': ('s', 'public'),
+            'Name': ('s', name),
+            'Alias': ('s', name),
+            'Class': ('u', 0x240404),
+            'Icon': ('s', 'audio-card'),
+            'Paired': ('b', paired),
+            'Bonded': ('b', paired),
+            'Trusted': ('b', paired),
+            'Blocked': ('b', False),
+            'Connected': ('b', False),
+            'RSSI': ('n', -rng.randrange(40, 90)),
+            'UUIDs': ('as', rng.sample(UUIDS, 2)),
+            'Adapter': ('o', adapter_path),
+        }}
+        if len(self.objects) % 3 == 0:
+            ifaces[BATTERY_IFACE] = {'Percentage': ('y', rng.randrange(10, 100))}
+        with self._lock:
+            self.objects[path] = ifaces
+        return path
+
+    def _announce(self, adapter_path: str) -> None:
+        path = self._new_device(adapter_path, False)
+        with self._lock:
+            ifaces = self.objects[path]
+        self._signal('/', OBJECT_MANAGER_IFACE, 'InterfacesAdded', 'oa{sa{sv}}', (path, ifaces))
+
+    def _discover(self) -> None:
+        if self.discovery_rate <= 0 or time.monotonic() < self._next_announce:
+            return
+        for path in self.adapter_paths:
+            if self.property(path, ADAPTER_IFACE, 'Discovering'):
+                self._announce(path)
+                self._next_announce = time.monotonic() + 1 / self.discovery_rate
+                return
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Serve a fake org.bluez on the session bus')
+    parser.add_argument('--adapters', type=int, default=1, help='Number of adapters')
+    parser.add_argument('--devices', type=int, default=8, help='Number of known devices')
+    parser.add_argument('--paired', type=int, default=None, help='Known devices that start paired')
+    parser.add_argument('--failure', default='', help='Comma separated failure modes: '
+                        'page-timeout, auth-failed, not-ready')
+    parser.add_argument('--discovery-rate', type=float, default=5, help='New devices per second while discovering')
+    parser.add_argument('--latency-ms', type=int, default=20, help='Delay before Pair and Connect reply')
+    args = parser.parse_args()
+    failures = [failure.strip() for failure in args.failure.split(',') if failure.strip()]
+    with FakeBlueZ(adapters=args.adapters, devices=args.devices, paired=args.paired, failures=failures,
+                   discovery_rate=args.discovery_rate, latency_ms=args.latency_ms):
+        print(f'Serving {BLUEZ} on {os.environ.get("DBUS_SESSION_BUS_ADDRESS", "the session bus")}', flush=True)
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test
+Starts the add-on against the fake bluetoothctl in benchmarks/fake (or
+targets a running instance with --url) and, for the duration of the test,
+keeps dashboards polling GET /api/devices and WebSocket clients connected to
+/ws/scan while a scan runs and paired devices are connected and disconnected
+in turn. Reports request latency percentiles and error rates, the server's
+event loop lag and how long broadcasts take to reach the WebSocket clients.
+
+Usage:
+    python3 benchmarks/load_test.py [--pollers N] [--websockets N]
+                                    [--duration SECONDS] [--url URL]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import websockets
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, '..')
+
+
+class HttpClient:
+    """Minimal keep-alive HTTP/1.1 client, enough for the JSON API"""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def request(self, method: str, path: str, body: Optional[Dict] = None) -> Tuple[int, bytes]:
+        """Send one request on the kept-alive connection, reconnecting if needed"""
+        try:
+            return await self._request(method, path, body)
+        except (OSError, asyncio.IncompleteReadError, ConnectionError):
+            self.close()
+            raise
+
+    async def _request(self, method: str, path: str, body: Optional[Dict]) -> Tuple[int, bytes]:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        data = json.dumps(body).encode() if body is not None else b''
+        head = f'{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Length: {len(data)}\r\n'
+        if body is not None:
+            head += 'Content-Type: application/json\r\n'
+        self.writer.write(head.encode() + b'\r\n' + data)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError('Connection closed by the server')
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if 'content-length' in headers:
+            content = await self.reader.readexactly(int(headers['content-length']))
+        elif headers.get('transfer-encoding') == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).strip(), 16)
+                chunk = await self.reader.readexactly(size + 2)
+                if not size:
+                    break
+                chunks.append(chunk[:-2])
+            content = b''.join(chunks)
+        else:
+            content = b''
+        if headers.get('connection') == 'close':
+            self.close()
+        return status, content
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class Samples:
+    """Latencies and errors of one kind of request or message"""
+
+    def __init__(self):
+        self.values: List[float] = []
+        self.errors = 0
+
+    def add(self, seconds: float) -> None:
+        self.values.append(seconds)
+
+    def percentile(self, fraction: float) -> float:
+        ordered = sorted(self.values)
+        return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] if ordered else 0.0
+
+    def summary(self) -> Dict:
+        total = len(self.values) + self.errors
+        return {
+            'count': total,
+            'errors': self.errors,
+            'error_rate': self.errors / total if total else 0.0,
+            'p50_ms': self.percentile(0.50) * 1000,
+            'p95_ms': self.percentile(0.95) * 1000,
+            'p99_ms': self.percentile(0.99) * 1000,
+        }
+
+
+class LoadTest:
+    def __init__(self, args: argparse.Namespace, base_url: str):
+        self.args = args
+        url = urlparse(base_url)
+        self.host, self.port = url.hostname, url.port or 80
+        self.ws_url = f'ws://{self.host}:{self.port}/ws/scan'
+        self.polls = Samples()
+        self.operations = Samples()
+        self.operation_events = Samples()
+        self.broadcasts = Samples()
+        self.generator_lag = Samples()
+        self.ws_connected = 0
+        self.ws_dropped = 0
+        self.ws_messages = 0
+        # MAC address -> (when the operation was sent, expected connected value)
+        self.pending: Dict[str, Tuple[float, bool]] = {}
+        self.running = True
+
+    async def poller(self) -> None:
+        client = HttpClient(self.host, self.port)
+        interval = self.args.poll_interval
+        while self.running:
+            started = time.perf_counter()
+            try:
+                status, _ = await client.request('GET', '/api/devices')
+                if status >= 400:
+                    self.polls.errors += 1
+                else:
+                    self.polls.add(time.perf_counter() - started)
+            except Exception:
+                self.polls.errors += 1
+            await asyncio.sleep(max(interval - (time.perf_counter() - started), 0))
+        client.close()
+
+    async def websocket_client(self, ready: asyncio.Event) -> None:
+        try:
+            async with websockets.connect(self.ws_url, max_size=None) as ws:
+                self.ws_connected += 1
+                if self.ws_connected == self.args.websockets:
+                    ready.set()
+                while self.running:
+                    try:
+                        raw = await asyncio.wait_for(ws.recv(), timeout=0.5)
+                    except asyncio.TimeoutError:
+                        continue
+                    self.on_message(json.loads(raw))
+        except Exception:
+            if self.running:
+                self.ws_dropped += 1
+            ready.set()
+
+    def on_message(self, message: Dict) -> None:
+        self.ws_messages += 1
+        if message.get('type') == 'discovered' and 'discovered_at' in message:
+            sent = datetime.fromisoformat(message['discovered_at']).timestamp()
+            self.broadcasts.add(max(time.time() - sent, 0.0))
+        elif message.get('type') == 'delta':
+            for change in message['changes']:
+                pending = self.pending.get(change['mac'])
+                connected = change.get('fields', {}).get('connected')
+                if pending is not None and connected == pending[1]:
+                    self.operation_events.add(time.perf_counter() - pending[0])
+
+    async def operator(self) -> None:
+        """Connect and disconnect paired devices in turn"""
+        client = HttpClient(self.host, self.port)
+        _, body = await client.request('GET', '/api/devices')
+        devices = [device for device in json.loads(body)['devices'] if device['paired']]
+        connected = {device['mac']: device['connected'] for device in devices}
+        index = 0
+        while self.running and devices:
+            mac = devices[index % len(devices)]['mac']
+            index += 1
+            action = 'disconnect' if connected[mac] else 'connect'
+            started = time.perf_counter()
+            self.pending[mac] = (started, not connected[mac])
+            try:
+                status, _ = await client.request('POST', f'/api/devices/{mac}/{action}')
+                if status >= 400:
+                    self.operations.errors += 1
+                else:
+                    self.operations.add(time.perf_counter() - started)
+                    connected[mac] = not connected[mac]
+            except Exception:
+                self.operations.errors += 1
+            await asyncio.sleep(self.args.operation_interval)
+        client.close()
+
+    async def scanner(self) -> None:
+        """Keep a scan running; the add-on stops scans after 60 s"""
+        client = HttpClient(self.host, self.port)
+        while self.running:
+            try:
+                await client.request('POST', '/api/scan/start')
+            except Exception:
+                pass
+            await asyncio.sleep(5)
+        try:
+            await client.request('POST', '/api/scan/stop')
+        except Exception:
+            pass
+        client.close()
+
+    async def watch_own_lag(self) -> None:
+        """The generator's own event loop lag; if high, the results are skewed"""
+        loop = asyncio.get_running_loop()
+        while self.running:
+            started = loop.time()
+            await asyncio.sleep(0.1)
+            self.generator_lag.add(max(loop.time() - started - 0.1, 0.0))
+
+    async def scrape_loop_lag(self) -> Dict[str, float]:
+        """Cumulative event_loop_lag_seconds bucket counts from /metrics"""
+        client = HttpClient(self.host, self.port)
+        _, body = await client.request('GET', '/metrics')
+        client.close()
+        buckets = {}
+        for line in body.decode().splitlines():
+            if line.startswith('event_loop_lag_seconds_bucket'):
+                bound = line.split('le="', 1)[1].split('"', 1)[0]
+                buckets[bound] = float(line.rsplit(' ', 1)[1])
+            elif line.startswith('event_loop_lag_seconds_sum'):
+                buckets['sum'] = float(line.rsplit(' ', 1)[1])
+        return buckets
+
+    async def run(self) -> Dict:
+        before = await self.scrape_loop_lag()
+        ready = asyncio.Event()
+        tasks = [asyncio.create_task(self.websocket_client(ready)) for _ in range(self.args.websockets)]
+        if tasks:
+            await asyncio.wait_for(ready.wait(), timeout=30)
+        tasks += [asyncio.create_task(self.poller()) for _ in range(self.args.pollers)]
+        tasks.append(asyncio.create_task(self.watch_own_lag()))
+        if self.args.scan:
+            tasks.append(asyncio.create_task(self.scanner()))
+        if self.args.operation_interval > 0:
+            tasks.append(asyncio.create_task(self.operator()))
+
+        await asyncio.sleep(self.args.duration)
+        self.running = False
+        await asyncio.gather(*tasks, return_exceptions=True)
+        after = await self.scrape_loop_lag()
+        return self.report(before, after)
+
+    def report(self, before: Dict[str, float], after: Dict[str, float]) -> Dict:
+        bounds = [bound for bound in after if bound != 'sum']
+        counts = [after[bound] - before.get(bound, 0) for bound in bounds]
+        total = counts[-1] if counts else 0
+        lag = {'samples': int(total)}
+        if total:
+            lag['mean_ms'] = (after['sum'] - before.get('sum', 0)) / total * 1000
+            # Upper bound of the bucket each percentile falls in
+            for name, fraction in (('p50', 0.50), ('p95', 0.95), ('p99', 0.99), ('max', 1.0)):
+                bound = next(bound for bound, count in zip(bounds, counts) if count >= total * fraction)
+                lag[f'{name}_le_ms'] = float(bound) * 1000 if bound != '+Inf' else float('inf')
+        return {
+            'config': {key: getattr(self.args, key) for key in
+                       ('pollers', 'poll_interval', 'websockets', 'duration', 'operation_interval', 'scan')},
+            'rest_devices': self.polls.summary(),
+            'device_operations': self.operations.summary(),
+            'operation_to_ws_event': self.operation_events.summary(),
+            'scan_broadcast_delay': self.broadcasts.summary(),
+            'websockets': {'connected': self.ws_connected, 'dropped': self.ws_dropped,
+                           'messages': self.ws_messages},
+            'server_event_loop_lag': lag,
+            'generator_event_loop_lag_p99_ms': self.generator_lag.percentile(0.99) * 1000,
+        }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args: argparse.Namespace, workdir: str) -> Tuple[subprocess.Popen, str]:
+    """Run the add-on on a free port with the fake bluetoothctl"""
+    port = free_port()
+    env = dict(os.environ)
+    env.update({
+        'PATH': os.path.join(HERE, 'fake') + os.pathsep + env['PATH'],
+        'FAKE_BT_STATE': os.path.join(workdir, 'state.json'),
+        'FAKE_BT_DEVICES': str(args.devices),
+        'FAKE_BT_PAIRED': str(args.paired),
+        'FAKE_BT_LATENCY_MS': str(args.latency_ms),
+        'FAKE_BT_DISCOVERY_RATE': str(args.discovery_rate),
+        'WEB_DIR': os.path.join(ROOT, 'web'),
+    })
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'backend', 'app.py'), '--port', str(port),
+         '--log-level', 'warning', '--cache-max-age', str(args.cache_max_age),
+         '--auto-reconnect', 'false'],
+        env=env, stdout=subprocess.DEVNULL if not args.server_log else None,
+        stderr=subprocess.STDOUT if not args.server_log else None,
+    )
+    deadline = time.monotonic() + 20
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            sys.exit('The add-on exited during startup (rerun with --server-log)')
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.2):
+                return server, f'http://127.0.0.1:{port}'
+        except OSError:
+            time.sleep(0.1)
+    server.kill()
+    sys.exit('The add-on did not start listening within 20 s')
+
+
+def print_report(report: Dict) -> None:
+    print(f"Load: {report['config']}")
+    print(f"{'':<24}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for key, label in (('rest_devices', 'GET /api/devices'), ('device_operations', 'connect/disconnect'),
+                       ('operation_to_ws_event', 'operation -> WS delta'),
+                       ('scan_broadcast_delay', 'scan broadcast delay')):
+        row = report[key]
+        print(f"{label:<24}{row['count']:>8}{row['errors']:>8}"
+              f"{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}")
+    ws = report['websockets']
+    print(f"WebSocket clients: {ws['connected']} connected, {ws['dropped']} dropped, {ws['messages']} messages")
+    lag = report['server_event_loop_lag']
+    if lag['samples']:
+        print(f"Server event loop lag: mean {lag['mean_ms']:.1f} ms, p50 <= {lag['p50_le_ms']:g} ms, "
+              f"p95 <= {lag['p95_le_ms']:g} ms, p99 <= {lag['p99_le_ms']:g} ms, max <= {lag['max_le_ms']:g} ms")
+    if report['generator_event_loop_lag_p99_ms'] > 50:
+        print(f"Warning: the load generator itself lagged (p99 {report['generator_event_loop_lag_p99_ms']:.0f} ms); "
+              f"latencies are overstated")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Load test the add-on over HTTP and WebSocket')
+    parser.add_argument('--url', help='Test a running add-on instead of starting one with the fake')
+    parser.add_argument('--pollers', type=int, default=20, help='Clients polling GET /api/devices')
+    parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between polls per client')
+    parser.add_argument('--websockets', type=int, default=50, help='Clients connected to /ws/scan')
+    parser.add_argument('--duration', type=float, default=30.0, help='Seconds to run')
+    parser.add_argument('--operation-interval', type=float, default=2.0,
+                        help='Seconds between connect/disconnect operations (0 disables)')
+    parser.add_argument('--no-scan', dest='scan', action='store_false', help='Do not keep a scan running')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    fake = parser.add_argument_group('simulated backend (without --url)')
+    fake.add_argument('--devices', type=int, default=20, help='Known devices')
+    fake.add_argument('--paired', type=int, default=8, help='Known devices that are paired')
+    fake.add_argument('--latency-ms', type=int, default=50, help='Fake latency of asynchronous BlueZ calls')
+    fake.add_argument('--discovery-rate', type=float, default=5, help='Devices announced per second while scanning')
+    fake.add_argument('--cache-max-age', type=float, default=30, help='The add-on\'s cache_max_age')
+    fake.add_argument('--server-log', action='store_true', help='Show the add-on\'s output')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        server = None
+        if args.url:
+            base_url = args.url.rstrip('/')
+        else:
+            server, base_url = start_server(args, workdir)
+        try:
+            report = asyncio.run(LoadTest(args, base_url).run())
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=10)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""
+Test setup: the backend and the fakes in benchmarks/fake are importable,
+bluetoothctl tests get the fake bluetoothctl with a fresh simulated world, and
+D-Bus tests get a private session bus with a fake org.bluez on it
+"""
+
+import os
+import shutil
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'backend'))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks', 'fake'))
+
+FAKE_BLUETOOTHCTL = os.path.join(ROOT, 'benchmarks', 'fake', 'bluetoothctl')
+
+
+@pytest.fixture
+def fake_bluetoothctl(monkeypatch, tmp_path):
+    """
+    Path of the fake bluetoothctl, simulating 4 known devices (2 paired)
+
+    Tests can change its other FAKE_BT_* settings with monkeypatch.setenv
+    before the first session starts.
+    """
+    monkeypatch.setenv('FAKE_BT_STATE', str(tmp_path / 'fake.json'))
+    monkeypatch.setenv('FAKE_BT_DEVICES', '4')
+    monkeypatch.setenv('FAKE_BT_PAIRED', '2')
+    monkeypatch.setenv('FAKE_BT_LATENCY_MS', '10')
+    monkeypatch.setenv('FAKE_BT_DISCOVERY_RATE', '0')
+    return FAKE_BLUETOOTHCTL
+
+
+@pytest.fixture(scope='session')
+def session_bus():
+    """A private dbus-daemon, used as the session bus by the tests"""
+    pytest.importorskip('jeepney')
+    if shutil.which('dbus-daemon') is None:
+        pytest.skip('dbus-daemon is not installed')
+    from bluez import session_bus as run_session_bus
+    with run_session_bus() as address:
+        yield address
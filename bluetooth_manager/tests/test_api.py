@@ -0,0 +1,99 @@
+"""
+Conditional GETs and ?since deltas of the HTTP API, driven in-process over
+ASGI against the fake bluetoothctl
+"""
+
+import asyncio
+import json
+
+import pytest
+
+
+async def asgi_get(app, path: str, query: str = '', headers=()):
+    """One GET through the ASGI app, returning (status, headers, decoded body)"""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': 'GET', 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+        'query_string': query.encode(), 'root_path': '',
+        'headers': [(b'host', b'test')] + [(k.encode(), v.encode()) for k, v in headers],
+        'client': ('127.0.0.1', 0), 'server': ('test', 80),
+    }
+    response = {'body': b''}
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+            response['headers'] = {k.decode(): v.decode() for k, v in message['headers']}
+        elif message['type'] == 'http.response.body':
+            response['body'] += message.get('body', b'')
+
+    await app(scope, receive, send)
+    body = json.loads(response['body']) if response['body'] else None
+    return response['status'], response['headers'], body
+
+
+@pytest.fixture
+def api(fake_bluetoothctl, monkeypatch):
+    import app as api
+    from bluetooth_manager import BluetoothManager
+    manager = BluetoothManager(binary=fake_bluetoothctl, sessions=2)
+    monkeypatch.setattr(api, 'bt_manager', manager)
+    monkeypatch.setattr(api, 'device_list_body', None)
+    snapshots = []
+    read_snapshot = manager.get_device_snapshot
+    monkeypatch.setattr(manager, 'get_device_snapshot', lambda: snapshots.append(1) or read_snapshot())
+    monkeypatch.setattr(api, 'snapshots', snapshots, raising=False)
+    yield api
+    manager.close()
+
+
+def get(api, path, query='', headers=()):
+    return asyncio.run(asgi_get(api.app, path, query, headers))
+
+
+def test_matching_etag_is_answered_without_bluetooth(api):
+    status, headers, body = get(api, '/api/devices')
+    assert status == 200 and len(body['devices']) == 4
+    assert headers['etag'] == f'"{body["version"]}"'
+    # Even with the cache off, a client holding the current version costs no snapshot
+    api.bt_manager.cache_max_age = 0
+    status, _, body = get(api, '/api/devices', headers=[('if-none-match', headers['etag'])])
+    assert status == 304 and body is None
+    assert len(api.snapshots) == 1
+    status, _, _ = get(api, '/api/devices', headers=[('if-none-match', '"stale.1"')])
+    assert status == 200 and len(api.snapshots) == 2
+
+
+
+def test_change_invalidates_the_etag(api):
+    _, headers, body = get(api, '/api/devices')
+    mac = body['devices'][0]['mac']
+    api.bt_manager._emit_event({'event': 'changed', 'object': 'device', 'mac': mac, 'props': {'rssi': -33}})
+    status, fresh, body = get(api, '/api/devices', headers=[('if-none-match', headers['etag'])])
+    assert status == 200 and fresh['etag'] != headers['etag']
+    assert next(device for device in body['devices'] if device['mac'] == mac)['rssi'] == -33
+
+def test_since_returns_changes_and_removals(api):
+    _, _, body = get(api, '/api/devices')
+    changed, removed = body['devices'][0]['mac'], body['devices'][1]['mac']
+    api.bt_manager._emit_event({'event': 'changed', 'object': 'device', 'mac': changed, 'props': {'rssi': -33}})
+    api.bt_manager._emit_event({'event': 'removed', 'object': 'device', 'mac': removed, 'props': {}})
+    _, _, delta = get(api, '/api/devices', f'since={body["version"]}')
+    assert delta['full'] is False
+    assert [device['mac'] for device in delta['devices']] == [changed]
+    assert delta['devices'][0]['rssi'] == -33
+    assert delta['removed'] == [removed]
+    # The ETag works as a version too
+    _, headers, _ = get(api, '/api/devices')
+    _, _, delta = get(api, '/api/devices', f'since={headers["etag"]}')
+    assert delta == {'version': headers['etag'].strip('"'), 'full': False, 'devices': [], 'removed': []}
+
+
+@pytest.mark.parametrize('since', ['1', '0badf00d.1', 'garbage'])
+def test_version_from_another_process_gets_the_full_list(api, since):
+    get(api, '/api/devices')
+    _, _, body = get(api, '/api/devices', f'since={since}')
+    assert body['full'] is True and len(body['devices']) == 4
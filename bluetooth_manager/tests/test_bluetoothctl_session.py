@@ -0,0 +1,129 @@
+"""
+BluetoothctlPool against the fake bluetoothctl in benchmarks/fake
+"""
+
+import threading
+import time
+
+import pytest
+
+from bluetoothctl_session import TIMEOUT_MESSAGE, BluetoothctlPool
+from parsers import parse_devices
+
+
+@pytest.fixture
+def make_pool(fake_bluetoothctl):
+    pools = []
+
+    def make(**options):
+        pool = BluetoothctlPool(binary=fake_bluetoothctl, **options)
+        pools.append(pool)
+        return pool
+
+    yield make
+    for pool in pools:
+        pool.close()
+
+
+def known_macs(pool):
+    return [device['mac'] for device in parse_devices(pool.run('devices')[1])]
+
+
+def test_commands_leave_the_primary_session_alone(make_pool):
+    pool = make_pool(size=3)
+    assert known_macs(pool)
+    pool.run(f'connect {known_macs(pool)[0]}')
+    assert pool.sessions[0].spawn_count == 0
+    assert pool.run('', pinned=True)[0] == 0
+    assert pool.sessions[0].spawn_count == 1
+
+
+def test_long_running_commands_wait_rather_than_take_the_primary_session(make_pool):
+    pool = make_pool(size=2)
+    mac = known_macs(pool)[0]
+    results = []
+    with pool.session():
+        worker = threading.Thread(target=lambda: results.append(pool.run(f'pair {mac}')))
+        worker.start()
+        time.sleep(0.2)
+        # Quick reads still get the primary session meanwhile
+        assert pool.run('show')[0] == 0
+        assert not results and pool.sessions[0].spawn_count == 1
+    worker.join(5)
+    assert results[0][0] == 0
+
+
+def test_timed_out_primary_session_is_respawned(make_pool, monkeypatch):
+    monkeypatch.setenv('FAKE_BT_LATENCY_MS', '500')
+    restarts, events = [], []
+    pool = make_pool(size=1, on_event=events.append, on_restart=lambda: restarts.append(True))
+    mac = known_macs(pool)[0]
+    assert pool.run(f'connect {mac}', timeout=0.1)[2] == TIMEOUT_MESSAGE
+    # Back before anyone checks the session out again, with the manager told
+    assert pool.sessions[0].is_alive() and restarts == [True]
+    assert pool.sessions[0].spawn_count == 2
+    # and still delivering events
+    assert pool.run(f'trust {mac}')[0] == 0
+    assert any(f'Device {mac} Trusted: yes' in line for line in events)
+
+
+def test_manager_restarts_discovery_after_losing_the_primary_session(fake_bluetoothctl, monkeypatch):
+    from bluetooth_manager import BluetoothManager
+    monkeypatch.setenv('FAKE_BT_LATENCY_MS', '300')
+    manager = BluetoothManager(sessions=1, binary=fake_bluetoothctl)
+    try:
+        assert manager.start_discovery()[0] is True
+        manager.scanning = True
+        mac = known_macs(manager.pool)[0]
+        assert manager.pool.run('scan off', pinned=True)[0] == 0
+        assert manager.pool.run(f'connect {mac}', timeout=0.1)[2] == TIMEOUT_MESSAGE
+        deadline = time.monotonic() + 5
+        while 'Discovering: yes' not in manager.pool.run('show')[1]:
+            assert time.monotonic() < deadline, 'discovery was not restarted'
+            time.sleep(0.05)
+    finally:
+        manager.scanning = False
+        manager.close()
+
+
+def test_batch_output_is_framed(make_pool):
+    pool = make_pool(size=2)
+    macs = known_macs(pool)
+    with pool.session() as session:
+        returncode, stdout, stderr = session.run_batch([f'info {mac}' for mac in macs])
+        assert returncode == 0 and stderr == ''
+        assert [line for line in stdout.splitlines() if line.startswith('Device ')] == [
+            f'Device {mac} (public)' for mac in macs]
+        assert '__sync_' not in stdout and 'Use "help"' not in stdout
+        # Nothing of the batch leaks into the next command's output
+        assert 'Device ' not in session.run('show')[1]
+
+
+def test_asynchronous_results_complete_the_command(make_pool):
+    pool = make_pool(size=2)
+    mac = next(device['mac'] for device in parse_devices(pool.run('devices Paired')[1]))
+    unpaired = next(candidate for candidate in known_macs(pool) if candidate != mac)
+    returncode, stdout, _ = pool.run(f'pair {unpaired}')
+    assert returncode == 0 and 'Pairing successful' in stdout
+    returncode, stdout, _ = pool.run(f'connect {mac}')
+    assert returncode == 0 and 'Connection successful' in stdout
+
+
+def test_failures_are_reported_in_stderr(make_pool, monkeypatch):
+    monkeypatch.setenv('FAKE_BT_FAILURE', 'page-timeout')
+    pool = make_pool(size=2)
+    returncode, _, stderr = pool.run(f'connect {known_macs(pool)[0]}')
+    assert returncode == 1 and 'Failed to connect' in stderr
+    returncode, _, stderr = pool.run('info 00:00:00:00:00:01')
+    assert returncode == 1 and 'not available' in stderr
+
+
+def test_timed_out_session_is_replaced_on_next_use(make_pool, monkeypatch):
+    monkeypatch.setenv('FAKE_BT_LATENCY_MS', '500')
+    pool = make_pool(size=2)
+    mac = known_macs(pool)[0]
+    assert pool.run(f'connect {mac}', timeout=0.1)[2] == TIMEOUT_MESSAGE
+    assert not pool.sessions[1].is_alive()
+    assert pool.run(f'connect {mac}')[0] == 0
+    # The primary session was never needed
+    assert pool.sessions[1].spawn_count == 2 and pool.sessions[0].spawn_count == 0
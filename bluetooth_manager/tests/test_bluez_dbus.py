@@ -0,0 +1,194 @@
+"""
+DBusBluetoothManager against the fake org.bluez in benchmarks/fake/bluez.py,
+served on a private session bus
+"""
+
+import time
+
+import pytest
+
+from bluez import ADAPTER_IFACE, BATTERY_IFACE, DEVICE_IFACE, FakeBlueZ
+
+
+def wait_for(predicate, timeout: float = 2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = predicate()
+        if result:
+            return result
+        time.sleep(0.01)
+    raise AssertionError('condition not met in time')
+
+
+@pytest.fixture
+def fake(session_bus, request):
+    options = getattr(request, 'param', {})
+    with FakeBlueZ(**{'devices': 6, 'paired': 3, 'discovery_rate': 0, **options}) as fake:
+        yield fake
+
+
+@pytest.fixture
+def manager(fake):
+    from bluez_dbus import DBusBluetoothManager
+    manager = DBusBluetoothManager(bus='SESSION', timeout=5)
+    yield manager
+    manager.close()
+
+
+def test_no_bluetoothctl_sessions(manager):
+    manager.warm_up()
+    assert manager.pool is None
+    assert manager._router is not None
+
+
+def test_adapters(manager):
+    adapters = manager.list_adapters()
+    assert adapters == [{'id': '00:1A:7D:DA:71:00', 'name': 'fake-hci0', 'mac': '00:1A:7D:DA:71:00', 'default': True}]
+    info = manager.get_adapter_info()
+    assert info['powered'] is True and info['pairable'] is True and info['discoverable'] is False
+
+
+def test_snapshot_translates_properties(manager, fake):
+    snapshot = {info['mac']: info for info in manager.get_device_snapshot()}
+    assert sorted(snapshot) == sorted(fake.device_macs())
+    for mac, info in snapshot.items():
+        path = fake.path_of(mac)
+        assert info['class'] == '0x00240404'
+        assert info['paired'] is fake.property(path, DEVICE_IFACE, 'Paired')
+        assert info['rssi'] == fake.property(path, DEVICE_IFACE, 'RSSI')
+        assert [uuid['uuid'] for uuid in info['uuids']] == fake.property(path, DEVICE_IFACE, 'UUIDs')
+        assert all(uuid['name'] for uuid in info['uuids'])
+        if BATTERY_IFACE in fake.objects[path]:
+            assert info['battery'] == fake.property(path, BATTERY_IFACE, 'Percentage')
+        else:
+            assert 'battery' not in info
+
+
+def test_device_info(manager, fake):
+    mac = fake.device_macs(paired=True)[0]
+    info = manager.get_device_info(mac)
+    assert info['mac'] == mac and info['paired'] is True and info['trusted'] is True
+    assert 'error' in manager.get_device_info('00:00:00:00:00:01')
+
+
+def test_pair_trust_connect_disconnect_remove(manager, fake):
+    mac = fake.device_macs(paired=False)[0]
+    path = fake.path_of(mac)
+    assert manager.pair_device(mac) == (True, "Device paired successfully")
+    assert fake.property(path, DEVICE_IFACE, 'Paired') is True
+    # BlueZ answers AlreadyExists for a paired device; that is a success
+    assert manager.pair_device(mac)[0] is True
+    assert manager.trust_device(mac)[0] is True
+    assert fake.property(path, DEVICE_IFACE, 'Trusted') is True
+    assert manager.untrust_device(mac)[0] is True
+    assert fake.property(path, DEVICE_IFACE, 'Trusted') is False
+    assert manager.connect_device(mac)[0] is True
+    assert fake.property(path, DEVICE_IFACE, 'Connected') is True
+    assert manager.disconnect_device(mac)[0] is True
+    assert fake.property(path, DEVICE_IFACE, 'Connected') is False
+    assert manager.remove_device(mac) == (True, "Device removed")
+    assert mac not in fake.device_macs()
+    assert manager.remove_device(mac)[0] is False
+
+
+@pytest.mark.parametrize('fake', [{'failures': ['page-timeout', 'auth-failed']}], indirect=True)
+def test_error_messages(manager, fake):
+    mac = fake.device_macs(paired=False)[0]
+    assert manager.pair_device(mac) == (
+        False, "Authentication failed. Try removing and re-pairing the device.")
+    assert manager.connect_device(mac) == (
+        False, "Device not found or not responding. Make sure the device is in pairing mode and nearby.")
+    assert manager.connect_device('00:00:00:00:00:01')[0] is False
+
+
+@pytest.mark.parametrize('fake', [{'failures': ['not-ready']}], indirect=True)
+def test_adapter_not_ready(manager):
+    assert manager.start_discovery() == (
+        False, "Bluetooth adapter not ready. Try powering it off and on again.")
+
+
+def test_discovery(manager, fake):
+    assert manager.start_discovery() == (True, "Discovery started")
+    assert fake.property(fake.adapter_paths[0], ADAPTER_IFACE, 'Discovering') is True
+    assert manager.start_discovery() == (True, "Discovery already running")
+    assert manager.stop_discovery() == (True, "Discovery stopped")
+    assert manager.set_adapter_power(False)[0] is True
+    assert fake.property(fake.adapter_paths[0], ADAPTER_IFACE, 'Powered') is False
+
+
+def test_signals_become_events(manager, fake):
+    events = []
+    manager.add_event_listener(events.append)
+    manager.start_events()
+    mac = next(mac for mac in fake.device_macs(paired=True)
+               if BATTERY_IFACE in fake.objects[fake.path_of(mac)])
+    path = fake.path_of(mac)
+
+    fake.change(path, DEVICE_IFACE, Connected=('b', True), RSSI=('n', -50))
+    event = wait_for(lambda: events and events[-1])
+    assert event == {'event': 'changed', 'object': 'device', 'mac': mac,
+                     'props': {'connected': True, 'rssi': -50}}
+    assert manager.devices.get(mac).connected is True
+
+    fake.change(path, BATTERY_IFACE, Percentage=('y', 42))
+    wait_for(lambda: len(events) == 2)
+    assert events[-1]['props'] == {'battery': 42}
+
+    fake.change(fake.adapter_paths[0], ADAPTER_IFACE, Powered=('b', False))
+    wait_for(lambda: len(events) == 3)
+    assert events[-1] == {'event': 'changed', 'object': 'adapter', 'mac': '00:1A:7D:DA:71:00',
+                          'props': {'powered': False}}
+
+    fake.add_device()
+    wait_for(lambda: len(events) == 4)
+    assert events[-1]['event'] == 'new' and events[-1]['props']['paired'] is False
+    new_mac = events[-1]['mac']
+    assert new_mac in manager.devices
+
+    assert manager.remove_device(new_mac)[0] is True
+    wait_for(lambda: len(events) == 5)
+    assert events[-1] == {'event': 'removed', 'object': 'device', 'mac': new_mac, 'props': {}}
+    assert new_mac not in manager.devices
+
+
+def test_device_operations_skip_managed_objects(manager, fake):
+    manager.list_adapters()
+    mac = fake.device_macs(paired=False)[0]
+    fake.calls.clear()
+    manager.get_device_info(mac)
+    manager.pair_device(mac)
+    manager.trust_device(mac)
+    manager.connect_device(mac)
+    manager.disconnect_device(mac)
+    manager.remove_device(mac)
+    assert fake.calls['GetManagedObjects'] == 0
+    assert fake.calls['GetAll'] == 1
+
+
+@pytest.mark.parametrize('fake', [{'adapters': 2}], indirect=True)
+def test_device_on_second_adapter(manager, fake):
+    mac = next(mac for mac in fake.device_macs() if fake.path_of(mac).startswith('/org/bluez/hci1/'))
+    path = fake.path_of(mac)
+    assert manager.get_device_info(mac)['mac'] == mac
+    assert manager.trust_device(mac)[0] is True
+    assert fake.property(path, DEVICE_IFACE, 'Trusted') is True
+    assert manager.remove_device(mac)[0] is True
+    assert mac not in fake.device_macs()
+    assert manager.get_device_info(mac) == {'error': manager._parse_error(f"Device {mac} not available")}
+
+
+def test_failed_subscription_is_retried(manager, fake, monkeypatch):
+    def unavailable():
+        raise ConnectionError('org.bluez is not running')
+
+    monkeypatch.setattr(manager, 'get_managed_objects', unavailable)
+    with pytest.raises(ConnectionError):
+        manager.start_events()
+    monkeypatch.undo()
+
+    events = []
+    manager.add_event_listener(events.append)
+    manager.start_events()
+    mac = fake.device_macs(paired=True)[0]
+    fake.change(fake.path_of(mac), DEVICE_IFACE, Connected=('b', True))
+    assert wait_for(lambda: events)[0]['mac'] == mac
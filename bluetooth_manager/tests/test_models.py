@@ -0,0 +1,37 @@
+"""
+DeviceRegistry versions, removals and eviction
+"""
+
+from models import DeviceRecord, DeviceRegistry
+
+
+def test_removal_is_reported():
+    registry = DeviceRegistry()
+    registry.put(DeviceRecord(mac='AA:00:00:00:00:01'))
+    version = registry.version
+    registry.discard('AA:00:00:00:00:01')
+    assert registry.removed_since(version) == ['AA:00:00:00:00:01']
+    assert registry.version > version
+
+
+def test_eviction_keeps_paired_devices_and_leaves_no_tombstone():
+    registry = DeviceRegistry(max_size=3)
+    registry.put(DeviceRecord(mac='AA:00:00:00:00:01', paired=True))
+    registry.put(DeviceRecord(mac='AA:00:00:00:00:02', connected=True))
+    registry.put(DeviceRecord(mac='BB:00:00:00:00:01'))
+    version = registry.version
+    registry.put(DeviceRecord(mac='BB:00:00:00:00:02'))
+    registry.put(DeviceRecord(mac='BB:00:00:00:00:03'))
+    assert [record.mac for record in registry] == [
+        'AA:00:00:00:00:01', 'AA:00:00:00:00:02', 'BB:00:00:00:00:03']
+    assert registry.evictions == 2
+    assert registry.removed_since(version) == []
+    assert registry.changed_at('BB:00:00:00:00:01') == 0
+
+
+def test_eviction_falls_back_to_least_recently_used():
+    registry = DeviceRegistry(max_size=2)
+    for index in range(3):
+        registry.put(DeviceRecord(mac=f'AA:00:00:00:00:0{index}', trusted=True))
+    assert 'AA:00:00:00:00:00' not in registry
+    assert len(registry) == 2 and registry.removed_since(0) == []
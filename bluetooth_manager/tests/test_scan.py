@@ -0,0 +1,44 @@
+"""
+Event-driven scanning against the fake bluetoothctl
+"""
+
+import asyncio
+
+from bluetooth_manager import BluetoothManager
+from scheduler import INTERACTIVE
+
+
+def test_scan_announces_devices_while_the_scheduler_is_busy(fake_bluetoothctl, monkeypatch):
+    monkeypatch.setenv('FAKE_BT_DISCOVERY_RATE', '20')
+    manager = BluetoothManager(binary=fake_bluetoothctl, max_parallel=1)
+
+    async def run():
+        messages = []
+        blocker_done = asyncio.Event()
+
+        async def callback(message):
+            messages.append((message, blocker_done.is_set()))
+
+        async def slow_operation():
+            await asyncio.sleep(1.5)
+            blocker_done.set()
+
+        # Holds the only running slot, so every info lookup has to wait
+        blocker = asyncio.ensure_future(
+            manager.scheduler.submit('00:00:00:00:00:01', 'slow', slow_operation, INTERACTIVE))
+        scan = asyncio.ensure_future(manager.start_scan_async(callback))
+        await blocker
+        await asyncio.sleep(0.5)
+        manager.stop_scan()
+        await scan
+        return messages
+
+    try:
+        messages = asyncio.run(run())
+    finally:
+        manager.close()
+    early = [message for message, late in messages if not late and message['type'] == 'discovered']
+    assert early, 'discoveries waited for the scheduler'
+    # The lookups finish after the blocker and fill in the details
+    assert any(late and message['type'] == 'discovered' for message, late in messages)
+    assert not manager.scanning
@@ -0,0 +1,125 @@
+"""
+DeviceScheduler ordering, priorities and coalescing
+"""
+
+import asyncio
+
+from scheduler import BACKGROUND, INTERACTIVE, DeviceScheduler
+
+
+def operation(log, name, result=None, delay=0.01):
+    async def run():
+        log.append(f'{name} start')
+        await asyncio.sleep(delay)
+        log.append(f'{name} end')
+        return result
+    return run
+
+
+def test_same_operation_is_coalesced():
+    scheduler = DeviceScheduler()
+    log = []
+
+    async def run():
+        return await asyncio.gather(
+            scheduler.submit('A', 'info', operation(log, 'info', result=1)),
+            scheduler.submit('A', 'info', operation(log, 'info', result=2)))
+
+    assert asyncio.run(run()) == [1, 1]
+    assert log == ['info start', 'info end']
+    assert scheduler.coalesced == 1 and scheduler.completed == 1
+
+
+def test_operations_on_one_device_run_in_order():
+    scheduler = DeviceScheduler(max_parallel=4)
+    log = []
+
+    async def run():
+        await asyncio.gather(
+            scheduler.submit('A', 'connect', operation(log, 'connect')),
+            scheduler.submit('A', 'remove', operation(log, 'remove')),
+            # Not the latest operation on the device any more, so it runs again
+            scheduler.submit('A', 'connect', operation(log, 'connect again')))
+
+    asyncio.run(run())
+    assert log == ['connect start', 'connect end', 'remove start', 'remove end',
+                   'connect again start', 'connect again end']
+    assert scheduler.coalesced == 0
+
+
+def test_interactive_operations_go_first():
+    scheduler = DeviceScheduler(max_parallel=1)
+    log = []
+
+    async def run():
+        blocker = asyncio.ensure_future(scheduler.submit('A', 'pair', operation(log, 'pair')))
+        await asyncio.sleep(0)
+        background = asyncio.ensure_future(
+            scheduler.submit('B', 'info', operation(log, 'scan lookup'), BACKGROUND))
+        await asyncio.sleep(0)
+        interactive = asyncio.ensure_future(
+            scheduler.submit('C', 'connect', operation(log, 'connect'), INTERACTIVE))
+        await asyncio.gather(blocker, background, interactive)
+
+    asyncio.run(run())
+    assert [entry for entry in log if entry.endswith('start')] == [
+        'pair start', 'connect start', 'scan lookup start']
+
+
+def test_joining_interactive_caller_raises_the_priority():
+    scheduler = DeviceScheduler(max_parallel=1)
+    log = []
+
+    async def run():
+        blocker = asyncio.ensure_future(scheduler.submit('A', 'pair', operation(log, 'pair')))
+        await asyncio.sleep(0)
+        other = asyncio.ensure_future(
+            scheduler.submit('C', 'info', operation(log, 'other lookup'), BACKGROUND))
+        lookup = asyncio.ensure_future(
+            scheduler.submit('B', 'info', operation(log, 'lookup'), BACKGROUND))
+        await asyncio.sleep(0)
+        # A user opens the device's details while the scan lookup is queued
+        joined = asyncio.ensure_future(
+            scheduler.submit('B', 'info', operation(log, 'details'), INTERACTIVE))
+        await asyncio.gather(blocker, other, lookup, joined)
+
+    asyncio.run(run())
+    assert [entry for entry in log if entry.endswith('start')] == [
+        'pair start', 'lookup start', 'other lookup start']
+
+
+def test_failure_reaches_every_caller():
+    scheduler = DeviceScheduler()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError('page timeout')
+
+    async def run():
+        return await asyncio.gather(scheduler.submit('A', 'connect', fail),
+                                    scheduler.submit('A', 'connect', fail),
+                                    return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert scheduler.failed == 1 and not scheduler.busy
+
+
+def test_device_limit():
+    scheduler = DeviceScheduler(max_parallel=2)
+    running, peak = set(), []
+
+    def tracked(mac):
+        async def run():
+            running.add(mac)
+            peak.append(len(running))
+            await asyncio.sleep(0.01)
+            running.discard(mac)
+        return run
+
+    async def run():
+        await asyncio.gather(*(scheduler.submit(mac, 'info', tracked(mac)) for mac in 'ABCDE'))
+
+    asyncio.run(run())
+    assert max(peak) == 2 and scheduler.completed == 5
+
@@ -0,0 +1,63 @@
+"""
+DeviceStateSync deltas for single-device refreshes, on the fake bluetoothctl
+"""
+
+import asyncio
+
+import pytest
+
+from bluetooth_manager import BluetoothManager
+from state_sync import DeviceStateSync
+
+
+class RecordingHub:
+    """Stands in for the WebSocket hub and keeps every broadcast"""
+
+    def __init__(self):
+        self.messages = []
+
+    def broadcast(self, message):
+        self.messages.append(message)
+
+
+@pytest.fixture
+def sync(fake_bluetoothctl):
+    manager = BluetoothManager(binary=fake_bluetoothctl)
+    sync = DeviceStateSync(manager, RecordingHub(), reconcile_interval=3600)
+    asyncio.run(sync.reconcile())
+    yield sync
+    manager.close()
+
+
+def test_refresh_removes_a_device_bluez_no_longer_knows(sync):
+    mac = next(iter(sync.devices))
+
+    async def remove():
+        assert (await sync.manager.remove_device_async(mac))[0] is True
+        await sync.refresh_device(mac)
+
+    asyncio.run(remove())
+    assert sync.hub.messages[-1]['changes'] == [{'mac': mac, 'op': 'remove'}]
+    assert mac not in sync.devices and mac not in sync.manager.devices
+
+
+@pytest.mark.parametrize('error', ['Command timed out', 'bluetoothctl session lost'])
+def test_refresh_keeps_a_device_when_reading_it_fails(sync, monkeypatch, error):
+    mac = next(iter(sync.devices))
+    version, published = sync.version, len(sync.hub.messages)
+    monkeypatch.setattr(sync.manager, 'get_device_info', lambda mac_address: {'error': error})
+    sync.manager.invalidate_cache()
+    asyncio.run(sync.refresh_device(mac))
+    assert sync.version == version and len(sync.hub.messages) == published
+    assert mac in sync.devices and mac in sync.manager.devices
+
+
+def test_refresh_publishes_changed_fields(sync):
+    mac = next(mac for mac, device in sync.devices.items() if not device['connected'])
+
+    async def connect():
+        assert (await sync.manager.connect_device_async(mac))[0] is True
+        await sync.refresh_device(mac)
+
+    asyncio.run(connect())
+    assert sync.hub.messages[-1]['changes'] == [{'mac': mac, 'op': 'upsert', 'fields': {'connected': True}}]
@@ -0,0 +1,52 @@
+"""
+Saving a BluetoothManager's state and restoring it in a new one
+"""
+
+import asyncio
+
+from bluetooth_manager import BluetoothManager
+from warm_start import WarmStart
+
+
+def read_state(manager):
+    async def read():
+        await manager.get_device_records_async()
+        adapters = await manager.list_adapters_async()
+        await manager.get_adapter_info_async()
+        await manager.get_adapter_info_async(adapters[0]['mac'])
+
+    asyncio.run(read())
+
+
+def test_save_and_restore_round_trip(fake_bluetoothctl, tmp_path):
+    path = str(tmp_path / 'state.json.gz')
+    manager = BluetoothManager(binary=fake_bluetoothctl)
+    try:
+        read_state(manager)
+        saved = manager.export_state()
+        warm_start = WarmStart(manager, path)
+        assert warm_start.save() is True
+        # Nothing changed, so there is nothing to write
+        assert warm_start.save() is False
+    finally:
+        manager.close()
+
+    restored = BluetoothManager(binary=fake_bluetoothctl)
+    try:
+        assert WarmStart(restored, path).load() == len(saved['records'])
+        assert restored.export_state() == saved
+        # Served from the restored state without starting bluetoothctl
+        records = asyncio.run(restored.get_device_records_async())
+        assert [record.mac for record in records] == saved['snapshot']
+        assert restored.pool.stats()['spawned'] == 0
+    finally:
+        restored.close()
+
+
+def test_restore_ignores_a_missing_snapshot(fake_bluetoothctl, tmp_path):
+    manager = BluetoothManager(binary=fake_bluetoothctl)
+    try:
+        assert WarmStart(manager, str(tmp_path / 'missing.json.gz')).load() == 0
+        assert manager.export_state()['records'] == []
+    finally:
+        manager.close()
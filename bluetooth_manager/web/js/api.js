@@ -84,6 +84,10 @@ class BluetoothAPI {
         return this.request(`/api/devices/${mac}/pair`, { method: 'POST' });
     }
 
+    async setupDevice(mac) {
+        return this.request(`/api/devices/${mac}/setup`, { method: 'POST' });
+    }
+
     async trustDevice(mac) {
         return this.request(`/api/devices/${mac}/trust`, { method: 'POST' });
     }
@@ -176,6 +180,17 @@ class BluetoothAPI {
         }
     }
 
+    isWebSocketConnected() {
+        return !!this.ws && this.ws.readyState === WebSocket.OPEN;
+    }
+
+    // Ask for a full device snapshot after missing a delta
+    requestSync() {
+        if (this.isWebSocketConnected()) {
+            this.ws.send('sync');
+        }
+    }
+
     // Send ping to keep connection alive
     sendPing() {
         if (this.ws && this.ws.readyState === WebSocket.OPEN) {
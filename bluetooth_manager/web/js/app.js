@@ -21,10 +21,15 @@ class BluetoothManager {
         this.api = new BluetoothAPI(basePath);
         this.pairedDevices = new Map();
         this.discoveredDevices = new Map();
+        // Every known device, kept in sync by WebSocket snapshots and deltas
+        this.devices = new Map();
+        this.syncVersion = null;
+        this.syncRequested = false;
         this.scanning = false;
         this.currentAdapter = null;
         this.currentDeviceMac = null;
-        this.statusCheckInterval = null;
+        // Device being paired by pairAndConnect, for its progress messages
+        this.setupMac = null;
         
         this.init();
     }
@@ -41,16 +46,10 @@ class BluetoothManager {
         // Start ping interval
         setInterval(() => this.api.sendPing(), 30000);
         
-        // Load initial data
+        // Load initial data; after this the WebSocket snapshot and deltas
+        // keep the device lists current, so there is no polling
         await this.loadAdapterInfo();
         await this.loadPairedDevices();
-        
-        // Start periodic status check for paired devices (every 5 seconds)
-        this.statusCheckInterval = setInterval(() => {
-            if (!this.scanning) {
-                this.loadPairedDevices();
-            }
-        }, 5000);
     }
 
     setupEventListeners() {
@@ -249,15 +248,7 @@ class BluetoothManager {
             refreshBtn.disabled = true;
             
             const response = await this.api.getDevices();
-            this.pairedDevices.clear();
-            
-            for (const device of response.devices) {
-                if (device.paired) {
-                    this.pairedDevices.set(device.mac, device);
-                }
-            }
-            
-            this.renderPairedDevices();
+            this.setDevices(response.devices);
         } catch (error) {
             this.showToast('Failed to load devices', 'error');
             console.error('Error loading devices:', error);
@@ -268,25 +259,91 @@ class BluetoothManager {
         }
     }
 
+    // Replace the device lists with a full device list
+    setDevices(devices) {
+        this.devices = new Map(devices.map(device => [device.mac, device]));
+        this.pairedDevices.clear();
+        let discoveredChanged = false;
+        
+        for (const device of devices) {
+            if (device.paired) {
+                this.pairedDevices.set(device.mac, device);
+                discoveredChanged = this.discoveredDevices.delete(device.mac) || discoveredChanged;
+            }
+        }
+        
+        this.renderPairedDevices();
+        if (discoveredChanged) this.renderDiscoveredDevices();
+    }
+
+    // Patch the device lists in place with a delta's changes
+    applyDeviceChanges(changes) {
+        let pairedChanged = false;
+        let discoveredChanged = false;
+        
+        for (const change of changes) {
+            if (change.op === 'remove') {
+                this.devices.delete(change.mac);
+                pairedChanged = this.pairedDevices.delete(change.mac) || pairedChanged;
+                discoveredChanged = this.discoveredDevices.delete(change.mac) || discoveredChanged;
+                continue;
+            }
+            
+            const device = Object.assign(this.devices.get(change.mac) || { mac: change.mac }, change.fields);
+            this.devices.set(change.mac, device);
+            
+            if (device.paired) {
+                this.pairedDevices.set(device.mac, device);
+                pairedChanged = true;
+                discoveredChanged = this.discoveredDevices.delete(device.mac) || discoveredChanged;
+            } else {
+                pairedChanged = this.pairedDevices.delete(device.mac) || pairedChanged;
+                const discovered = this.discoveredDevices.get(device.mac);
+                if (discovered) {
+                    if ('rssi' in change.fields) discovered.rssi = change.fields.rssi;
+                    if ('name' in change.fields) discovered.name = change.fields.name;
+                    discoveredChanged = true;
+                }
+            }
+        }
+        
+        if (pairedChanged) this.renderPairedDevices();
+        if (discoveredChanged) this.renderDiscoveredDevices();
+    }
+
+    // Without a WebSocket no delta will arrive, so fetch the list instead
+    async refreshIfOffline() {
+        if (!this.api.isWebSocketConnected()) {
+            await this.loadPairedDevices();
+        }
+    }
+
     async pairAndConnect(mac) {
         try {
+            this.setupMac = mac;
             this.showLoading('Pairing device...');
             
-            // Pair
-            await this.api.pairDevice(mac);
-            
-            // Trust
-            await this.api.trustDevice(mac);
-            
-            // Connect
-            await this.api.connectDevice(mac);
+            // Pair, trust and connect in one request; the server reports
+            // each step as a setup_progress message
+            const result = await this.api.setupDevice(mac);
             
             // Remove from discovered devices
             this.discoveredDevices.delete(mac);
             this.renderDiscoveredDevices();
             
-            // Reload paired devices to show the newly paired device
-            await this.loadPairedDevices();
+            // The response has the final state, so no list reload is needed
+            // (the WebSocket delta carries the same values)
+            const device = result.device;
+            this.applyDeviceChanges([{
+                mac: device.mac,
+                op: 'upsert',
+                fields: {
+                    name: device.alias || device.name || device.mac,
+                    connected: !!device.connected,
+                    paired: !!device.paired,
+                    rssi: device.rssi ?? null
+                }
+            }]);
             
             // Switch to paired tab to show the result
             this.switchTab('paired');
@@ -295,6 +352,7 @@ class BluetoothManager {
         } catch (error) {
             this.showToast(`Failed to pair: ${error.message}`, 'error');
         } finally {
+            this.setupMac = null;
             this.hideLoading();
         }
     }
@@ -303,7 +361,7 @@ class BluetoothManager {
         try {
             this.showLoading('Connecting...');
             await this.api.connectDevice(mac);
-            await this.loadPairedDevices();
+            await this.refreshIfOffline();
         } catch (error) {
             this.showToast(`Failed to connect: ${error.message}`, 'error');
         } finally {
@@ -315,7 +373,7 @@ class BluetoothManager {
         try {
             this.showLoading('Disconnecting...');
             await this.api.disconnectDevice(mac);
-            await this.loadPairedDevices();
+            await this.refreshIfOffline();
         } catch (error) {
             this.showToast(`Failed to disconnect: ${error.message}`, 'error');
         } finally {
@@ -336,8 +394,8 @@ class BluetoothManager {
                     // Remove from local paired devices map
                     this.pairedDevices.delete(mac);
                     
-                    // Reload paired devices to ensure sync with backend
-                    await this.loadPairedDevices();
+                    // Only needed if the WebSocket is not there to tell us
+                    await this.refreshIfOffline();
                     
                     this.showToast('Device removed', 'success');
                 } catch (error) {
@@ -373,16 +431,46 @@ class BluetoothManager {
         console.log('WebSocket message:', data);
         
         switch (data.type) {
+            case 'snapshot':
+                this.syncVersion = data.version;
+                this.syncRequested = false;
+                this.setDevices(data.devices);
+                break;
+                
+            case 'delta':
+                if (this.syncVersion !== null && data.version <= this.syncVersion) {
+                    break;  // Already part of the snapshot we have
+                }
+                if (this.syncVersion === null || data.version !== this.syncVersion + 1) {
+                    // Missed a delta (or the snapshot): start over from a new one
+                    this.syncVersion = null;
+                    if (!this.syncRequested) {
+                        this.syncRequested = true;
+                        this.api.requestSync();
+                    }
+                    break;
+                }
+                this.syncVersion = data.version;
+                this.applyDeviceChanges(data.changes);
+                break;
+                
             case 'discovered':
                 this.discoveredDevices.set(data.mac, {
                     mac: data.mac,
                     name: data.name,
                     discovered_at: data.discovered_at,
-                    rssi: null
+                    rssi: data.rssi ?? null
                 });
                 this.renderDiscoveredDevices();
                 break;
                 
+            case 'discovered_removed':
+                // Announced before the server knew it is paired already
+                if (this.discoveredDevices.delete(data.mac)) {
+                    this.renderDiscoveredDevices();
+                }
+                break;
+                
             case 'rssi_update':
                 const device = this.discoveredDevices.get(data.mac);
                 if (device) {
@@ -391,24 +479,31 @@ class BluetoothManager {
                 }
                 break;
                 
+            case 'setup_progress':
+                if (data.mac === this.setupMac && data.status === 'running') {
+                    const labels = {
+                        pair: 'Pairing device...',
+                        trust: 'Trusting device...',
+                        connect: 'Connecting...'
+                    };
+                    this.showLoading(labels[data.step] || 'Processing...');
+                }
+                break;
+                
             case 'device_connected':
                 this.showToast(`Connected to ${data.name}`, 'success');
-                this.loadPairedDevices();
                 break;
                 
             case 'device_disconnected':
                 this.showToast('Device disconnected', 'info');
-                this.loadPairedDevices();
                 break;
                 
             case 'device_paired':
                 this.showToast(data.message, 'success');
-                this.loadPairedDevices();
                 break;
                 
             case 'device_removed':
                 this.showToast(data.message, 'success');
-                this.loadPairedDevices();
                 break;
         }
     }
@@ -712,7 +807,7 @@ class BluetoothManager {
             this.showToast('Connected successfully', 'success');
             // Reload device info to update the modal
             await this.showDeviceInfo(this.currentDeviceMac);
-            await this.loadPairedDevices();
+            await this.refreshIfOffline();
         } catch (error) {
             this.showToast(`Failed to connect: ${error.message}`, 'error');
         } finally {
@@ -729,7 +824,7 @@ class BluetoothManager {
             this.showToast('Disconnected successfully', 'success');
             // Reload device info to update the modal
             await this.showDeviceInfo(this.currentDeviceMac);
-            await this.loadPairedDevices();
+            await this.refreshIfOffline();
         } catch (error) {
             this.showToast(`Failed to disconnect: ${error.message}`, 'error');
         } finally {